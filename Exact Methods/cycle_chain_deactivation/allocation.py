@@ -1,3 +1,6 @@
+from instance import Instance
+
+
 class NDD:
     def __init__(self, id, blood, nbEdges, targets, scores):
         self.id = id
@@ -80,8 +83,8 @@ class Allocation:
         self.nbNDDs = 0
         self.idToIdxA = {}
         self.idToIdxP = {}
-        self.comp = []
-        self.scores = []
+        self.instance = None
+        self.scoresDict = {}
         self.info = Info()
         self.isActivated = []
         self.objs = []
@@ -91,18 +94,23 @@ class Allocation:
         self.types = [0] * 6
 
     def load(self, data):
-        self.maxId = 0
-        self.nbPairs = data["num_pairs"]
-        self.nbNDDs = data["num_ndd"]
+        # accept both the parsed instance and its dictionary form (Instance.to_dict)
+        if isinstance(data, dict):
+            data = Instance.from_dict(data)
 
-        # process NDDs and pairs
-        for entry in data["pairs"]:
-            id = entry["id"]
-            is_ndd = entry["is_ndd"]
-            blood_donor = entry["donor_blood_type"]
-            blood_patient = entry["patient_blood_type"]
-            vpra = entry["patient_vpra"]
+        self.instance = data
+        self.maxId = data.max_id
+        self.nbPairs = data.num_pairs
+        self.nbNDDs = data.num_ndd
 
+        # process NDDs and pairs
+        for id, is_ndd, blood_donor, blood_patient, vpra in zip(
+            data.ids.tolist(),
+            data.is_ndd.tolist(),
+            data.donor_blood_type.tolist(),
+            data.patient_blood_type.tolist(),
+            data.patient_vpra.tolist(),
+        ):
             if is_ndd:
                 ndd = NDD(id, blood=blood_donor, nbEdges=0, targets=[], scores=[])
                 self.NDDs.append(ndd)
@@ -127,72 +135,51 @@ class Allocation:
                         len(self.pairs) - 1
                     ]  # store index of new pair in self.pairs
 
-            self.maxId = max(self.maxId, id)
-
-        self.comp = [
-            [-1 for _ in range(self.maxId + 1)] for _ in range(self.maxId + 1)
-        ]  # initialize
-        self.scores = [
-            [-1 for _ in range(self.maxId + 1)] for _ in range(self.maxId + 1)
-        ]  # initialize
-
-        # fill compatibility and score matrices based on arcs
-        for arc in data["arcs"]:
-            donor_id = arc["donor_id"]
-            patient_id = arc["patient_id"]
-            weight = arc["weight"]
-
-            self.comp[donor_id][patient_id] = 1
-            self.scores[donor_id][patient_id] = weight
+        # arc score lookup; a (donor, patient) key is present iff the arc exists
+        offsets = data.offsets.tolist()
+        patient_ids = data.patient_ids.tolist()
+        weights = data.weights.tolist()
+        self.scoresDict = dict(zip(zip(data.donor_ids.tolist(), patient_ids), weights))
+        scores = self.scoresDict
 
         # link targets and scores to pairs and NDDs
         for pair in self.pairs:
-            pair.nbEdges = sum(
-                [1 for arc in data["arcs"] if arc["donor_id"] == pair.source]
-            )
-            pair.targets = [
-                arc["patient_id"]
-                for arc in data["arcs"]
-                if arc["donor_id"] == pair.source
-            ]
-            pair.scores = [
-                arc["weight"] for arc in data["arcs"] if arc["donor_id"] == pair.source
-            ]
+            start, end = offsets[pair.source], offsets[pair.source + 1]
+            pair.nbEdges = end - start
+            pair.targets = patient_ids[start:end]
+            pair.scores = weights[start:end]
 
         for ndd in self.NDDs:
-            ndd.nbEdges = sum([1 for arc in data["arcs"] if arc["donor_id"] == ndd.id])
-            ndd.targets = [
-                arc["patient_id"] for arc in data["arcs"] if arc["donor_id"] == ndd.id
-            ]
-            ndd.scores = [
-                arc["weight"] for arc in data["arcs"] if arc["donor_id"] == ndd.id
-            ]
+            start, end = offsets[ndd.id], offsets[ndd.id + 1]
+            ndd.nbEdges = end - start
+            ndd.targets = patient_ids[start:end]
+            ndd.scores = weights[start:end]
 
         # create cycles
         for i in range(self.maxId + 1):
             if i in self.idToIdxP:
-                hbP = [False] * (self.maxId + 1)
+                hbP = set()
                 for idx in self.idToIdxP[i]:
                     for k, tId in enumerate(self.pairs[idx].targets):
-                        if not hbP[tId]:
-                            if self.comp[tId][i] == 1 and i <= tId:
+                        if tId not in hbP:
+                            if (tId, i) in scores and i <= tId:
                                 cycle = CycleChain(
                                     id=len(self.cyclechains),
                                     size=2,
                                     idX=[i, tId],
                                     nbBA=0,
-                                    score=self.scores[i][tId] + self.scores[tId][i],
+                                    score=scores[(i, tId)] + scores[(tId, i)],
                                 )
                                 self.cyclechains.append(cycle)
                                 self.types[0] += 1
 
-                            hbP[tId] = True
-                            hbP2 = [False] * (self.maxId + 1)
+                            hbP.add(tId)
+                            hbP2 = set()
                             for idx2 in self.idToIdxP.get(tId, []):
                                 for m, tId2 in enumerate(self.pairs[idx2].targets):
                                     if (
-                                        not hbP2[tId2]
-                                        and self.comp[tId2][i] == 1
+                                        tId2 not in hbP2
+                                        and (tId2, i) in scores
                                         and i <= tId
                                         and i <= tId2
                                     ):
@@ -201,19 +188,19 @@ class Allocation:
                                             size=3,
                                             idX=[i, tId, tId2],
                                             nbBA=0,
-                                            score=self.scores[i][tId]
-                                            + self.scores[tId][tId2]
-                                            + self.scores[tId2][i],
+                                            score=scores[(i, tId)]
+                                            + scores[(tId, tId2)]
+                                            + scores[(tId2, i)],
                                         )
-                                        if self.comp[i][tId2] == 1:
+                                        if (i, tId2) in scores:
                                             cycle.nbBA += 1
-                                        if self.comp[tId][i] == 1:
+                                        if (tId, i) in scores:
                                             cycle.nbBA += 1
-                                        if self.comp[tId2][tId] == 1:
+                                        if (tId2, tId) in scores:
                                             cycle.nbBA += 1
                                         self.cyclechains.append(cycle)
                                         self.types[1] += 1
-                                    hbP2[tId2] = True
+                                    hbP2.add(tId2)
                                     # TODO: extend to more than 3 cycles
 
         # create chains (NDDs initiating chains)
@@ -235,57 +222,57 @@ class Allocation:
                     size=2,
                     idX=[ndd.id, tId],
                     nbBA=0,
-                    score=self.scores[ndd.id][tId],
+                    score=scores[(ndd.id, tId)],
                     isChain=1,
                 )
                 self.cyclechains.append(chain2)
                 self.types[3] += 1
-                hbP2 = [False] * (self.maxId + 1)
+                hbP2 = set()
                 for idx2 in self.idToIdxP.get(tId, []):
                     for m, tId2 in enumerate(self.pairs[idx2].targets):
-                        if not hbP2[tId2]:
+                        if tId2 not in hbP2:
                             chain3 = CycleChain(
                                 id=len(self.cyclechains),
                                 size=3,
                                 idX=[ndd.id, tId, tId2],
                                 nbBA=0,
-                                score=self.scores[ndd.id][tId] + self.scores[tId][tId2],
+                                score=scores[(ndd.id, tId)] + scores[(tId, tId2)],
                                 isChain=1,
                             )
-                            if self.comp[ndd.id][tId2] == 1:
+                            if (ndd.id, tId2) in scores:
                                 chain3.nbBA += 1
-                            if self.comp[tId2][tId] == 1:
+                            if (tId2, tId) in scores:
                                 chain3.nbBA += 1
                             self.cyclechains.append(chain3)
                             self.types[4] += 1
-                            hbP3 = [False] * (self.maxId + 1)
+                            hbP3 = set()
                             for idx3 in self.idToIdxP.get(tId2, []):
                                 for o, tId3 in enumerate(self.pairs[idx3].targets):
-                                    if not hbP3[tId3] and tId != tId3:
+                                    if tId3 not in hbP3 and tId != tId3:
                                         chain4 = CycleChain(
                                             id=len(self.cyclechains),
                                             size=4,
                                             idX=[ndd.id, tId, tId2, tId3],
                                             nbBA=0,
-                                            score=self.scores[ndd.id][tId]
-                                            + self.scores[tId][tId2]
-                                            + self.scores[tId2][tId3],
+                                            score=scores[(ndd.id, tId)]
+                                            + scores[(tId, tId2)]
+                                            + scores[(tId2, tId3)],
                                             isChain=1,
                                         )
-                                        if self.comp[ndd.id][tId2] == 1:
+                                        if (ndd.id, tId2) in scores:
                                             chain4.nbBA += 1
-                                        if self.comp[ndd.id][tId3] == 1:
+                                        if (ndd.id, tId3) in scores:
                                             chain4.nbBA += 1
-                                        if self.comp[tId2][tId] == 1:
+                                        if (tId2, tId) in scores:
                                             chain4.nbBA += 1
-                                        if self.comp[tId][tId3] == 1:
+                                        if (tId, tId3) in scores:
                                             chain4.nbBA += 1
-                                        if self.comp[tId3][tId] == 1:
+                                        if (tId3, tId) in scores:
                                             chain4.nbBA += 1
                                         self.cyclechains.append(chain4)
                                         self.types[5] += 1
-                                    hbP3[tId3] = True
-                        hbP2[tId2] = True
+                                    hbP3.add(tId3)
+                        hbP2.add(tId2)
 
     def printProb(self):
         print(f"Instance")
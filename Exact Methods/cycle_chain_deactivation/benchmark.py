@@ -0,0 +1,468 @@
+import sys
+import os
+import time
+import contextlib
+import io
+from itertools import zip_longest
+from instance import Instance, parse_instance, load_instance
+from allocation_generalized import Allocation
+from cycle_chain_deactivation_generalized import (
+    run_cycle_chain_deactivation,
+    lexicographic_solve,
+)
+import numpy as np
+import enumeration
+from enumeration import back_arcs_and_score
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+instance_dir = os.path.join(script_dir, "..", "..", "Instance Files")
+
+# one or two instances of each family, small enough for the old search at k=6
+enumeration_files = [
+    "Delorme_50_NDD_Unit_0.txt",
+    "Delorme_200_NDD_Unit_0.txt",
+    "Saidman_50_NDD_Unit_0.txt",
+    "RandomSparse_50_NoNDD_Unit_0.txt",
+    "RandomSparse_200_NDD_Unit_0.txt",
+]
+
+# larger instances of each family, for the graph reduction
+reduction_files = [
+    "Delorme_500_NDD_Unit_0.txt",
+    "Delorme_1000_NoNDD_Unit_0.txt",
+    "Saidman_200_NDD_Unit_0.txt",
+    "RandomSparse_500_NoNDD_Unit_0.txt",
+]
+
+
+def instance_files(directory):
+    # all instance files, skipping the readme and example (A.*)
+    return sorted(
+        f
+        for f in os.listdir(directory)
+        if f.endswith(".txt") and not f.startswith("A.")
+    )
+
+
+def dict_parse(filepath):
+    # the former import_kidney_data of run.py, which read an instance into
+    # lists of dicts line by line, kept as the reference
+    with open(filepath, "r") as f:
+        lines = f.readlines()
+    num_pairs = int(lines[0].split(" ")[2])
+    num_ndd = int(lines[1].split(" ")[2])
+    num_things = num_pairs + num_ndd
+    pairs = []
+    for line in lines[3 : num_things + 3]:
+        id, is_ndd, donor_blood_type, patient_blood_type, patient_vpra = map(
+            int, line.strip().split(",")
+        )
+        pairs.append(
+            {
+                "id": id,
+                "is_ndd": bool(is_ndd),
+                "donor_blood_type": donor_blood_type,
+                "patient_blood_type": patient_blood_type,
+                "patient_vpra": patient_vpra,
+            }
+        )
+    arcs = []
+    for line in lines[num_things + 3 :]:
+        arc, weight = line.strip().split(",1,")
+        donor_id, patient_id = arc.split(",")
+        arcs.append(
+            {
+                "donor_id": int(donor_id[1:]),
+                "patient_id": int(patient_id[:-1]),
+                "weight": int(weight.strip()),
+            }
+        )
+    return {
+        "num_pairs": num_pairs,
+        "num_ndd": num_ndd,
+        "num_arcs": int(lines[2].split(" ")[2]),
+        "pairs": pairs,
+        "arcs": arcs,
+    }
+
+
+def benchmark_parse(directory):
+    """
+    Compares `dict_parse`, the former parser (list of dicts), against
+    `parse_instance` (arrays) on every instance in `directory` and checks that
+    both give the same instance.
+    """
+    total_old = 0.0
+    total_new = 0.0
+    print(
+        f"{'Instance':<36} {'Arcs':>8} {'Dicts (s)':>10} {'Arrays (s)':>10} {'Speedup':>8}"
+    )
+    for file in instance_files(directory):
+        filepath = os.path.join(directory, file)
+
+        start = time.perf_counter()
+        data = dict_parse(filepath)
+        time_old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        instance = parse_instance(filepath)
+        time_new = time.perf_counter() - start
+
+        # both parsers must agree
+        reference = Instance.from_dict(data)
+        for attr in ["ids", "is_ndd", "donor_ids", "patient_ids", "weights"]:
+            if not (getattr(reference, attr) == getattr(instance, attr)).all():
+                print(f"Mismatch in {attr} for {file}")
+
+        total_old += time_old
+        total_new += time_new
+        print(
+            f"{file:<36} {instance.num_arcs:>8} {time_old:>10.4f} {time_new:>10.4f} {time_old / time_new:>7.1f}x"
+        )
+
+    print(
+        f"{'Total':<36} {'':>8} {total_old:>10.4f} {total_new:>10.4f} {total_old / total_new:>7.1f}x"
+    )
+
+
+def stack_find_cycles(adjacency, scores, starts, max_length):
+    # the former search of Allocation.find_cycles and scoring of add_cycle_chain,
+    # kept as the reference
+    found_cycles = set()
+    for start_node in starts:
+        stack = [(start_node, [start_node], set([start_node]))]
+        while stack:
+            current_node, path, visited = stack.pop()
+            if len(path) > max_length:
+                continue
+            for neighbor in adjacency.get(current_node, []):
+                if neighbor == path[0] and len(path) >= 2:
+                    if all(node >= path[0] for node in path):
+                        cycle_key = tuple(path)
+                        if cycle_key not in found_cycles:
+                            found_cycles.add(cycle_key)
+                            yield (path, *back_arcs_and_score(path, False, scores))
+                elif neighbor not in visited:
+                    visited.add(neighbor)
+                    stack.append((neighbor, path + [neighbor], visited.copy()))
+                    visited.remove(neighbor)
+
+
+def stack_find_chains(adjacency, scores, ndds, max_length):
+    # the former search of Allocation.find_chains and scoring of add_cycle_chain,
+    # kept as the reference
+    for ndd in ndds:
+        if max_length >= 1:
+            yield ([ndd], *back_arcs_and_score([ndd], True, scores))
+        for neighbor in adjacency.get(ndd, []):
+            stack = [(neighbor, [ndd, neighbor], set([neighbor]))]
+            while stack:
+                current_node, path, visited = stack.pop()
+                if len(path) > max_length:
+                    continue
+                yield (path, *back_arcs_and_score(path, True, scores))
+                if len(path) < max_length:
+                    for next_neighbor in adjacency.get(current_node, []):
+                        if next_neighbor not in visited:
+                            visited.add(next_neighbor)
+                            stack.append(
+                                (next_neighbor, path + [next_neighbor], visited.copy())
+                            )
+                            visited.remove(next_neighbor)
+
+
+def benchmark_enumeration(directory, files=None, lengths=range(3, 7)):
+    """
+    Times the former stack-of-copies search, with back arcs and scores computed per
+    cycle/chain afterwards, against the allocation-free search of `enumeration`,
+    which keeps them up to date along the path. Runs for cycles and chains of
+    length k = 3..6 (max_cycle_length = max_chain_length = k) and checks that
+    both yield the same (nodes, nbBA, score) sequence.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'Cycles':>9} {'Chains':>9} {'Stack (s)':>10} {'DFS (s)':>10} {'Speedup':>8}"
+    )
+    for file in files or enumeration_files:
+        allocation = Allocation(max(lengths), max(lengths))
+        allocation.attach(load_instance(os.path.join(directory, file)))
+        starts = list(allocation.idToIdxP)
+        ndds = [ndd.id for ndd in allocation.NDDs]
+        scores = allocation.scoresDict
+
+        for k in lengths:
+
+            def old():
+                return (
+                    stack_find_cycles(allocation.adjacencyDict, scores, starts, k),
+                    stack_find_chains(allocation.adjacencyDict, scores, ndds, k),
+                )
+
+            def new():
+                return (
+                    enumeration.find_cycles(
+                        allocation.adjacencyList,
+                        allocation.predecessorsList,
+                        scores,
+                        starts,
+                        k,
+                    ),
+                    enumeration.find_chains(allocation.adjacencyList, scores, ndds, k),
+                )
+
+            start = time.perf_counter()
+            for paths in old():
+                for _ in paths:
+                    pass
+            time_old = time.perf_counter() - start
+
+            start = time.perf_counter()
+            counts = [0, 0]
+            for j, paths in enumerate(new()):
+                for _ in paths:
+                    counts[j] += 1
+            time_new = time.perf_counter() - start
+
+            # both searches must yield the same cycles and chains in the same order
+            for old_paths, new_paths in zip(old(), new()):
+                for a, b in zip_longest(old_paths, new_paths):
+                    if a != b:
+                        print(f"Mismatch for {file} at k={k}: {a} != {b}")
+                        break
+
+            print(
+                f"{file:<36} {k:>2} {counts[0]:>9} {counts[1]:>9} {time_old:>10.4f} {time_new:>10.4f} {time_old / max(time_new, 1e-9):>7.1f}x",
+                flush=True,
+            )
+
+
+def benchmark_count(directory, files=None, lengths=range(3, 7)):
+    """
+    Times the count-only pass of `Allocation.count` against the enumeration that
+    `Allocation.load` collects, for cycles and chains of length k = 3..6, and
+    checks the counts per size against the enumerated cycles and chains.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'Cycles':>9} {'Chains':>9} {'Enumerate (s)':>14} {'Count (s)':>10} {'Speedup':>8}"
+    )
+    for file in files or enumeration_files:
+        instance = load_instance(os.path.join(directory, file))
+        for k in lengths:
+            allocation = Allocation(k, k)
+            allocation.attach(instance)
+
+            start = time.perf_counter()
+            cycle_counts, chain_counts = allocation.count()
+            time_count = time.perf_counter() - start
+
+            start = time.perf_counter()
+            enumerated = [[0] * (k + 1), [0] * (k + 1)]
+            for batch in allocation.batches():
+                for size, is_chain in zip(batch.size, batch.isChain):
+                    enumerated[is_chain][size] += 1
+            time_enumerate = time.perf_counter() - start
+
+            if enumerated != [cycle_counts, chain_counts]:
+                print(f"Mismatch for {file} at k={k}")
+
+            print(
+                f"{file:<36} {k:>2} {sum(cycle_counts):>9} {sum(chain_counts):>9} {time_enumerate:>14.4f} {time_count:>10.4f} {time_enumerate / max(time_count, 1e-9):>7.1f}x",
+                flush=True,
+            )
+
+
+def benchmark_reduction(directory, files=None, lengths=range(3, 5)):
+    """
+    Times attaching to an instance and enumerating its cycles and chains with
+    and without the graph reduction of `reduction.reduce_arcs`, for cycles and
+    chains of length k = 3..4, and checks that both give the same store.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'Arcs':>8} {'Removed':>8} {'Vertices':>8} {'Full (s)':>10} {'Reduced (s)':>12} {'Speedup':>8}"
+    )
+    for file in files or reduction_files:
+        instance = load_instance(os.path.join(directory, file))
+        for k in lengths:
+            results = []
+            for reduce_graph in (False, True):
+                start = time.perf_counter()
+                allocation = Allocation(k, k, reduce_graph=reduce_graph)
+                allocation.attach(instance)
+                store = allocation.collect(False)
+                store.extend(allocation.collect(True))
+                results.append((store, time.perf_counter() - start))
+            (full, time_full), (reduced, time_reduced) = results
+
+            if not all(
+                np.array_equal(a, b) for a, b in zip(full.columns(), reduced.columns())
+            ):
+                print(f"Mismatch for {file} at k={k}")
+
+            print(
+                f"{file:<36} {k:>2} {instance.num_arcs:>8} {allocation.info.removedArcs:>8} {allocation.info.removedVertices:>8} {time_full:>10.4f} {time_reduced:>12.4f} {time_full / max(time_reduced, 1e-9):>7.1f}x",
+                flush=True,
+            )
+
+
+def benchmark_objectives(directory, files=None, lengths=((3, 4), (4, 4))):
+    """
+    Times the lexicographic optimization with the deactivation loop against the
+    single hierarchical solve, on every instance in `directory` for each
+    (max cycle length, max chain length) in `lengths`, and checks that both
+    reach the same objective values. Times are those of the optimization only
+    (enumeration excluded), with the number of deactivation failures.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'h':>2} {'Fails':>6} {'Deactivation (s)':>17} {'Hierarchical (s)':>17} {'Speedup':>8}"
+    )
+    total = [0.0, 0.0]
+    for file in files or instance_files(directory):
+        for k, h in lengths:
+            results = []
+            for hierarchical in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    allocation = run_cycle_chain_deactivation(
+                        load_instance(os.path.join(directory, file)),
+                        os.devnull,
+                        k,
+                        h,
+                        hierarchical=hierarchical,
+                    )
+                results.append(allocation)
+            deactivation, hierarchical = results
+            if deactivation.objectiveValues != hierarchical.objectiveValues:
+                print(
+                    f"Mismatch for {file} at k={k}, h={h}: {deactivation.objectiveValues} != {hierarchical.objectiveValues}"
+                )
+
+            time_old = deactivation.info.timeCPU[2]
+            time_new = hierarchical.info.timeCPU[2]
+            total[0] += time_old
+            total[1] += time_new
+            print(
+                f"{file:<36} {k:>2} {h:>2} {sum(deactivation.fails):>6} {time_old:>17.4f} {time_new:>17.4f} {time_old / max(time_new, 1e-9):>7.1f}x",
+                flush=True,
+            )
+    print(
+        f"{'Total':<36} {'':>2} {'':>2} {'':>6} {total[0]:>17.4f} {total[1]:>17.4f} {total[0] / max(total[1], 1e-9):>7.1f}x"
+    )
+
+
+def benchmark_backends(
+    directory, files=None, lengths=((3, 3), (4, 4)), backends=("gurobi", "highs")
+):
+    """
+    Times the lexicographic optimization (deactivation loop) with each solver
+    backend of `solvers` on every instance in `directory` for each (max cycle
+    length, max chain length) in `lengths`. The cycles and chains are
+    enumerated once per instance and lengths, so all backends solve the same
+    models, and their objective values are checked to be equal. Times are those
+    of the optimization only, with the number of deactivation failures.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'h':>2} {'Columns':>8} {'Fails':>6}"
+        + "".join(f" {backend + ' (s)':>12}" for backend in backends)
+    )
+    total = [0.0] * len(backends)
+    for file in files or instance_files(directory):
+        for k, h in lengths:
+            allocation = Allocation(k, h)
+            allocation.load(load_instance(os.path.join(directory, file)))
+            values = []
+            times = []
+            for backend in backends:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    start = time.time()
+                    lexicographic_solve(allocation, start, backend=backend)
+                    times.append(time.time() - start)
+                values.append(list(allocation.objectiveValues))
+            if any(value != values[0] for value in values):
+                print(f"Mismatch for {file} at k={k}, h={h}: {values}")
+
+            for i, elapsed in enumerate(times):
+                total[i] += elapsed
+            print(
+                f"{file:<36} {k:>2} {h:>2} {len(allocation.cyclechains):>8} {sum(allocation.fails):>6}"
+                + "".join(f" {elapsed:>12.4f}" for elapsed in times),
+                flush=True,
+            )
+    print(
+        f"{'Total':<36} {'':>2} {'':>2} {'':>8} {'':>6}"
+        + "".join(f" {elapsed:>12.4f}" for elapsed in total)
+    )
+
+
+def benchmark_warm_start(directory, files=None, lengths=((3, 3), (4, 4))):
+    """
+    Times the lexicographic optimization started cold against the one started
+    from the heuristic portfolio solution (`warm_start`), on every instance in
+    `directory` for each (max cycle length, max chain length) in `lengths`, and
+    checks that both reach the same objective values. For each, reports the
+    time to the first ILP solution and to optimality (the optimization time,
+    heuristic included), from the start of the optimization.
+    """
+    print(
+        f"{'Instance':<36} {'k':>2} {'h':>2} {'Cold first (s)':>15} {'Cold total (s)':>15} {'Warm first (s)':>15} {'Warm total (s)':>15}"
+    )
+    total = [0.0, 0.0]
+    for file in files or instance_files(directory):
+        for k, h in lengths:
+            results = []
+            for warm_start in (False, True):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    allocation = run_cycle_chain_deactivation(
+                        load_instance(os.path.join(directory, file)),
+                        os.devnull,
+                        k,
+                        h,
+                        warm_start=warm_start,
+                    )
+                results.append(allocation)
+            cold, warm = results
+            if cold.objectiveValues != warm.objectiveValues:
+                print(
+                    f"Mismatch for {file} at k={k}, h={h}: {cold.objectiveValues} != {warm.objectiveValues}"
+                )
+
+            times = []
+            for allocation in results:
+                first = allocation.info.timeFirstIncumbent
+                times.append(float("nan") if first is None else first)
+                times.append(allocation.info.timeCPU[2])
+            total[0] += times[1]
+            total[1] += times[3]
+            print(
+                f"{file:<36} {k:>2} {h:>2}"
+                + "".join(f" {elapsed:>15.4f}" for elapsed in times),
+                flush=True,
+            )
+    print(
+        f"{'Total':<36} {'':>2} {'':>2} {'':>15} {total[0]:>15.4f} {'':>15} {total[1]:>15.4f}"
+    )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage: python3 benchmark.py parse|enumerate|count|reduce|objectives|backends|warmstart [instance_dir]"
+        )
+        sys.exit(1)
+
+    directory = sys.argv[2] if len(sys.argv) > 2 else instance_dir
+
+    if sys.argv[1] == "parse":
+        benchmark_parse(directory)
+    elif sys.argv[1] == "enumerate":
+        benchmark_enumeration(directory)
+    elif sys.argv[1] == "count":
+        benchmark_count(directory)
+    elif sys.argv[1] == "reduce":
+        benchmark_reduction(directory)
+    elif sys.argv[1] == "objectives":
+        benchmark_objectives(directory)
+    elif sys.argv[1] == "backends":
+        benchmark_backends(directory)
+    elif sys.argv[1] == "warmstart":
+        benchmark_warm_start(directory)
+    else:
+        print(f"Unknown benchmark: {sys.argv[1]}")
+        sys.exit(1)
@@ -0,0 +1,660 @@
+import math
+import time
+import numpy as np
+import gurobipy as gp
+from gurobipy import GRB
+from allocation_generalized import Allocation
+from cycle_chain_deactivation_generalized import EPSILON, TIMEOUT, MAX_ITERATIONS
+import enumeration
+
+# most columns added to the master per pricing round, for cycles and for chains
+COLUMNS_PER_ROUND = 2000
+
+
+def run_column_generation(
+    data, output_file_path, max_cycle_length=3, max_chain_length=4
+):
+    """
+    Solves the instance with the cycle formulation, but generates its cycles and
+    chains on demand instead of enumerating them all. The master starts from
+    the 2-cycles and the cycles and chains of a greedy solution, and grows by
+    pricing: a search for the cycles and chains with a positive reduced cost
+    under the LP duals of the master (`price_cycles`, `price_chains`).
+
+    Each objective of `Allocation.generate_objectives` is optimized like in the
+    deactivation loop: once no column prices out, the LP value z gives the
+    target sol, and the ILP is solved over the columns whose reduced cost is at
+    least sol - z, all of them being generated first. A missed target is
+    loosened by one, which adds the columns within the wider gap. The last
+    objective, whose range can be wide, is solved by one ILP over all columns
+    that can improve on a feasible value instead. The optimal value is fixed in
+    the master by an equality row before the next objective. The selected
+    cycles and chains are written like those of `run_cycle_chain_deactivation`.
+    """
+    start_time = time.time()
+
+    allo = Allocation(max_cycle_length, max_chain_length)
+    allo.attach(data)
+    master = Master(allo)
+    for nodes, nbBA, score, is_chain in initial_columns(allo):
+        master.add_column(nodes, nbBA, score, is_chain)
+    initialization_time = time.time() - start_time
+
+    start_optimization_time = time.time()
+    num_objectives = len(allo.objectives)
+    allo.objectiveValues = [None] * num_objectives
+    allo.fails = [0] * num_objectives
+    allo.objectiveTimes = [0] * num_objectives
+    allo.info.opt = True
+
+    selected_ids = []
+    for i in range(num_objectives):
+        start_objective_time = time.time()
+        value, selected_ids = price_and_branch(allo, master, i, start_optimization_time)
+        if value is None:
+            print(f"Failed to optimize objective {i}.")
+            allo.objectiveValues[i] = -1
+            allo.info.opt = False
+            selected_ids = []
+            break
+        master.fix(i, value)
+        allo.objectiveTimes[i] = time.time() - start_objective_time
+
+    allo.info.nbVar = master.model.NumVars
+    allo.info.nbCons = master.model.NumConstrs
+    allo.info.nbNZ = master.model.NumNZs
+
+    end_time = time.time()
+    allo.info.timeCPU.append(end_time - start_time)
+    allo.info.timeCPU.append(initialization_time)
+    allo.info.timeCPU.append(end_time - start_optimization_time)
+
+    allo.printAndWriteInfo(selected_ids, output_file_path)
+
+
+def column_values(objective, size, nbBA, score, is_chain):
+    # value of cycles or chains (scalars or arrays) in one objective
+    if objective["name"] == "Maximize Total Transplants":
+        return size - is_chain
+    if "size" in objective:
+        return 1 * (size == objective["size"])
+    if objective["name"] == "Maximize Number of Back Arcs":
+        return nbBA
+    return score
+
+
+class Master:
+    """
+    Restricted master LP of the cycle formulation over the cycles and chains
+    generated so far, kept in `allo.cyclechains`.
+
+    The model is built once: one row per vertex, and one equality row per
+    objective whose value was fixed. Columns are added with their coefficients
+    in all rows, and `solve` switches the model between LP and ILP by changing
+    the variable types and bounds only.
+    """
+
+    def __init__(self, allo):
+        self.allo = allo
+        self.model = gp.Model("master")
+        self.model.setParam("OutputFlag", 0)
+        self.vertex_rows = {
+            v: self.model.addConstr(gp.LinExpr() <= 1)
+            for v in allo.instance.ids.tolist()
+        }
+        self.fixed = []  # (objective index, equality row) of the fixed values
+        self.columns = []
+        self.keys = set()
+        self.offsets = {}  # start vertex to resume each pricing search from
+        self.objective = allo.objectives[0]
+
+    def add_column(self, nodes, nbBA, score, is_chain):
+        # add a cycle or chain unless it is in the master already; returns
+        # whether it was added
+        key = (is_chain, tuple(nodes))
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        self.allo.cyclechains.add(nodes, nbBA, score, is_chain)
+
+        size = len(nodes)
+        rows = [self.vertex_rows[v] for v in nodes]
+        coefficients = [1.0] * size
+        for index, row in self.fixed:
+            value = column_values(
+                self.allo.objectives[index], size, nbBA, score, is_chain
+            )
+            if value:
+                rows.append(row)
+                coefficients.append(float(value))
+        self.columns.append(
+            self.model.addVar(
+                lb=0,
+                ub=1,
+                obj=float(column_values(self.objective, size, nbBA, score, is_chain)),
+                column=gp.Column(coefficients, rows),
+            )
+        )
+        return True
+
+    def values(self, objective):
+        # value of every column in an objective, in column order
+        _, _, size, nbBA, score, isChain, _ = self.allo.cyclechains.columns()
+        values = column_values(
+            objective, size.astype(np.int64), nbBA, score, isChain.astype(np.int64)
+        )
+        return values.astype(np.float64).tolist()
+
+    def set_objective(self, index):
+        self.objective = self.allo.objectives[index]
+        self.model.ModelSense = self.objective["sense"]
+        self.model.setAttr("Obj", self.columns, self.values(self.objective))
+
+    def fix(self, index, value):
+        # keep the value of objective `index` in the next objectives
+        row = self.model.addConstr(
+            gp.LinExpr(self.values(self.allo.objectives[index]), self.columns)
+            == value
+        )
+        self.fixed.append((index, row))
+
+    def solve(self, integral=False, active=None, time_limit=TIMEOUT):
+        """
+        Optimizes the master as an LP, or as an ILP over the columns where
+        `active` is set, and returns the Gurobi status.
+        """
+        model = self.model
+        count = len(self.columns)
+        model.setAttr(
+            "VType", self.columns, [GRB.BINARY if integral else GRB.CONTINUOUS] * count
+        )
+        model.setAttr(
+            "UB",
+            self.columns,
+            [1.0] * count if active is None else [float(a) for a in active],
+        )
+        model.setParam("TimeLimit", max(time_limit, 0))
+        model.setParam("MIPGap", 0)
+        model.optimize()
+        return model.Status
+
+    def pricing_weights(self):
+        """
+        Returns (vertex, weights) for the last LP solve, with the reduced cost
+        of a column made positive for improving columns (multiplied by -1 when
+        minimizing). vertex[v] is the dual penalty of vertex v, and weights
+        maps "transplants", "backArcs", "score" and each size to the coefficient
+        of that column value in the reduced cost, from the current objective and
+        the duals of the fixed rows.
+        """
+        sign = 1 if self.objective["sense"] == GRB.MAXIMIZE else -1
+        vertex = np.zeros(self.allo.maxId + 1)
+        ids = list(self.vertex_rows)
+        vertex[ids] = sign * np.asarray(
+            self.model.getAttr("Pi", list(self.vertex_rows.values()))
+        )
+        weights = {"transplants": 0.0, "backArcs": 0.0, "score": 0.0}
+        max_length = max(self.allo.max_cycle_length, self.allo.max_chain_length)
+        for length in range(1, max_length + 1):
+            weights[length] = 0.0
+
+        def add(objective, coefficient):
+            if objective["name"] == "Maximize Total Transplants":
+                weights["transplants"] += coefficient
+            elif "size" in objective:
+                weights[objective["size"]] += coefficient
+            elif objective["name"] == "Maximize Number of Back Arcs":
+                weights["backArcs"] += coefficient
+            else:
+                weights["score"] += coefficient
+
+        add(self.objective, sign)
+        for index, row in self.fixed:
+            add(self.allo.objectives[index], -sign * row.Pi)
+        return vertex, weights
+
+    def gains(self):
+        # reduced costs of the columns after an LP solve, positive if improving
+        sign = 1 if self.objective["sense"] == GRB.MAXIMIZE else -1
+        return sign * np.asarray(self.model.getAttr("RC", self.columns))
+
+
+def initial_columns(allo):
+    """
+    Yields the first columns of the master as (nodes, nbBA, score, is_chain):
+    all 2-cycles, then a greedy solution. The greedy solution takes, from each
+    pair in turn, the first cycle among the pairs not used yet, then walks a
+    chain from each NDD along the highest-weight arc to an unused pair.
+    """
+    instance = allo.instance
+    starts = list(allo.idToIdxP)
+    store = enumeration.short_cycles(
+        instance, starts, min(allo.max_cycle_length, 2), keep=allo.keptArcs
+    )
+    for i in range(len(store)):
+        yield store.idX(i), store.nbBA[i], store.score[i], False
+
+    used = bytearray(allo.maxId + 1)
+    predecessors = [list(p) for p in allo.predecessorsList]
+    successors = allo.adjacencyList
+
+    def use(v):
+        # no cycle search enters a used vertex once it has no predecessors
+        used[v] = 1
+        for t in successors[v]:
+            predecessors[t].remove(v)
+
+    for start in starts:
+        if used[start]:
+            continue
+        for nodes, nbBA, score in enumeration.find_cycles(
+            successors, predecessors, allo.scoresDict, [start], allo.max_cycle_length
+        ):
+            for v in nodes:
+                use(v)
+            yield nodes, nbBA, score, False
+            break
+
+    for ndd in allo.NDDs:
+        nodes = [ndd.id]
+        while len(nodes) < allo.max_chain_length:
+            free = [t for t in successors[nodes[-1]] if not used[t]]
+            if not free:
+                break
+            nodes.append(max(free, key=lambda t: allo.scoresDict[(nodes[-1], t)]))
+            used[nodes[-1]] = 1
+        if len(nodes) > 1:
+            nbBA, score = enumeration.back_arcs_and_score(
+                nodes, True, allo.scoresDict
+            )
+            yield nodes, nbBA, score, True
+
+
+def completion_bounds(max_length, gain, arc_gain, weights, closing):
+    """
+    Returns bound, where bound[m] is the most a path of m vertices can still gain
+    on its way to a cycle or chain of at most `max_length` vertices, besides its
+    back arcs: each further vertex adds at most `gain` and its arc `arc_gain`,
+    a cycle its closing arc, and the size its weight. Back arcs add at most
+    weights["backArcs"] for each of the (L - 1)(L - 2) / 2 they can be in a
+    cycle or chain of L vertices, when that weight is positive.
+    """
+    back_weight = max(weights["backArcs"], 0)
+    bound = [-math.inf] * (max_length + 1)
+    for m in range(1, max_length + 1):
+        for length in range(max(m, 2), max_length + 1):
+            bound[m] = max(
+                bound[m],
+                (length - m) * (gain + arc_gain)
+                + (arc_gain if closing else 0)
+                + weights[length]
+                + back_weight * (length - 1) * (length - 2) // 2,
+            )
+    return bound
+
+
+def price_cycles(allo, vertex, weights, threshold, starts):
+    """
+    Yields (nodes, nbBA, score, gain) for every cycle from `starts` whose reduced
+    cost `gain` under the pricing weights is at least `threshold`, with the
+    depth-first search of `enumeration.find_cycles`.
+
+    The gain of a cycle is the sum of its vertex gains (transplant weight minus
+    dual penalty), arc gains (score weight times arc weight), size weight and
+    back-arc weight times its back arcs. A path is only extended when its gain
+    plus `completion_bounds` can still reach the threshold, using the best
+    vertex gain among the vertices that can return to the start in time.
+    """
+    successors = allo.adjacencyList
+    predecessors = allo.predecessorsList
+    scores = allo.scoresDict
+    max_length = allo.max_cycle_length
+    if max_length < 2:
+        return
+    vertex_gain = (weights["transplants"] - vertex).tolist()
+    arc_gain = weights["score"] * max(scores.values(), default=0)
+    arc_gain = max(arc_gain, weights["score"] * min(scores.values(), default=0))
+    back_weight = weights["backArcs"]
+    back_bound = max(back_weight, 0)
+
+    visited = bytearray(len(successors))
+    distance = [0] * len(successors)
+    path = [0] * max_length
+    cursor = [0] * max_length
+    path_score = [0] * max_length
+    path_back = [0] * max_length
+    path_gain = [0.0] * max_length
+    for start in starts:
+        reached = [start]
+        frontier = [start]
+        for hops in range(1, max_length):
+            next_frontier = []
+            for v in frontier:
+                for u in predecessors[v]:
+                    if u > start and not distance[u]:
+                        distance[u] = hops
+                        next_frontier.append(u)
+            reached += next_frontier
+            frontier = next_frontier
+        if len(reached) > 1:
+            best = max(vertex_gain[v] for v in reached[1:])
+            bound = completion_bounds(max_length, best, arc_gain, weights, True)
+
+            path[0] = start
+            visited[start] = 1
+            cursor[0] = len(successors[start])
+            path_gain[0] = vertex_gain[start]
+            length = 1
+            while length:
+                depth = length - 1
+                targets = successors[path[depth]]
+                budget = max_length - length
+                i = cursor[depth]
+                while i:
+                    i -= 1
+                    node = targets[i]
+                    if 0 < distance[node] <= budget and not visited[node]:
+                        break
+                else:
+                    visited[path[depth]] = 0
+                    length = depth
+                    continue
+                cursor[depth] = i
+
+                back = path_back[depth]
+                for j in range(depth):
+                    if (node, path[j]) in scores:
+                        back += 1
+                arc = scores[(path[depth], node)]
+                gain = (
+                    path_gain[depth]
+                    + vertex_gain[node]
+                    + weights["score"] * arc
+                    + back_weight * (back - path_back[depth])
+                )
+                if gain + bound[length + 1] - back_bound * back < threshold:
+                    continue
+                path_back[length] = back
+                path_score[length] = path_score[depth] + arc
+                path_gain[length] = gain
+                path[length] = node
+                visited[node] = 1
+                length += 1
+
+                if distance[node] == 1:
+                    closing = scores[(node, start)]
+                    total = gain + weights["score"] * closing + weights[length]
+                    if total >= threshold:
+                        yield (
+                            path[:length],
+                            back,
+                            path_score[depth + 1] + closing,
+                            total,
+                        )
+                cursor[length - 1] = (
+                    len(successors[node]) if length < max_length else 0
+                )
+
+        for v in reached:
+            distance[v] = 0
+
+
+def price_chains(allo, vertex, weights, threshold, ndds):
+    """
+    Yields (nodes, nbBA, score, gain) for every chain of at least two vertices
+    from `ndds` whose reduced cost is at least `threshold`, with the search of
+    `enumeration.find_chains` pruned like `price_cycles`. The NDD adds its dual
+    penalty only, and the best vertex gain is taken over all pairs.
+    """
+    successors = allo.adjacencyList
+    scores = allo.scoresDict
+    max_length = allo.max_chain_length
+    if max_length < 2:
+        return
+    vertex_gain = (weights["transplants"] - vertex).tolist()
+    pairs = list(allo.idToIdxP)
+    best = max((vertex_gain[v] for v in pairs), default=0.0)
+    arc_gain = weights["score"] * max(scores.values(), default=0)
+    arc_gain = max(arc_gain, weights["score"] * min(scores.values(), default=0))
+    bound = completion_bounds(max_length, best, arc_gain, weights, False)
+    back_weight = weights["backArcs"]
+    back_bound = max(back_weight, 0)
+
+    visited = bytearray(len(successors))
+    path = [0] * max_length
+    cursor = [0] * max_length
+    path_score = [0] * max_length
+    path_back = [0] * max_length
+    path_gain = [0.0] * max_length
+    for ndd in ndds:
+        path[0] = ndd
+        path_gain[0] = -vertex[ndd]
+        path_back[0] = path_score[0] = 0
+        cursor[0] = len(successors[ndd])
+        length = 1
+        while length:
+            depth = length - 1
+            targets = successors[path[depth]]
+            i = cursor[depth]
+            while i:
+                i -= 1
+                if not visited[targets[i]]:
+                    break
+            else:
+                visited[path[depth]] = 0
+                length = depth
+                continue
+            cursor[depth] = i
+
+            node = targets[i]
+            tail = path[depth]
+            back = path_back[depth]
+            for j in range(depth):
+                if (tail, path[j]) in scores:
+                    back += 1
+            arc = scores[(tail, node)]
+            gain = (
+                path_gain[depth]
+                + vertex_gain[node]
+                + weights["score"] * arc
+                + back_weight * (back - path_back[depth])
+            )
+            if gain + bound[length + 1] - back_bound * back < threshold:
+                continue
+            path_back[length] = back
+            path_score[length] = path_score[depth] + arc
+            path_gain[length] = gain
+            path[length] = node
+            visited[node] = 1
+            length += 1
+
+            total = gain + weights[length]
+            if total >= threshold:
+                yield path[:length], back, path_score[depth + 1], total
+            cursor[length - 1] = len(successors[node]) if length < max_length else 0
+        visited[ndd] = 0
+
+
+def price(master, threshold, limit=None):
+    """
+    Adds to the master the cycles and chains not in it yet whose reduced cost
+    under the duals of the last LP solve is at least `threshold`, at most
+    `limit` of each kind, and returns how many were added. With a limit, the
+    searches resume after the start vertex of the last column found, so that
+    successive rounds cover all start vertices.
+    """
+    allo = master.allo
+    vertex, weights = master.pricing_weights()
+    added = 0
+    for kind, search, starts in (
+        ("cycles", price_cycles, list(allo.idToIdxP)),
+        ("chains", price_chains, [ndd.id for ndd in allo.NDDs]),
+    ):
+        if not starts:
+            continue
+        offset = master.offsets.get(kind, 0) % len(starts)
+        count = 0
+        for nodes, nbBA, score, _ in search(
+            allo, vertex, weights, threshold, starts[offset:] + starts[:offset]
+        ):
+            if master.add_column(nodes, nbBA, score, kind == "chains"):
+                count += 1
+                if count == limit:
+                    master.offsets[kind] = starts.index(nodes[0]) + 1
+                    break
+        added += count
+    return added
+
+
+def generate_columns(master, objective_index, remaining):
+    """
+    Prices columns into the master until its LP is optimal over all cycles and
+    chains, and returns whether every LP solve succeeded. The duals of the last
+    LP solve are then feasible for the LP over all cycles and chains, so the
+    reduced costs under them bound the value of any solution.
+    """
+    objective = master.allo.objectives[objective_index]
+    rounds = 0
+    while True:
+        if master.solve(time_limit=remaining()) != GRB.OPTIMAL:
+            return False
+        added = price(master, EPSILON, COLUMNS_PER_ROUND)
+        print(
+            f"Round {rounds}, Objective {objective_index} ({objective['name']}): "
+            f"LP {master.model.ObjVal:.4f}, {added} columns added, "
+            f"{len(master.columns)} in the master"
+        )
+        rounds += 1
+        if added == 0:
+            return True
+
+
+def price_within(master, gap):
+    """
+    Prices in every column with a reduced cost of at least -gap under the duals
+    of the last LP solve, and returns the columns that have one and the number
+    added: those of the master by their reduced costs under the same duals, as
+    other optimal duals may give other reduced costs, and all new ones.
+    """
+    gains = master.gains()
+    added = price(master, -gap - EPSILON)
+    active = np.concatenate([gains >= -gap - EPSILON, np.ones(added, dtype=bool)])
+    return active, added
+
+
+def price_and_branch(allo, master, objective_index, start_optimization_time):
+    """
+    Optimizes one objective over all cycles and chains and returns its value and
+    the indices of the columns selected by the ILP, or (None, []) on failure.
+
+    Columns are priced into the master until its LP is optimal over all cycles
+    and chains. For the target sol below the LP value z, only columns with a
+    reduced cost of at least sol - z can lie in a solution of value sol; they
+    are all priced in, and the ILP is solved over them. A missed target is
+    loosened by one, as in the deactivation loop, and counted in `allo.fails`.
+
+    The last objective has no target: as in the deactivation loop, it is solved
+    by one ILP over all columns that can improve on the value of the ILP over
+    the master (`final_solve`).
+    """
+    objective = allo.objectives[objective_index]
+    maximize = objective["sense"] == GRB.MAXIMIZE
+    master.set_objective(objective_index)
+
+    def remaining():
+        return TIMEOUT - (time.time() - start_optimization_time)
+
+    # column generation on the LP relaxation
+    if not generate_columns(master, objective_index, remaining):
+        return None, []
+    lp_value = master.model.ObjVal
+    if objective_index == len(allo.objectives) - 1:
+        return final_solve(allo, master, objective_index, lp_value, remaining)
+    if maximize:
+        sol = math.floor(lp_value + EPSILON)
+    else:
+        sol = math.ceil(lp_value - EPSILON)
+
+    for iteration in range(MAX_ITERATIONS):
+        if remaining() <= 0:
+            allo.info.opt = False
+            return None, []
+
+        # every column that can lie in a solution of value sol, then the ILP
+        # over them
+        gap = abs(lp_value - sol)
+        if iteration > 0 and not generate_columns(master, objective_index, remaining):
+            allo.info.opt = False
+            return None, []
+        active, added = price_within(master, gap)
+        status = master.solve(True, active, remaining())
+        print(
+            f"Iteration {iteration}, Objective {objective_index}, Sol = {sol}, "
+            f"{added} columns added, {int(active.sum())} active"
+        )
+
+        model = master.model
+        if status != GRB.INFEASIBLE and model.SolCount > 0:
+            obj_val = record_ilp(allo, master, status)
+            if obj_val == sol:
+                allo.objectiveValues[objective_index] = obj_val
+                return obj_val, selected_columns(master)
+        elif status != GRB.INFEASIBLE:
+            allo.info.opt = False
+            return None, []
+
+        # missed or infeasible target: retry with a looser one
+        allo.fails[objective_index] += 1
+        sol += -1 if maximize else 1
+
+    print(f"Reached maximum iterations for objective {objective_index}")
+    return None, []
+
+
+def final_solve(allo, master, objective_index, lp_value, remaining):
+    """
+    Optimizes the last objective with two ILPs instead of a walk over targets:
+    the ILP over the master gives a feasible value v, every column with a
+    reduced cost of at least v - z (z the LP value) is priced in at once, and
+    the ILP over those columns is optimal, since no solution better than v uses
+    another one.
+    """
+    status = master.solve(True, None, remaining())
+    if master.model.SolCount == 0:
+        allo.info.opt = False
+        return None, []
+    value = record_ilp(allo, master, status)
+    gap = abs(lp_value - value)
+    if gap > EPSILON:
+        if not generate_columns(master, objective_index, remaining):
+            allo.info.opt = False
+            return None, []
+        active, added = price_within(master, gap)
+        status = master.solve(True, active, remaining())
+        print(
+            f"Objective {objective_index}, from {value}: "
+            f"{added} columns added, {int(active.sum())} active"
+        )
+        if master.model.SolCount == 0:
+            allo.info.opt = False
+            return None, []
+        value = record_ilp(allo, master, status)
+    allo.objectiveValues[objective_index] = value
+    return value, selected_columns(master)
+
+
+def record_ilp(allo, master, status):
+    # bounds and optimality of the last ILP solve, and its rounded value
+    model = master.model
+    obj_val = math.ceil(model.ObjVal - EPSILON)
+    allo.info.UB = math.ceil(model.ObjBound - EPSILON)
+    allo.info.LB = obj_val
+    if status != GRB.OPTIMAL:
+        allo.info.opt = False
+    return obj_val
+
+
+def selected_columns(master):
+    # indices of the columns in the last ILP solution
+    values = master.model.getAttr("X", master.columns)
+    return [i for i, x in enumerate(values) if x > EPSILON]
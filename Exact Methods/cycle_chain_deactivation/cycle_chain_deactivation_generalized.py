@@ -1,39 +1,163 @@
+import os
 import time
 import math
-import gurobipy as gp
-from gurobipy import GRB
+from functools import partial
+from multiprocessing import Pool, get_context
+import numpy as np
 from allocation_generalized import Allocation
+from solvers import SOLVERS, MAXIMIZE, INFEASIBLE, INTERRUPTED, gp, GRB
+from warmstart import heuristic_start
 
 EPSILON = 0.001
 TIMEOUT = 14400
 MAX_ITERATIONS = 4000
 
+# speculative target solves: model of a pool worker, set by init_target_worker
+target_worker = {}
+
 
 def run_cycle_chain_deactivation(
-    data, output_file_path, max_cycle_length=3, max_chain_length=4
+    data,
+    output_file_path,
+    max_cycle_length=3,
+    max_chain_length=4,
+    workers=1,
+    decompose=True,
+    hierarchical=False,
+    search="linear",
+    speculative=1,
+    backend="gurobi",
+    warm_start=False,
 ):
+    """
+    Enumerates the cycles and chains of the instance and optimizes the
+    objectives of `Allocation.generate_objectives` lexicographically, with the
+    deactivation loop (`lexicographic_solve`, whose target `search` is "linear"
+    or "bisection", or `speculative` targets at once) or, with `hierarchical`,
+    in one multi-objective solve (`hierarchical_solve`, Gurobi only). The LPs
+    and ILPs of the deactivation loop are solved by the `backend` of
+    `solvers.SOLVERS`. With `warm_start`, the solution of the heuristic
+    portfolio is the MIP start of the first ILPs (`warmstart`); its time counts
+    in the optimization time. Writes the solution to `output_file_path` and
+    returns the allocation.
+    """
     start_time = time.time()
 
-    allo = Allocation(max_cycle_length, max_chain_length)
+    allo = Allocation(max_cycle_length, max_chain_length, workers)
     allo.load(data)
     initialization_time = time.time() - start_time
 
     start_optimization_time = time.time()
+    if warm_start:
+        allo.start = heuristic_start(allo)
+        allo.info.timeHeuristic = time.time() - start_optimization_time
+
+    # cycles and chains that share no vertex are optimized group by group
+    if hierarchical:
+        if backend != "gurobi":
+            raise ValueError("The hierarchical solve requires the gurobi backend")
+        solve = hierarchical_solve
+    else:
+        if speculative > 1 and search == "bisection":
+            raise ValueError("The speculative search replaces the bisection search")
+        solve = partial(
+            lexicographic_solve,
+            search=search,
+            speculative=speculative,
+            backend=backend,
+        )
+    groups = allo.components() if decompose else []
+    if len(groups) > 1:
+        print(f"Solving {len(groups)} independent components")
+        # speculative solves start their own pool, so groups then run in turn
+        selected_ids = solve_components(
+            allo,
+            groups,
+            start_optimization_time,
+            solve,
+            allo.workers if speculative <= 1 else 1,
+        )
+    else:
+        selected_ids = solve(allo, start_optimization_time)
+
+    end_time = time.time()
+    total_optimization_time = end_time - start_optimization_time
+    total_time = end_time - start_time
+
+    # store relevant times
+    allo.info.timeCPU.append(total_time)
+    allo.info.timeCPU.append(initialization_time)
+    allo.info.timeCPU.append(total_optimization_time)
 
+    allo.printAndWriteInfo(selected_ids, output_file_path)
+    return allo
+
+
+def lexicographic_solve(
+    allo, start_optimization_time, search="linear", speculative=1, backend="gurobi"
+):
+    """
+    Optimizes the objectives of `allo` one after the other with the cycle and
+    chain deactivation loop, fixing each optimal value before the next, and
+    returns the indices of the cycles and chains selected by the final ILP.
+
+    With `search` "linear", a missed target is loosened by one and the ILP
+    solved again; with "bisection", targets are chosen by `bisection_search`.
+    With `speculative` > 1, that many targets are solved at once on a process
+    pool by `speculative_search` instead, which loosens them linearly; the
+    bisection search cannot be combined with it.
+    """
     num_objectives = len(allo.objectives)
     allo.isActivated = [1] * len(allo.cyclechains)
     allo.objectiveValues = [None] * num_objectives
     allo.temporaryObjectiveValues = [0] * num_objectives
     allo.fails = [0] * num_objectives
+    allo.objectiveTimes = [0] * num_objectives
+
+    # the pool is started before any Gurobi model exists in this process
+    pool = None
+    if speculative > 1:
+        context = get_context("spawn")
+        cancelled = context.RawArray("b", speculative)
+        threads = max(1, (os.cpu_count() or 1) // speculative)
+        pool = context.Pool(
+            speculative,
+            initializer=init_target_worker,
+            initargs=(
+                allo.cyclechains,
+                allo.maxId,
+                allo.max_cycle_length,
+                allo.max_chain_length,
+                threads,
+                cancelled,
+                backend,
+            ),
+        )
+    cycle_model = CycleModel(allo, backend)
+    cycle_model.incumbent = allo.start
 
     for i in range(num_objectives - 1):
-        cycleLP(allo, start_optimization_time, i)
+        start_objective_time = time.time()
+        cycleLP(allo, cycle_model, start_optimization_time, i)
         current_obj = allo.objectives[i]
-        if current_obj["sense"] == GRB.MAXIMIZE:
+        if current_obj["sense"] == MAXIMIZE:
             sol = math.floor(allo.temporaryObjectiveValues[i] + EPSILON)
         else:
             sol = math.ceil(allo.temporaryObjectiveValues[i] - EPSILON)
 
+        if pool is not None:
+            speculative_search(
+                allo, cycle_model, pool, cancelled, i, sol, start_optimization_time
+            )
+            cycle_model.fix(i, allo.objectiveValues[i])
+            allo.objectiveTimes[i] = time.time() - start_objective_time
+            continue
+        if search == "bisection":
+            bisection_search(allo, cycle_model, i, sol, start_optimization_time)
+            cycle_model.fix(i, allo.objectiveValues[i])
+            allo.objectiveTimes[i] = time.time() - start_objective_time
+            continue
+
         # deactivation loop
         iteration = 0
         while True:
@@ -47,27 +171,10 @@ def run_cycle_chain_deactivation(
             )
 
             # deactivation logic
-            for j in range(len(allo.cyclechains)):
-                if allo.isActivated[j] >= 0:
-                    if current_obj["sense"] == GRB.MAXIMIZE:
-                        if (
-                            allo.temporaryObjectiveValues[i] + allo.RC[j] + EPSILON
-                            < sol
-                        ):
-                            allo.isActivated[j] = 0
-                        else:
-                            allo.isActivated[j] = 1
-                    else:
-                        if (
-                            allo.temporaryObjectiveValues[i] + allo.RC[j] - EPSILON
-                            > sol
-                        ):
-                            allo.isActivated[j] = 0
-                        else:
-                            allo.isActivated[j] = 1
+            activate(allo, i, sol)
 
             # solve the ILP model for the current objective
-            obj_val, _ = cycleILP(allo, start_optimization_time, i)
+            obj_val, _ = cycleILP(allo, cycle_model, start_optimization_time, i)
             print(
                 f"Iteration {iteration}, Objective {i}, Sol = {sol}, ObjVal = {obj_val}"
             )
@@ -78,17 +185,15 @@ def run_cycle_chain_deactivation(
                 break
             elif obj_val == sol:
                 allo.objectiveValues[i] = obj_val
-                # deactivate cycles/chains permanently
-                for j in range(len(allo.cyclechains)):
-                    if allo.isActivated[j] == 0:
-                        allo.isActivated[j] = -1
+                deactivate_permanently(allo)
                 break
             else:
+                # missed or infeasible (None) target: retry with a looser one
                 allo.objectiveValues[i] = sol
                 if time.time() - start_optimization_time < TIMEOUT:
                     allo.fails[i] += 1
                     # adjust sol based on the objective
-                    if current_obj["sense"] == GRB.MAXIMIZE:
+                    if current_obj["sense"] == MAXIMIZE:
                         sol -= 1
                     else:
                         sol += 1
@@ -97,269 +202,585 @@ def run_cycle_chain_deactivation(
                 print(f"Reached maximum iterations for objective {i}")
                 break
 
-    obj_val, selected_cycles_chains = cycleILP(
-        allo, start_optimization_time, num_objectives - 1
+        # keep the value of this objective in the next ones
+        cycle_model.fix(i, allo.objectiveValues[i])
+        allo.objectiveTimes[i] = time.time() - start_objective_time
+
+    if pool is not None:
+        pool.terminate()
+
+    start_objective_time = time.time()
+    obj_val, selected_ids = cycleILP(
+        allo, cycle_model, start_optimization_time, num_objectives - 1
     )
-    if obj_val == -1:
+    allo.objectiveTimes[-1] = time.time() - start_objective_time
+    if obj_val is None or obj_val == -1:
         print("No feasible solution found in the final optimization.")
         allo.info.opt = False
-        selected_cycles_chains = []
-
-    end_time = time.time()
-    total_optimization_time = end_time - start_optimization_time
-    total_time = end_time - start_time
-
-    # store relevant times
-    allo.info.timeCPU.append(total_time)
-    allo.info.timeCPU.append(initialization_time)
-    allo.info.timeCPU.append(total_optimization_time)
+        selected_ids = []
 
-    allo.printAndWriteInfo(selected_cycles_chains, output_file_path)
+    return selected_ids
 
 
-def cycleLP(allo, start_optimization_time, objective_index):
-    try:
-        model = gp.Model("cycleLP")
-
-        isCycleUsed = [None] * len(allo.cyclechains)
-        isPatientUsed = [gp.LinExpr(0) for _ in range(allo.maxId + 1)]
-        isPatientIdUsed = [False] * (allo.maxId + 1)
-
-        # initialize objective functions
-        objFunTransplants = gp.LinExpr(0)
-        objFunBackArcs = gp.LinExpr(0)
-        objFunScore = gp.LinExpr(0)
-        objFunSizeDict = {}
-
-        max_length = max(allo.max_cycle_length, allo.max_chain_length)
-        for length in range(max_length, 1, -1):
-            objFunSizeDict[length] = gp.LinExpr(0)
-
-        # add variables for activated cycles/chains
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1:
-                isCycleUsed[i] = model.addVar(lb=0, ub=1, vtype=GRB.CONTINUOUS)
-
-        # build objective functions and constraints
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1:
-                for j in allo.cyclechains[i].idX:
-                    isPatientUsed[j] += isCycleUsed[i]
-                    isPatientIdUsed[j] = True
-
-                size = len(allo.cyclechains[i].idX)
-
-                if allo.cyclechains[i].isChain:
-                    objFunTransplants += (size - 1) * isCycleUsed[i]
+def activate(allo, objective_index, sol):
+    # activate the cycles and chains that can lie in a solution reaching sol
+    # according to the reduced costs of the last LP, deactivate the others
+    value = allo.temporaryObjectiveValues[objective_index]
+    maximize = allo.objectives[objective_index]["sense"] == MAXIMIZE
+    for j in range(len(allo.cyclechains)):
+        if allo.isActivated[j] >= 0:
+            if maximize:
+                if value + allo.RC[j] + EPSILON < sol:
+                    allo.isActivated[j] = 0
+                else:
+                    allo.isActivated[j] = 1
+            else:
+                if value + allo.RC[j] - EPSILON > sol:
+                    allo.isActivated[j] = 0
                 else:
-                    objFunTransplants += size * isCycleUsed[i]
+                    allo.isActivated[j] = 1
+
+
+def deactivate_permanently(allo):
+    # cycles and chains deactivated for the optimal value stay out from now on
+    for j in range(len(allo.cyclechains)):
+        if allo.isActivated[j] == 0:
+            allo.isActivated[j] = -1
+
+
+def bisection_search(allo, cycle_model, objective_index, sol, start_optimization_time):
+    """
+    Finds the optimal value of an objective below the LP-derived target `sol`
+    with a logarithmic number of ILP solves instead of one per unit.
+
+    The ILP over the columns activated for a target t decides whether t is
+    reachable: every solution of value t or better uses only those columns, so
+    if the ILP reaches t, its value is the optimum. Otherwise the optimum is
+    below t, and its incumbent, a feasible solution, bounds it from the other
+    side. Between the best incumbent and the upper bound the next target is
+    the midpoint; as long as no incumbent is known, the step below the upper
+    bound doubles after each miss. When incumbent and upper bound meet, the
+    incumbent is optimal and no further ILP is needed. Each missed target
+    counts as a failure of the objective.
+    """
+    current_obj = allo.objectives[objective_index]
+    sign = 1 if current_obj["sense"] == MAXIMIZE else -1
+
+    # signed bounds on the optimal value, and the ILP solution reaching lower
+    upper = sign * sol
+    lower = None
+    incumbent = None
+    step = 1
+    for iteration in range(MAX_ITERATIONS):
+        if time.time() - start_optimization_time > TIMEOUT:
+            allo.objectiveValues[objective_index] = -1
+            allo.info.opt = False
+            return
+
+        if lower is not None and lower >= upper:
+            # the best incumbent is optimal
+            value = sign * lower
+            cycle_model.incumbent = incumbent
+            break
+        if lower is None:
+            target = upper - step + 1
+        else:
+            target = (lower + upper + 1) // 2
+
+        print(
+            f"Iteration {iteration}, Objective {objective_index} ({current_obj['name']}) is at {sign * target}"
+        )
+        activate(allo, objective_index, sign * target)
+        obj_val, _ = cycleILP(allo, cycle_model, start_optimization_time, objective_index)
+        print(
+            f"Iteration {iteration}, Objective {objective_index}, Sol = {sign * target}, ObjVal = {obj_val}"
+        )
+
+        if obj_val == -1:
+            print(f"Failed to optimize ILP for objective {objective_index}.")
+            allo.objectiveValues[objective_index] = -1
+            return
+        if obj_val is not None and sign * obj_val >= target:
+            value = obj_val
+            break
+
+        # missed or infeasible (None) target: the optimum lies below it
+        allo.fails[objective_index] += 1
+        upper = target - 1
+        if obj_val is not None and (lower is None or sign * obj_val > lower):
+            lower = sign * obj_val
+            incumbent = cycle_model.incumbent
+        else:
+            step *= 2
+    else:
+        print(f"Reached maximum iterations for objective {objective_index}")
+        allo.objectiveValues[objective_index] = sign * upper
+        return
 
-                if size in objFunSizeDict:
-                    objFunSizeDict[size] += isCycleUsed[i]
+    # deactivate for the optimal value the columns that cannot reach it
+    allo.objectiveValues[objective_index] = value
+    activate(allo, objective_index, value)
+    deactivate_permanently(allo)
 
-                objFunBackArcs += allo.cyclechains[i].nbBA * isCycleUsed[i]
-                objFunScore += allo.cyclechains[i].score * isCycleUsed[i]
 
-        # each patient can be used at most once
-        for i in range(allo.maxId + 1):
-            if isPatientIdUsed[i]:
-                model.addConstr(isPatientUsed[i] <= 1)
-
-        # add constraints for previous objectives
-        for idx in range(objective_index):
-            prev_obj = allo.objectives[idx]
-            if idx == 0:
-                model.addConstr(objFunTransplants == allo.objectiveValues[idx])
-            elif "size" in prev_obj:
-                model.addConstr(
-                    objFunSizeDict[prev_obj["size"]] == allo.objectiveValues[idx]
+def init_target_worker(
+    store, max_id, max_cycle_length, max_chain_length, threads, cancelled, backend
+):
+    # build the cycle model of the store once per worker, on `threads` threads
+    allo = Allocation(max_cycle_length, max_chain_length)
+    allo.cyclechains = store
+    allo.maxId = max_id
+    allo.objectiveValues = [None] * len(allo.objectives)
+    allo.isActivated = np.ones(len(store), dtype=np.int8)
+    cycle_model = CycleModel(allo, backend)
+    cycle_model.solver.set_threads(threads)
+    target_worker.update(allo=allo, cycle_model=cycle_model, cancelled=cancelled)
+
+
+def solve_target(task):
+    """
+    Solves, in a pool worker, the ILP of one objective over the columns of the
+    `active` mask, after fixing the objective values of `fixed` that the
+    worker's model does not hold yet. The solve is interrupted once the main
+    process sets the worker's `slot` in the cancelled flags. Returns (slot,
+    target, objective value, info, incumbent).
+    """
+    slot, objective_index, target, fixed, active, incumbent, start_time = task
+    allo = target_worker["allo"]
+    cycle_model = target_worker["cycle_model"]
+    cancelled = target_worker["cancelled"]
+    for index, value in fixed[len(cycle_model.fixed) :]:
+        cycle_model.fix(index, value)
+    allo.isActivated = active
+    cycle_model.incumbent = incumbent
+
+    def cancel():
+        return cancelled[slot]
+
+    obj_val, _ = cycleILP(allo, cycle_model, start_time, objective_index, cancel)
+    return slot, target, obj_val, allo.info, cycle_model.incumbent
+
+
+def speculative_search(
+    allo, cycle_model, pool, cancelled, objective_index, sol, start_optimization_time
+):
+    """
+    Runs the deactivation loop of one objective with several targets at once:
+    each round solves the ILPs of targets sol, sol - 1, ... (one per worker of
+    `pool`, for a maximized objective) in parallel, each over the columns
+    activated for its target.
+
+    As in `bisection_search`, an ILP that reaches its target gives the optimal
+    value, so the first one to do so is accepted and the others are cancelled.
+    An ILP that misses its target t proves the optimum below t, so the solves
+    of the targets above t are cancelled; its incumbent is a feasible
+    solution. When all targets of a round are missed, the next round starts
+    below the lowest one, unless the best incumbent reaches that level and is
+    thus optimal. Failures count the targets above the optimal value, as the
+    linear loop does.
+    """
+    current_obj = allo.objectives[objective_index]
+    sign = 1 if current_obj["sense"] == MAXIMIZE else -1
+    levels = len(cancelled)
+
+    # signed bound on the optimal value, and the best incumbent found
+    upper = sign * sol
+    lower = None
+    incumbent = None
+    incumbent_info = None
+    value = None
+    for iteration in range(MAX_ITERATIONS):
+        if time.time() - start_optimization_time > TIMEOUT:
+            allo.objectiveValues[objective_index] = -1
+            allo.info.opt = False
+            return
+        if lower is not None and lower >= upper:
+            value = sign * lower
+            adopt_info(allo, incumbent_info)
+            cycle_model.incumbent = incumbent
+            break
+
+        targets = [upper - level for level in range(levels)]
+        if lower is not None:
+            targets = [target for target in targets if target > lower]
+        print(
+            f"Iteration {iteration}, Objective {objective_index} ({current_obj['name']}) is at {[sign * target for target in targets]}"
+        )
+        tasks = []
+        for slot, target in enumerate(targets):
+            cancelled[slot] = 0
+            activate(allo, objective_index, sign * target)
+            tasks.append(
+                (
+                    slot,
+                    objective_index,
+                    target,
+                    cycle_model.fixed,
+                    np.asarray(allo.isActivated, dtype=np.int8),
+                    cycle_model.incumbent,
+                    start_optimization_time,
                 )
-            elif prev_obj["name"] == "Maximize Number of Back Arcs":
-                model.addConstr(objFunBackArcs == allo.objectiveValues[idx])
-            elif prev_obj["name"] == "Maximize Total Score/Weight":
-                model.addConstr(objFunScore == allo.objectiveValues[idx])
-
-        # set the current objective
-        current_objective = allo.objectives[objective_index]
-        if current_objective["name"] == "Maximize Total Transplants":
-            model.setObjective(objFunTransplants, GRB.MAXIMIZE)
-        elif "size" in current_objective:
-            model.setObjective(
-                objFunSizeDict[current_objective["size"]], current_objective["sense"]
             )
-        elif current_objective["name"] == "Maximize Number of Back Arcs":
-            model.setObjective(objFunBackArcs, GRB.MAXIMIZE)
-        elif current_objective["name"] == "Maximize Total Score/Weight":
-            model.setObjective(objFunScore, GRB.MAXIMIZE)
-
-        # setting Gurobi parameters
-        model.setParam("TimeLimit", TIMEOUT - (time.time() - start_optimization_time))
-        model.setParam("MIPGap", 0)
-        model.optimize()
 
-        # store objective value
-        allo.temporaryObjectiveValues[objective_index] = model.ObjVal
-
-        # compute reduced costs
-        allo.RC = [0] * len(allo.cyclechains)
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1:
-                if isCycleUsed[i].X < EPSILON:
-                    allo.RC[i] = isCycleUsed[i].RC
-                else:
-                    allo.RC[i] = 0.0
+        failed = False
+        for slot, target, obj_val, info, solution in pool.imap_unordered(
+            solve_target, tasks
+        ):
+            if cancelled[slot] and (obj_val is None or obj_val == -1):
+                continue
+            if obj_val == -1:
+                failed = True
+            elif obj_val is not None and sign * obj_val >= target:
+                if value is None:
+                    value = obj_val
+                    adopt_info(allo, info)
+                    cycle_model.incumbent = solution
+            else:
+                # missed or infeasible (None) target: the optimum lies below it
+                upper = min(upper, target - 1)
+                if obj_val is not None and (lower is None or sign * obj_val > lower):
+                    lower = sign * obj_val
+                    incumbent = solution
+                    incumbent_info = info
+            for other, other_target in enumerate(targets):
+                if value is not None or failed or other_target > upper:
+                    cancelled[other] = 1
+        print(
+            f"Iteration {iteration}, Objective {objective_index}, Sol = {sign * upper}, ObjVal = {value}"
+        )
+
+        if value is not None:
+            break
+        if failed:
+            print(f"Failed to optimize ILP for objective {objective_index}.")
+            allo.objectiveValues[objective_index] = -1
+            return
+    else:
+        print(f"Reached maximum iterations for objective {objective_index}")
+        allo.objectiveValues[objective_index] = sign * upper
+        return
+
+    # deactivate for the optimal value the columns that cannot reach it
+    allo.fails[objective_index] += abs(sol - value)
+    allo.objectiveValues[objective_index] = value
+    activate(allo, objective_index, value)
+    deactivate_permanently(allo)
+
+
+def adopt_info(allo, info):
+    # solve statistics of a worker's ILP, keeping the earliest first incumbent
+    allo.info.opt = info.opt
+    allo.info.LB = info.LB
+    allo.info.UB = info.UB
+    allo.info.nbVar = info.nbVar
+    allo.info.nbCons = info.nbCons
+    allo.info.nbNZ = info.nbNZ
+    times = [
+        t
+        for t in (allo.info.timeFirstIncumbent, info.timeFirstIncumbent)
+        if t is not None
+    ]
+    allo.info.timeFirstIncumbent = min(times) if times else None
+
+
+def hierarchical_solve(allo, start_optimization_time):
+    """
+    Optimizes the objectives of `allo` in one solve of the ILP over all cycles
+    and chains, with Gurobi's hierarchical multi-objective support: objective i
+    gets priority len(objectives) - i and no allowed degradation, so each pass
+    keeps the optimal values of the passes before it, as `lexicographic_solve`
+    does. Minimized objectives get weight -1 under a maximizing model sense.
+
+    Values and times of the passes are stored like those of the deactivation
+    loop; a pass ends when Gurobi reports it done (MULTIOBJ callback). There is
+    no target to miss, so no failures are counted. Returns the indices of the
+    selected cycles and chains.
+    """
+    num_objectives = len(allo.objectives)
+    allo.isActivated = [1] * len(allo.cyclechains)
+    allo.objectiveValues = [None] * num_objectives
+    allo.fails = [0] * num_objectives
+    allo.objectiveTimes = [0] * num_objectives
+    cycle_model = CycleModel(allo, "gurobi")
+    model = cycle_model.solver.model
+    x = cycle_model.solver.variables
+
+    x.VType = GRB.BINARY
+    if allo.start is not None:
+        x.Start = allo.start
+    model.ModelSense = GRB.MAXIMIZE
+    for i, objective in enumerate(allo.objectives):
+        model.setObjectiveN(
+            cycle_model.objectives[i] @ x,
+            i,
+            priority=num_objectives - i,
+            weight=1 if objective["sense"] == MAXIMIZE else -1,
+            abstol=0,
+            reltol=0,
+            name=objective["name"],
+        )
+    model.setParam("TimeLimit", TIMEOUT - (time.time() - start_optimization_time))
+    model.setParam("MIPGap", 0)
+
+    # time at which each pass ends
+    ends = [time.time()]
+
+    def pass_ends(model, where):
+        if where == GRB.Callback.MIPSOL and allo.info.timeFirstIncumbent is None:
+            allo.info.timeFirstIncumbent = time.time() - start_optimization_time
+        if where == GRB.Callback.MULTIOBJ:
+            while len(ends) <= model.cbGet(GRB.Callback.MULTIOBJ_OBJCNT):
+                ends.append(time.time())
 
+    try:
+        model.optimize(pass_ends)
     except gp.GurobiError as e:
-        print(f"Error code = {e.errno}")
-        print(e.message)
-    except Exception as e:
-        print("Exception during optimization:", e)
+        print(f"Gurobi Error: {e}")
+        allo.info.opt = False
+        return []
+
+    allo.info.nbVar = model.NumVars
+    allo.info.nbCons = model.NumConstrs
+    allo.info.nbNZ = model.NumNZs
+    if model.SolCount < 1:
+        print("No feasible solution found in the hierarchical optimization.")
+        allo.objectiveValues = [-1] * num_objectives
+        allo.info.opt = False
+        return []
+
+    for i in range(num_objectives):
+        model.setParam("ObjNumber", i)
+        allo.objectiveValues[i] = math.ceil(model.ObjNVal - EPSILON)
+        if i + 1 < len(ends):
+            allo.objectiveTimes[i] = ends[i + 1] - ends[i]
+    allo.info.opt = model.Status == GRB.OPTIMAL
+    allo.info.LB = allo.info.UB = allo.objectiveValues[-1]
+    if not allo.info.opt:
+        allo.info.UB = math.ceil(model.ObjBound - EPSILON)
 
+    return np.flatnonzero(x.X > EPSILON).tolist()
 
-def cycleILP(allo, start_optimization_time, objective_index):
-    try:
-        model = gp.Model("cycleILP")
-
-        isCycleUsed = [None] * len(allo.cyclechains)
-        isPatientUsed = [gp.LinExpr(0) for _ in range(allo.maxId + 1)]
-        isPatientIdUsed = [False] * (allo.maxId + 1)
-
-        # initialize objective functions
-        objFunTransplants = gp.LinExpr(0)
-        objFunBackArcs = gp.LinExpr(0)
-        objFunScore = gp.LinExpr(0)
-        objFunSizeDict = {}
-
-        max_length = max(allo.max_cycle_length, allo.max_chain_length)
-        for length in range(max_length, 1, -1):
-            objFunSizeDict[length] = gp.LinExpr(0)
-
-        # add variables for activated cycles/chains
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1:
-                isCycleUsed[i] = model.addVar(lb=0, ub=1, vtype=GRB.BINARY)
-
-        # build objective functions and constraints
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1:
-                for j in allo.cyclechains[i].idX:
-                    isPatientUsed[j] += isCycleUsed[i]
-                    isPatientIdUsed[j] = True
-
-                size = len(allo.cyclechains[i].idX)
-
-                if allo.cyclechains[i].isChain:
-                    objFunTransplants += (size - 1) * isCycleUsed[i]
-                else:
-                    objFunTransplants += size * isCycleUsed[i]
 
-                if size in objFunSizeDict:
-                    objFunSizeDict[size] += isCycleUsed[i]
+def solve_component(task):
+    # lexicographic solve of one group of cycles and chains, in a pool worker
+    (
+        store,
+        max_id,
+        max_cycle_length,
+        max_chain_length,
+        start_optimization_time,
+        solve,
+        start,
+    ) = task
+    allo = Allocation(max_cycle_length, max_chain_length)
+    allo.cyclechains = store
+    allo.maxId = max_id
+    allo.start = start
+    selected_ids = solve(allo, start_optimization_time)
+    return allo.objectiveValues, allo.fails, allo.objectiveTimes, allo.info, selected_ids
 
-                objFunBackArcs += allo.cyclechains[i].nbBA * isCycleUsed[i]
-                objFunScore += allo.cyclechains[i].score * isCycleUsed[i]
 
-        # each patient can be used at most once
-        for i in range(allo.maxId + 1):
-            if isPatientIdUsed[i]:
-                model.addConstr(isPatientUsed[i] <= 1)
-
-        # add constraints for previous objectives
-        total_transplants_constr = None
-        for idx in range(objective_index):
-            prev_obj = allo.objectives[idx]
-            if idx == 0:
-                total_transplants_constr = model.addConstr(
-                    objFunTransplants == allo.objectiveValues[idx]
-                )
-            elif "size" in prev_obj:
-                model.addConstr(
-                    objFunSizeDict[prev_obj["size"]] == allo.objectiveValues[idx]
-                )
-            elif prev_obj["name"] == "Maximize Number of Back Arcs":
-                model.addConstr(objFunBackArcs == allo.objectiveValues[idx])
-            elif prev_obj["name"] == "Maximize Total Score/Weight":
-                model.addConstr(objFunScore == allo.objectiveValues[idx])
-
-        # set the current objective
-        current_objective = allo.objectives[objective_index]
-        if current_objective["name"] == "Maximize Total Transplants":
-            model.setObjective(objFunTransplants, GRB.MAXIMIZE)
-        elif "size" in current_objective:
-            model.setObjective(
-                objFunSizeDict[current_objective["size"]],
-                current_objective["sense"],
-            )
-        elif current_objective["name"] == "Maximize Number of Back Arcs":
-            model.setObjective(objFunBackArcs, GRB.MAXIMIZE)
-        elif current_objective["name"] == "Maximize Total Score/Weight":
-            model.setObjective(objFunScore, GRB.MAXIMIZE)
-
-        # set Gurobi parameters
-        model.setParam("TimeLimit", TIMEOUT - (time.time() - start_optimization_time))
-        model.setParam("MIPGap", 0)
-        model.optimize()
-
-        # check if optimal number of transplants is causing infeasible solution
-        if model.Status == GRB.INFEASIBLE:
-            print(
-                "Model is infeasible. Checking if total transplants constraint is the cause."
+def solve_components(
+    allo, groups, start_optimization_time, solve=None, workers=None
+):
+    """
+    Optimizes each group of `allo.components()` on its own, on a pool of
+    `allo.workers` processes, and merges the results into `allo`. Returns the
+    indices of the selected cycles and chains in `allo.cyclechains`.
+
+    Groups share no vertex and every objective is a sum over the cycles and
+    chains, so the lexicographic optimum of the whole instance is the union of
+    those of the groups, and each objective value is the sum of the group
+    values. An objective that failed (-1) in one group fails for the instance.
+    `solve` optimizes one group (`lexicographic_solve` by default) on a pool of
+    `workers` processes (`allo.workers` by default); objective times are
+    summed over the groups, and the whole instance has its first incumbent
+    once every group has one.
+    """
+    solve = solve or lexicographic_solve
+    workers = workers or allo.workers
+    num_objectives = len(allo.objectives)
+    size = len(allo.cyclechains)
+
+    def tasks():
+        for group in groups:
+            keep = np.zeros(size, dtype=np.bool_)
+            keep[group] = True
+            yield (
+                allo.cyclechains.take(keep),
+                allo.maxId,
+                allo.max_cycle_length,
+                allo.max_chain_length,
+                start_optimization_time,
+                solve,
+                None if allo.start is None else allo.start[group],
             )
-            model.remove(total_transplants_constr)
-            model.update()
-            model.optimize()
 
-            if model.Status == GRB.INFEASIBLE:
-                print("Model is still infeasible without total transplants constraint.")
-                allo.objectiveValues[objective_index] = -1
-                allo.info.opt = False
-                return -1, []
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = list(pool.imap(solve_component, tasks()))
+    else:
+        results = map(solve_component, tasks())
+
+    allo.objectiveValues = [0] * num_objectives
+    allo.fails = [0] * num_objectives
+    allo.objectiveTimes = [0] * num_objectives
+    allo.info.opt = True
+    allo.info.LB = allo.info.UB = 0
+    allo.info.nbVar = allo.info.nbCons = allo.info.nbNZ = 0
+    first_incumbents = []
+    selected_ids = []
+    for group, (objective_values, fails, times, info, ids) in zip(groups, results):
+        for i, value in enumerate(objective_values):
+            if -1 in (allo.objectiveValues[i], value):
+                allo.objectiveValues[i] = -1
+            elif None in (allo.objectiveValues[i], value):
+                allo.objectiveValues[i] = None
             else:
-                print("Infeasibility was due to total transplants constraint.")
-                # Proceed with iterative reduction
-                optimalNumTransplants = allo.objectiveValues[0]
-                iteration = 1
-
-            while True:
-                required_transplants = optimalNumTransplants - iteration
-                if required_transplants < 0:
-                    print(
-                        "No feasible solution found within acceptable number of transplants."
-                    )
-                    allo.objectiveValues[objective_index] = -1
-                    allo.info.opt = False
-                    return -1, []
-
-                total_transplants_constr = model.addConstr(
-                    objFunTransplants == required_transplants
-                )
-                model.update()
-                model.optimize()
+                allo.objectiveValues[i] += value
+            allo.fails[i] += fails[i]
+            allo.objectiveTimes[i] += times[i]
+        allo.info.opt = allo.info.opt and info.opt
+        allo.info.LB += info.LB
+        allo.info.UB += info.UB
+        allo.info.nbVar += info.nbVar
+        allo.info.nbCons += info.nbCons
+        allo.info.nbNZ += info.nbNZ
+        first_incumbents.append(info.timeFirstIncumbent)
+        selected_ids.extend(group[ids].tolist())
+    if first_incumbents and None not in first_incumbents:
+        allo.info.timeFirstIncumbent = max(first_incumbents)
+    return sorted(selected_ids)
+
+
+class CycleModel:
+    """
+    Cycle formulation over all cycles and chains of `allo`, built once per
+    instance and modified in place by the deactivation loop instead of being
+    rebuilt for every LP and ILP.
+
+    The model is loaded in bulk into the solver of `backend` (`solvers`): a
+    variable per column, and the rows of the covered vertices as one sparse
+    constraint matrix (`CycleChainStore.incidence`). Objectives are NumPy
+    vectors over the columns, computed from the store columns. Before each
+    solve, `prepare` sets the upper bound of the columns that are not activated
+    to 0, the variable types (continuous for the LP, binary for the ILP) and the
+    objective; `fix` adds the equality row keeping the value of a finished
+    objective. Solves are warm-started: the LP from the basis of the previous
+    LP, the ILP from the previous incumbent or, before the first one, from the
+    MIP start of the allocation (`Allocation.start`).
+    """
+
+    def __init__(self, allo, backend="gurobi"):
+        self.allo = allo
+        store = allo.cyclechains
 
-                if model.Status != GRB.INFEASIBLE:
-                    allo.objectiveValues[0] = required_transplants
-                    break
-                else:
-                    model.remove(total_transplants_constr)
-                    model.update()
-                    iteration += 1
+        # each patient can be used at most once
+        incidence = store.incidence(allo.maxId + 1)
+        incidence = incidence[np.flatnonzero(incidence.getnnz(axis=1))]
+        self.solver = SOLVERS[backend](incidence, np.ones(incidence.shape[0]))
+
+        # objective vectors over the columns
+        _, _, size, nbBA, score, isChain, _ = store.columns()
+        size = size.astype(np.float64)
+        self.objectives = []
+        for objective in allo.objectives:
+            if objective["name"] == "Maximize Total Transplants":
+                self.objectives.append(size - isChain)
+            elif "size" in objective:
+                self.objectives.append((size == objective["size"]).astype(np.float64))
+            elif objective["name"] == "Maximize Number of Back Arcs":
+                self.objectives.append(nbBA.astype(np.float64))
+            elif objective["name"] == "Maximize Total Score/Weight":
+                self.objectives.append(score.astype(np.float64))
+
+        self.fixed = []  # (objective index, value) of the fixed objectives
+        self.basis = None  # basis of the last LP
+        self.incumbent = None  # values of the last ILP solution or MIP start
+
+    def active(self):
+        # mask of the activated columns
+        return np.asarray(self.allo.isActivated) == 1
+
+    def prepare(self, objective_index, integral, start_optimization_time):
+        # set bounds, types, objective and parameters for the next solve
+        solver = self.solver
+        solver.set_upper_bounds(self.active().astype(np.float64))
+        solver.set_integral(integral)
+        solver.set_objective(
+            self.objectives[objective_index],
+            self.allo.objectives[objective_index]["sense"],
+        )
+        solver.set_time_limit(TIMEOUT - (time.time() - start_optimization_time))
+        solver.set_mip_gap(0)
+
+    def fix(self, objective_index, value):
+        # keep the value of a finished objective in the next ones
+        self.solver.add_equality(self.objectives[objective_index], value)
+        self.fixed.append((objective_index, value))
+
+
+def cycleLP(allo, cycle_model, start_optimization_time, objective_index):
+    try:
+        solver = cycle_model.solver
+        cycle_model.prepare(objective_index, False, start_optimization_time)
+
+        # start from the basis of the previous LP
+        if cycle_model.basis is not None:
+            solver.set_basis(cycle_model.basis)
+        solver.solve()
+
+        # store objective value
+        allo.temporaryObjectiveValues[objective_index] = solver.objective_value()
+        cycle_model.basis = solver.basis()
+
+        # reduced costs of the activated cycles and chains that are not used
+        unused = cycle_model.active() & (solver.values() < EPSILON)
+        allo.RC = np.where(unused, solver.reduced_costs(), 0.0).tolist()
+
+    except Exception as e:
+        print("Exception during optimization:", e)
+
+
+def cycleILP(
+    allo, cycle_model, start_optimization_time, objective_index, interrupt=None
+):
+    try:
+        solver = cycle_model.solver
+        cycle_model.prepare(objective_index, True, start_optimization_time)
+
+        # start from the previous incumbent; it is dropped if it is infeasible
+        if cycle_model.incumbent is not None:
+            solver.set_start(cycle_model.incumbent)
+        status = solver.solve(interrupt)
+        found = solver.incumbent_time()
+        if found is not None and allo.info.timeFirstIncumbent is None:
+            allo.info.timeFirstIncumbent = found - start_optimization_time
+
+        # the active cycles and chains cannot meet the values fixed for the
+        # previous objectives: the target of the deactivation loop is too tight
+        if status == INFEASIBLE:
+            print("Model is infeasible with the activated cycles and chains.")
+            return None, []
+
+        # a solve cancelled through `interrupt` is dropped, it may have no bound
+        if status == INTERRUPTED and interrupt is not None and interrupt():
+            return -1, []
 
         # update allocation information
-        allo.info.UB = math.ceil(model.ObjBound - EPSILON)
+        allo.info.UB = math.ceil(solver.objective_bound() - EPSILON)
         allo.info.opt = False
 
-        allo.info.nbVar = model.NumVars
-        allo.info.nbCons = model.NumConstrs
-        allo.info.nbNZ = model.NumNZs
+        allo.info.nbVar, allo.info.nbCons, allo.info.nbNZ = solver.size()
 
         # check if no solution found
-        if model.SolCount < 1:
+        if not solver.has_solution():
             print("Failed to optimize ILP.")
             allo.info.LB = 0
             return -1, []
 
         # store the objective value
-        obj_val = math.ceil(model.ObjVal - EPSILON)
+        obj_val = math.ceil(solver.objective_value() - EPSILON)
         allo.objectiveValues[objective_index] = obj_val
 
         # update optimality status
@@ -367,17 +788,14 @@ def cycleILP(allo, start_optimization_time, objective_index):
         if allo.info.LB == allo.info.UB:
             allo.info.opt = True
 
-        # collect and print the solution
-        selected_cycles_chains = []
-        for i in range(len(allo.cyclechains)):
-            if allo.isActivated[i] == 1 and isCycleUsed[i].X > EPSILON:
-                selected_cycles_chains.append(allo.cyclechains[i])
+        # collect the indices of the selected cycles and chains
+        values = solver.values()
+        cycle_model.incumbent = np.round(values)
+        selected_ids = np.flatnonzero(cycle_model.active() & (values > EPSILON))
+        selected_ids = selected_ids.tolist()
 
-        return obj_val, selected_cycles_chains
+        return obj_val, selected_ids
 
-    except gp.GurobiError as e:
-        print(f"Gurobi Error: {e}")
-        return -1, []
     except Exception as e:
         print(f"Exception during optimization: {e}")
         return -1, []
@@ -0,0 +1,231 @@
+from array import array
+import numpy as np
+import scipy.sparse as sp
+
+
+class CycleChain:
+    __slots__ = ("id", "size", "idX", "nbBA", "score", "isChain")
+
+    def __init__(self, id, size, idX, nbBA, score, isChain=0):
+        self.id = id
+        self.size = size
+        self.idX = idX
+        self.nbBA = nbBA
+        self.score = score
+        self.isChain = isChain
+
+    def print(self):
+        label = "Chain" if self.isChain == 1 else "Cycle"
+        print(f"{label} {self.id:5}\t size {self.size} ", end="")
+        for i in range(self.size - 1):
+            print(f"{self.idX[i]:5} ", end="")
+        print(f"{self.idX[-1]:5}\t nbBackArcs {self.nbBA}\t score {self.score}")
+
+
+class CycleChainStore:
+    """
+    Cycles and chains stored column by column instead of as one object each.
+
+    The vertices of all cycles and chains are concatenated in `nodes`; those
+    stored for entry i are nodes[offsets[i]:offsets[i + 1]]. Size, number of back
+    arcs, score and the chain flag are kept in parallel arrays. The columns are
+    typed `array.array`s, so appending is cheap while enumerating and every entry
+    takes a few bytes instead of a Python object. `columns()` exposes them to
+    NumPy without copying.
+
+    Chains added with `add_chain` form a prefix tree (trie) rooted at each NDD:
+    `parent[i]` is the entry of the chain without its last vertex, and only that
+    last vertex is stored for entry i. A chain of length L thus takes one vertex
+    instead of L, while keeping its own cumulative score and back-arc count.
+    Entries with parent -1 (cycles, and chains whose prefix is not in the store)
+    hold all their vertices. `idX(i)` walks the parents to give the full list.
+
+    Indexing or iterating the store yields `CycleChain` objects built on the fly,
+    for code that works on one cycle or chain at a time.
+    """
+
+    def __init__(self):
+        self.nodes = array("i")
+        self.offsets = array("q", [0])
+        self.parent = array("i")
+        self.size = array("b")
+        self.nbBA = array("i")
+        self.score = array("q")
+        self.isChain = array("b")
+        self.lastChain = {}  # entry of the last chain added per length
+
+    @classmethod
+    def from_columns(cls, **columns):
+        """
+        Builds a store from NumPy columns named as the store's (nodes, offsets
+        with its leading 0, parent, size, nbBA, score, isChain), copied and cast
+        to the column types. Columns left out stay empty.
+        """
+        store = cls()
+        for name, values in columns.items():
+            column = getattr(store, name)
+            del column[:]
+            column.frombytes(
+                np.ascontiguousarray(values, dtype=column.typecode).tobytes()
+            )
+        return store
+
+    def add(self, nodes, nbBA, score, is_chain):
+        self.nodes.extend(nodes)
+        self.offsets.append(len(self.nodes))
+        self.parent.append(-1)
+        self.size.append(len(nodes))
+        self.nbBA.append(nbBA)
+        self.score.append(score)
+        self.isChain.append(1 if is_chain else 0)
+        if is_chain:
+            self.lastChain = {}
+
+    def add_chain(self, nodes, nbBA, score):
+        """
+        Adds a chain as a trie node. Chains must come in depth-first preorder, as
+        from `enumeration.find_chains`: the prefix of a chain is then the chain of
+        one vertex less that was added last.
+        """
+        length = len(nodes)
+        parent = self.lastChain.get(length - 1, -1)
+        self.lastChain[length] = len(self.size)
+        if parent < 0:
+            self.nodes.extend(nodes)
+        else:
+            self.nodes.append(nodes[-1])
+        self.offsets.append(len(self.nodes))
+        self.parent.append(parent)
+        self.size.append(length)
+        self.nbBA.append(nbBA)
+        self.score.append(score)
+        self.isChain.append(1)
+
+    def extend(self, other):
+        # append all cycles and chains of another store
+        base = self.offsets[-1]
+        count = len(self.size)
+        self.nodes.extend(other.nodes)
+        self.offsets.frombytes(
+            (np.frombuffer(other.offsets, dtype=np.int64)[1:] + base).tobytes()
+        )
+        parent = np.frombuffer(other.parent, dtype=np.int32)
+        self.parent.frombytes(
+            np.where(parent >= 0, parent + count, -1).astype(np.int32).tobytes()
+        )
+        self.size.extend(other.size)
+        self.nbBA.extend(other.nbBA)
+        self.score.extend(other.score)
+        self.isChain.extend(other.isChain)
+        self.lastChain = {}
+
+    def slice(self, start, stop):
+        # new store with entries start..stop - 1; chains whose prefix lies before
+        # start get their full vertex list
+        part = CycleChainStore()
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        parent = np.frombuffer(self.parent, dtype=np.int32)[start:stop]
+        cut = np.flatnonzero((parent >= 0) & (parent < start)) + start
+
+        position = start
+        for i in cut.tolist():
+            part.nodes.extend(self.nodes[offsets[position] : offsets[i]])
+            part.nodes.extend(self.idX(i))
+            position = i + 1
+        part.nodes.extend(self.nodes[offsets[position] : offsets[stop]])
+
+        lengths = np.diff(offsets[start : stop + 1])
+        lengths[cut - start] = np.frombuffer(self.size, dtype=np.int8)[cut]
+        part.offsets.frombytes(np.cumsum(lengths, dtype=np.int64).tobytes())
+        part.parent.frombytes(
+            np.where(parent >= start, parent - start, -1).astype(np.int32).tobytes()
+        )
+        part.size = self.size[start:stop]
+        part.nbBA = self.nbBA[start:stop]
+        part.score = self.score[start:stop]
+        part.isChain = self.isChain[start:stop]
+        return part
+
+    def take(self, keep):
+        # new store with the entries where the boolean array keep is set, in
+        # order; the prefix of every kept chain must be kept as well
+        nodes, offsets, size, nbBA, score, isChain, parent = self.columns()
+        lengths = np.diff(offsets)
+        index = np.cumsum(keep, dtype=np.int32) - 1  # new index of kept entries
+        parent = parent[keep]
+        return CycleChainStore.from_columns(
+            nodes=nodes[np.repeat(keep, lengths)],
+            offsets=np.concatenate(([0], np.cumsum(lengths[keep]))),
+            parent=np.where(parent >= 0, index[parent], -1),
+            size=size[keep],
+            nbBA=nbBA[keep],
+            score=score[keep],
+            isChain=isChain[keep],
+        )
+
+    def idX(self, i):
+        nodes = self.nodes[self.offsets[i] : self.offsets[i + 1]].tolist()
+        i = self.parent[i]
+        while i >= 0:
+            # prepend the vertices stored for the prefix
+            nodes[:0] = self.nodes[self.offsets[i] : self.offsets[i + 1]].tolist()
+            i = self.parent[i]
+        return nodes
+
+    def incidence(self, num_vertices):
+        """
+        Returns the vertex-entry incidence matrix as a SciPy CSR matrix of shape
+        (num_vertices, len(store)): entry (v, i) is 1 when vertex v lies in
+        cycle or chain i. A chain covers the vertices stored for all its
+        prefixes in the trie, which are added one level of parents at a time.
+        """
+        nodes, offsets, _, _, _, _, parent = self.columns()
+        rows, cols = [], []
+        entry = np.arange(len(self), dtype=np.int64)
+        owner = entry  # entry whose stored vertices are added to `entry`
+        while len(entry):
+            count = offsets[owner + 1] - offsets[owner]
+            within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            rows.append(nodes[np.repeat(offsets[owner], count) + within])
+            cols.append(np.repeat(entry, count))
+            owner = parent[owner].astype(np.int64)
+            entry, owner = entry[owner >= 0], owner[owner >= 0]
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        return sp.csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(num_vertices, len(self))
+        )
+
+    def columns(self):
+        """
+        Returns the columns as NumPy arrays sharing memory with the store:
+        (nodes, offsets, size, nbBA, score, isChain, parent).
+        """
+        return (
+            np.frombuffer(self.nodes, dtype=np.int32),
+            np.frombuffer(self.offsets, dtype=np.int64),
+            np.frombuffer(self.size, dtype=np.int8),
+            np.frombuffer(self.nbBA, dtype=np.int32),
+            np.frombuffer(self.score, dtype=np.int64),
+            np.frombuffer(self.isChain, dtype=np.int8),
+            np.frombuffer(self.parent, dtype=np.int32),
+        )
+
+    def __len__(self):
+        return len(self.size)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return CycleChain(
+            id=i,
+            size=self.size[i],
+            idX=self.idX(i),
+            nbBA=self.nbBA[i],
+            score=self.score[i],
+            isChain=self.isChain[i],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -0,0 +1,687 @@
+from collections import deque
+from multiprocessing import Pool
+import numpy as np
+from cyclechains import CycleChainStore
+from instance import open_instance, share_instance
+
+# number of cycles and chains per batch yielded by the batch generators
+BATCH_SIZE = 100000
+
+# enumeration state of a pool worker, set by init_worker
+worker = {}
+
+
+def adjacency_lists(instance, keep=None):
+    """
+    Builds, from the CSR arrays of an instance, the successor and predecessor list
+    of every vertex and a (donor, patient) -> weight dict of the arcs.
+
+    With a boolean mask `keep` over the arcs (from `reduction.reduce_arcs`), the
+    successor and predecessor lists only hold the kept arcs. The dict still has
+    every arc, as back arcs are counted over all of them.
+    """
+    offsets = instance.offsets
+    patient_ids = instance.patient_ids
+    if keep is not None:
+        offsets = np.concatenate(([0], np.cumsum(keep, dtype=np.int64)))[offsets]
+        patient_ids = patient_ids[keep]
+    offsets = offsets.tolist()
+    patient_ids = patient_ids.tolist()
+    successors = [
+        patient_ids[offsets[v] : offsets[v + 1]] for v in range(instance.max_id + 1)
+    ]
+    in_offsets = instance.in_offsets
+    in_arcs = instance.in_arcs
+    if keep is not None:
+        in_keep = keep[in_arcs]
+        in_offsets = np.concatenate(([0], np.cumsum(in_keep, dtype=np.int64)))[
+            in_offsets
+        ]
+        in_arcs = in_arcs[in_keep]
+    in_offsets = in_offsets.tolist()
+    in_donor_ids = instance.donor_ids[in_arcs].tolist()
+    predecessors = [
+        in_donor_ids[in_offsets[v] : in_offsets[v + 1]]
+        for v in range(instance.max_id + 1)
+    ]
+    scores = dict(
+        zip(
+            zip(instance.donor_ids.tolist(), instance.patient_ids.tolist()),
+            instance.weights.tolist(),
+        )
+    )
+    return successors, predecessors, scores
+
+
+def back_arcs_and_score(nodes, is_chain, scores):
+    """
+    Returns the number of back arcs and the total score of a cycle or chain, using
+    `scores` both for the arc weights and to test whether an arc exists.
+    """
+    total_score = 0
+    nbBA = 0
+    num_nodes = len(nodes)
+    if is_chain:
+        num_arcs = num_nodes - 1
+    else:
+        num_arcs = num_nodes
+
+    for i in range(num_arcs):
+        from_node = nodes[i]
+        to_node = nodes[(i + 1) % num_nodes]  # wrap-around for cycles
+        total_score += scores.get((from_node, to_node), 0)
+
+        if is_chain:
+            for previous_node in nodes[:i]:
+                if (from_node, previous_node) in scores:
+                    nbBA += 1
+        else:
+            for previous_node in nodes[:i]:
+                if (
+                    previous_node != nodes[i - 1]
+                    and (from_node, previous_node) in scores
+                ):
+                    nbBA += 1
+    return nbBA, total_score
+
+
+def find_cycles(successors, predecessors, scores, starts, max_length):
+    """
+    Yields every cycle of at most `max_length` vertices as a tuple (nodes, nbBA,
+    score), where nodes lists the vertex ids starting from the smallest one.
+
+    The search is an iterative depth-first search over one path array, one
+    visited flag per vertex and one cursor per depth into the successor list of
+    the vertex at that depth, so exploring an arc allocates nothing; only the
+    yielded cycles are new lists. Cycles come out in the same order as from the
+    former stack of (node, path, visited) tuples: the cycle closing at a vertex is
+    reported when the vertex is reached, and successors are explored last to
+    first.
+
+    Before the search from a start vertex, a reverse breadth-first search gives
+    the distance to the start of every vertex that is not smaller than the start
+    and can reach it within max_length - 1 arcs. The path is only extended to
+    vertices from which the start can still be reached without exceeding
+    max_length vertices, so vertices smaller than the start and branches that
+    cannot close in time are never entered. Pruned branches contain no cycle, so
+    the output is unchanged.
+
+    The score of the path and its back arcs are summed per depth as the path
+    grows: a new vertex adds the weight of the arc reaching it and its arcs to
+    the path vertices before its predecessor. The closing arc weight completes
+    the score of a cycle. The values equal those of `back_arcs_and_score`.
+
+    Args:
+        successors (list): successors[v] lists the patients compatible with donor v.
+        predecessors (list): predecessors[v] lists the donors compatible with patient v.
+        scores (dict): Weight of every arc, keyed by (donor, patient).
+        starts (list): Vertices to start from, in order (the pairs).
+        max_length (int): Maximum number of vertices in a cycle.
+    """
+    if max_length < 2:
+        return
+    visited = bytearray(len(successors))
+    distance = [0] * len(successors)  # arcs to the start, 0 if out of reach
+    path = [0] * max_length
+    cursor = [0] * max_length
+    path_score = [0] * max_length  # score of the arcs along path[: depth + 1]
+    path_back = [0] * max_length  # back arcs of path[: depth + 1]
+    for start in starts:
+        # reverse breadth-first search from the start over vertices >= start
+        reached = [start]
+        frontier = [start]
+        for hops in range(1, max_length):
+            next_frontier = []
+            for v in frontier:
+                for u in predecessors[v]:
+                    if u > start and not distance[u]:
+                        distance[u] = hops
+                        next_frontier.append(u)
+            reached += next_frontier
+            frontier = next_frontier
+
+        path[0] = start
+        visited[start] = 1
+        cursor[0] = len(successors[start])
+        length = 1
+        while length:
+            depth = length - 1
+            targets = successors[path[depth]]
+            budget = max_length - length  # arcs left to get back to the start
+            i = cursor[depth]
+            while i:
+                i -= 1
+                node = targets[i]
+                if 0 < distance[node] <= budget and not visited[node]:
+                    break
+            else:
+                # all successors explored, backtrack
+                visited[path[depth]] = 0
+                length = depth
+                continue
+            cursor[depth] = i
+
+            # extend the path, updating its score and back arcs
+            back = path_back[depth]
+            for j in range(depth):
+                if (node, path[j]) in scores:
+                    back += 1
+            path_back[length] = back
+            path_score[length] = path_score[depth] + scores[(path[depth], node)]
+            path[length] = node
+            visited[node] = 1
+            length += 1
+
+            # report the cycle closing at the new vertex
+            if distance[node] == 1:
+                yield path[:length], back, path_score[depth + 1] + scores[(node, start)]
+            cursor[length - 1] = len(successors[node]) if length < max_length else 0
+
+        for v in reached:
+            distance[v] = 0
+
+
+def find_chains(successors, scores, ndds, max_length):
+    """
+    Yields every chain of at most `max_length` vertices (the NDD included) as a
+    tuple (nodes, nbBA, score), with the same allocation-free search as
+    `find_cycles`.
+
+    For each NDD the chain made of the NDD alone comes first, then the chains
+    through each of its successors in turn, each reported when its last vertex
+    is reached and extended from the last successor to the first. As before,
+    the NDD itself is not marked as visited.
+
+    Score and back arcs are kept per depth as well. The last vertex of a chain
+    donates to nobody, so a vertex's own back arcs are added once the chain is
+    extended beyond it.
+    """
+    visited = bytearray(len(successors))
+    size = max(max_length, 2)
+    path = [0] * size
+    cursor = [0] * size
+    path_score = [0] * size
+    path_back = [0] * size
+    for ndd in ndds:
+        if max_length >= 1:
+            yield [ndd], 0, 0
+        if max_length < 2:
+            continue
+
+        path[0] = ndd
+        for first in successors[ndd]:
+            path[1] = first
+            visited[first] = 1
+            length = 2
+            path_score[1] = scores[(ndd, first)]
+            path_back[1] = 0
+            yield path[:2], 0, path_score[1]
+            cursor[1] = len(successors[first]) if length < max_length else 0
+            while length > 1:
+                depth = length - 1
+                targets = successors[path[depth]]
+                i = cursor[depth]
+                while i:
+                    i -= 1
+                    if not visited[targets[i]]:
+                        break
+                else:
+                    # all successors explored, backtrack
+                    visited[path[depth]] = 0
+                    length = depth
+                    continue
+                cursor[depth] = i
+
+                # extend the chain; path[depth] now donates, so count its back arcs
+                node = targets[i]
+                tail = path[depth]
+                back = path_back[depth]
+                for j in range(depth):
+                    if (tail, path[j]) in scores:
+                        back += 1
+                path_back[length] = back
+                path_score[length] = path_score[depth] + scores[(tail, node)]
+                path[length] = node
+                visited[node] = 1
+                length += 1
+                yield path[:length], back, path_score[depth + 1]
+                cursor[length - 1] = len(successors[node]) if length < max_length else 0
+
+
+def short_cycles(instance, starts, max_length, chunk_size=1 << 21, keep=None):
+    """
+    Returns the cycles of at most `max_length` <= 3 vertices from `starts` as a
+    `CycleChainStore`, computed with array operations on the CSR arrays of
+    `instance` instead of the search of `find_cycles`. The store holds the same
+    cycles, scores and back-arc counts in the same order.
+
+    2-cycles are the first arcs s -> a (a > s) whose reverse arc exists. For
+    3-cycles, each first arc is joined with the in-arcs b -> s of its start
+    with b > s (a suffix of the reverse CSR row, as donors are sorted), and the
+    pairs with an arc a -> b are kept; the joins are done `chunk_size` at a
+    time to bound memory. A 2-cycle has no back arc and a 3-cycle exactly one,
+    its closing arc. The search order is restored by sorting on the position
+    of the start, then the reversed rank of each arc in its successor list,
+    with a 2-cycle before the 3-cycles that extend it.
+
+    With a boolean mask `keep` from `reduction.reduce_arcs`, only kept arcs
+    start or close a cycle; the arcs it drops are on no cycle anyway.
+    """
+    n = instance.max_id + 1
+    donor_ids = instance.donor_ids
+    patient_ids = instance.patient_ids
+    weights = instance.weights
+    offsets = instance.offsets
+    in_offsets = instance.in_offsets
+
+    # position of each arc by (donor, patient) key, to look up found arcs
+    keys = instance.arc_keys(donor_ids, patient_ids)
+    key_order = np.argsort(keys)
+    sorted_keys = keys[key_order]
+
+    def arc_positions(donors, patients):
+        return key_order[
+            np.searchsorted(sorted_keys, instance.arc_keys(donors, patients))
+        ]
+
+    start_rank = np.full(n, -1, dtype=np.int64)
+    start_rank[np.asarray(starts, dtype=np.int64)] = np.arange(len(starts))
+
+    # first arcs s -> a of a cycle
+    first = (start_rank[donor_ids] >= 0) & (patient_ids > donor_ids)
+    if keep is not None:
+        first &= keep
+    first = np.flatnonzero(first)
+    if max_length < 2:
+        first = first[:0]
+    s = donor_ids[first].astype(np.int64)
+    a = patient_ids[first].astype(np.int64)
+
+    # 2-cycles: s -> a -> s, as (first arc, middle arc or -1, closing arc)
+    closed = instance.has_arcs(a, s)
+    pieces = [
+        (
+            first[closed],
+            np.full(closed.sum(), -1),
+            arc_positions(a[closed], s[closed]),
+        )
+    ]
+
+    # 3-cycles: s -> a -> b -> s with b > s
+    if max_length >= 3:
+        back_in = np.bincount(patient_ids[donor_ids > patient_ids], minlength=n)
+        counts = back_in[s]
+        bounds = np.cumsum(counts)
+        begin = 0
+        while begin < len(first):
+            end = int(
+                np.searchsorted(
+                    bounds, bounds[begin] - counts[begin] + chunk_size, side="right"
+                )
+            )
+            end = max(end, begin + 1)
+            count = counts[begin:end]
+            row = np.repeat(np.arange(begin, end), count)
+            within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            third = instance.in_arcs[
+                np.repeat(in_offsets[s[begin:end] + 1] - count, count) + within
+            ]
+            if keep is not None:
+                row, third = row[keep[third]], third[keep[third]]
+            b = donor_ids[third].astype(np.int64)
+            found = (b != a[row]) & instance.has_arcs(a[row], b)
+            row, third, b = row[found], third[found], b[found]
+            pieces.append((first[row], arc_positions(a[row], b), third))
+            begin = end
+
+    first_arcs, middle, closing = (
+        np.concatenate([piece[i] for piece in pieces]) for i in range(3)
+    )
+    triangle = middle >= 0
+
+    # the order of find_cycles: by start, then successors last to first, a
+    # 2-cycle before its extensions
+    s = donor_ids[first_arcs]
+    first_rank = first_arcs - offsets[s]
+    middle_rank = np.where(triangle, middle - offsets[patient_ids[first_arcs]], 0)
+    order = np.lexsort((-middle_rank, triangle, -first_rank, start_rank[s]))
+    first_arcs, middle, closing, triangle = (
+        first_arcs[order],
+        middle[order],
+        closing[order],
+        triangle[order],
+    )
+
+    size = np.where(triangle, 3, 2)
+    nodes = np.stack(
+        [
+            donor_ids[first_arcs],
+            patient_ids[first_arcs],
+            np.where(triangle, donor_ids[closing], -1),
+        ],
+        axis=1,
+    )
+    score = weights[first_arcs].astype(np.int64) + weights[closing]
+    score[triangle] += weights[middle[triangle]]
+    return CycleChainStore.from_columns(
+        nodes=nodes[nodes >= 0],
+        offsets=np.concatenate(([0], np.cumsum(size))),
+        parent=np.full(len(size), -1),
+        size=size,
+        nbBA=size - 2,
+        score=score,
+        isChain=np.zeros(len(size)),
+    )
+
+
+def count_cycles(successors, predecessors, scores, starts, max_length):
+    """
+    Returns counts, where counts[L] is the number of cycles of L vertices that
+    `find_cycles` yields for the same arguments (L <= max_length), without
+    building them.
+
+    The search is the pruned depth-first search of `find_cycles`, stopped one
+    vertex short: the cycles closing through the next vertex are counted in
+    bulk. Before the search from a start, closing[v] counts the successors of v
+    with an arc back to the start; a path ending in v then closes that many
+    cycles, less its own vertices among them. Neither scores nor back arcs are
+    computed, and the last level of the search, which holds most of the paths,
+    is never walked.
+    """
+    counts = [0] * (max_length + 1)
+    if max_length < 2:
+        return counts
+    visited = bytearray(len(successors))
+    distance = [0] * len(successors)
+    closing = [0] * len(successors)
+    path = [0] * max_length
+    cursor = [0] * max_length
+    for start in starts:
+        reached = [start]
+        frontier = [start]
+        for hops in range(1, max_length):
+            next_frontier = []
+            for v in frontier:
+                for u in predecessors[v]:
+                    if u > start and not distance[u]:
+                        distance[u] = hops
+                        next_frontier.append(u)
+            reached += next_frontier
+            frontier = next_frontier
+
+        # vertices closing a cycle, and per vertex the number of them it reaches
+        closers = [u for u in predecessors[start] if distance[u] == 1]
+        touched = []
+        for w in closers:
+            for u in predecessors[w]:
+                if not closing[u]:
+                    touched.append(u)
+                closing[u] += 1
+
+        path[0] = start
+        visited[start] = 1
+        cursor[0] = len(successors[start]) if max_length > 2 else 0
+        counts[2] += closing[start]
+        length = 1
+        while length:
+            depth = length - 1
+            targets = successors[path[depth]]
+            budget = max_length - length
+            i = cursor[depth]
+            while i:
+                i -= 1
+                node = targets[i]
+                if 0 < distance[node] <= budget and not visited[node]:
+                    break
+            else:
+                visited[path[depth]] = 0
+                length = depth
+                continue
+            cursor[depth] = i
+
+            path[length] = node
+            visited[node] = 1
+            length += 1
+
+            # cycles through one more vertex, which must not be on the path
+            closed = closing[node]
+            if closed:
+                for j in range(1, depth + 1):
+                    if distance[path[j]] == 1 and (node, path[j]) in scores:
+                        closed -= 1
+                counts[length + 1] += closed
+            cursor[length - 1] = len(successors[node]) if length < max_length - 1 else 0
+
+        for v in reached:
+            distance[v] = 0
+        for u in touched:
+            closing[u] = 0
+    return counts
+
+
+def count_chains(successors, scores, ndds, max_length):
+    """
+    Returns counts, where counts[L] is the number of chains of L vertices (the
+    NDD included) that `find_chains` yields for the same arguments, without
+    building them.
+
+    As in `count_cycles`, the search stops one vertex short: a chain ending in v
+    extends to all successors of v except those already on the chain, which is
+    counted from the out-degree and the arcs from v back to the chain.
+    """
+    counts = [0] * (max(max_length, 1) + 1)
+    if max_length < 1:
+        return counts
+    counts[1] = len(ndds)
+    if max_length < 2:
+        return counts
+    visited = bytearray(len(successors))
+    path = [0] * max_length
+    cursor = [0] * max_length
+    for ndd in ndds:
+        path[0] = ndd
+        counts[2] += len(successors[ndd])
+        if max_length < 3:
+            continue
+        for first in successors[ndd]:
+            path[1] = first
+            visited[first] = 1
+            length = 2
+            cursor[1] = len(successors[first]) if length < max_length - 1 else 0
+            # chains of three vertices through the first one
+            counts[3] += len(successors[first])
+            while length > 1:
+                depth = length - 1
+                targets = successors[path[depth]]
+                i = cursor[depth]
+                while i:
+                    i -= 1
+                    if not visited[targets[i]]:
+                        break
+                else:
+                    visited[path[depth]] = 0
+                    length = depth
+                    continue
+                cursor[depth] = i
+
+                node = targets[i]
+                path[length] = node
+                visited[node] = 1
+                length += 1
+
+                # chains through one more vertex, which must not be on the chain
+                extended = len(successors[node])
+                for j in range(1, depth + 1):
+                    if (node, path[j]) in scores:
+                        extended -= 1
+                counts[length + 1] += extended
+                cursor[length - 1] = (
+                    len(successors[node]) if length < max_length - 1 else 0
+                )
+    return counts
+
+
+def split_starts(starts, work, parts):
+    """
+    Cuts `starts` into at most `parts` contiguous slices of about the same total
+    estimated work, keeping their order.
+    """
+    cumulative = np.cumsum(np.asarray(work, dtype=np.float64))
+    if len(starts) == 0:
+        return []
+    cuts = np.searchsorted(
+        cumulative, cumulative[-1] * np.arange(1, parts) / parts, side="right"
+    )
+    bounds = [0] + sorted(set(cuts.tolist()) - {0, len(starts)}) + [len(starts)]
+    return [starts[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def init_worker(path, max_cycle_length, max_chain_length, keep=None):
+    # map the shared instance and build the lists once per worker process
+    successors, predecessors, scores = adjacency_lists(
+        open_instance(path, mmap_mode="r"), keep
+    )
+    worker.update(
+        successors=successors,
+        predecessors=predecessors,
+        scores=scores,
+        max_cycle_length=max_cycle_length,
+        max_chain_length=max_chain_length,
+    )
+
+
+def enumerate_part(task):
+    # enumerate the cycles (or chains) of one slice of start vertices
+    is_chain, starts = task
+    scores = worker["scores"]
+    if is_chain:
+        paths = find_chains(
+            worker["successors"], scores, starts, worker["max_chain_length"]
+        )
+    else:
+        paths = find_cycles(
+            worker["successors"],
+            worker["predecessors"],
+            scores,
+            starts,
+            worker["max_cycle_length"],
+        )
+    store = CycleChainStore()
+    for nodes, nbBA, score in paths:
+        if is_chain:
+            store.add_chain(nodes, nbBA, score)
+        else:
+            store.add(nodes, nbBA, score, False)
+    return store
+
+
+def cycle_chain_batches(
+    successors,
+    predecessors,
+    scores,
+    starts,
+    ndds,
+    max_cycle_length,
+    max_chain_length,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Yields the cycles from `starts`, then the chains from `ndds`, as
+    `CycleChainStore` batches of `batch_size` entries (the last one may be
+    smaller). Only the batch being filled is kept in memory.
+    """
+    batch = CycleChainStore()
+    for is_chain, paths in (
+        (
+            False,
+            find_cycles(successors, predecessors, scores, starts, max_cycle_length),
+        ),
+        (True, find_chains(successors, scores, ndds, max_chain_length)),
+    ):
+        for nodes, nbBA, score in paths:
+            if is_chain:
+                batch.add_chain(nodes, nbBA, score)
+            else:
+                batch.add(nodes, nbBA, score, False)
+            if len(batch) == batch_size:
+                yield batch
+                batch = CycleChainStore()
+    if len(batch) > 0:
+        yield batch
+
+
+def rebatch(stores, batch_size=BATCH_SIZE):
+    # cuts and joins a sequence of stores into batches of batch_size entries
+    batch = CycleChainStore()
+    for store in stores:
+        position = 0
+        while position < len(store):
+            take = min(batch_size - len(batch), len(store) - position)
+            batch.extend(store.slice(position, position + take))
+            position += take
+            if len(batch) == batch_size:
+                yield batch
+                batch = CycleChainStore()
+    if len(batch) > 0:
+        yield batch
+
+
+def parallel_batches(
+    instance,
+    starts,
+    ndds,
+    max_cycle_length,
+    max_chain_length,
+    workers,
+    batch_size=BATCH_SIZE,
+    keep=None,
+):
+    """
+    Enumerates cycles and chains on a pool of `workers` processes and yields them
+    as batches, like `cycle_chain_batches`.
+
+    The pair starts and the NDDs are cut into contiguous slices of about equal
+    estimated work, several per worker so that uneven slices even out. For a
+    cycle start the estimate is its number of successors greater than itself
+    (the only ones the pruned search enters), and for an NDD the number of arcs
+    leaving its successors. Workers map the instance from `share_instance`
+    instead of receiving a copy, and send back each slice as a `CycleChainStore`.
+    Slices are taken in start order, so the batches hold the same cycles and
+    chains in the same order as `cycle_chain_batches` on one core. At most
+    2 * workers slices are submitted and not yet consumed (`in_order`), so the
+    pool does not run ahead of a slow consumer and memory is bounded by those
+    slices and one batch. A mask `keep` over the arcs restricts the search of
+    the workers to the kept arcs.
+    """
+    out_degree = np.diff(instance.offsets)
+    forward = instance.patient_ids > instance.donor_ids
+    cycle_work = np.bincount(instance.donor_ids[forward], minlength=instance.max_id + 1)
+    chain_work = np.bincount(
+        instance.donor_ids,
+        weights=out_degree[instance.patient_ids],
+        minlength=instance.max_id + 1,
+    )
+
+    parts = 4 * workers
+    tasks = [
+        (False, part) for part in split_starts(starts, cycle_work[starts] + 1, parts)
+    ] + [(True, part) for part in split_starts(ndds, chain_work[ndds] + 1, parts)]
+
+    with Pool(
+        workers,
+        initializer=init_worker,
+        initargs=(share_instance(instance), max_cycle_length, max_chain_length, keep),
+    ) as pool:
+        yield from rebatch(in_order(pool, tasks, 2 * workers), batch_size)
+
+
+def in_order(pool, tasks, window):
+    # results of enumerate_part over tasks, in task order, with at most
+    # `window` tasks submitted to the pool and not yet consumed
+    pending = deque()
+    for task in tasks:
+        if len(pending) == window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(enumerate_part, (task,)))
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,84 @@
+import os
+import re
+import shutil
+import tempfile
+import numpy as np
+from cyclechains import CycleChainStore
+
+# bump when the enumeration or the stored columns change, so stale entries are ignored
+CACHE_VERSION = 1
+
+# columns of a CycleChainStore written to the cache
+STORED_COLUMNS = ["nodes", "offsets", "parent", "size", "nbBA", "score", "isChain"]
+
+
+def cached_store(path, is_chain, max_length, build):
+    """
+    Returns the cycles (or chains) of at most `max_length` vertices of the
+    instance stored at `path` as a `CycleChainStore`, going through the
+    enumeration cache.
+
+    The cache lives in the instance's own cache entry (the `path` of an
+    instance from `load_instance`), so it is keyed on the instance content.
+    Cycles are stored per maximum cycle length and chains per maximum chain
+    length, as each depends only on its own limit. A request is served from the
+    entry of the same length, or else from the smallest longer one by keeping
+    its entries of at most `max_length` vertices: the depth-first order makes
+    these exactly the shorter enumeration, in the same order. Otherwise
+    `build()` enumerates the store, which is written to the cache. With no path
+    (an instance without a cache entry), `build()` is called every time.
+    """
+    if path is None:
+        return build()
+
+    kind = "chains" if is_chain else "cycles"
+    lengths = cached_lengths(path, kind)
+    if max_length in lengths:
+        return open_store(store_entry(path, kind, max_length))
+
+    longer = [length for length in lengths if length > max_length]
+    if longer:
+        store = open_store(store_entry(path, kind, min(longer)))
+        return store.take(np.frombuffer(store.size, dtype=np.int8) <= max_length)
+
+    store = build()
+    save_store(store, store_entry(path, kind, max_length))
+    return store
+
+
+def store_entry(path, kind, max_length):
+    return os.path.join(path, f"{kind}_{max_length}.v{CACHE_VERSION}")
+
+
+def cached_lengths(path, kind):
+    # maximum lengths with a cache entry of the current version
+    pattern = re.compile(rf"{kind}_(\d+)\.v{CACHE_VERSION}")
+    return [
+        int(match.group(1))
+        for match in map(pattern.fullmatch, os.listdir(path))
+        if match
+    ]
+
+
+def open_store(entry):
+    return CycleChainStore.from_columns(
+        **{name: np.load(os.path.join(entry, f"{name}.npy")) for name in STORED_COLUMNS}
+    )
+
+
+def save_store(store, entry):
+    # write into a temporary directory first and rename it, so concurrent runs
+    # never see a partially written entry; a read-only cache is left as it is
+    tmp = None
+    try:
+        tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+        for name in STORED_COLUMNS:
+            column = getattr(store, name)
+            np.save(
+                os.path.join(tmp, f"{name}.npy"),
+                np.frombuffer(column, dtype=column.typecode),
+            )
+        os.rename(tmp, entry)
+    except OSError:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,344 @@
+import os
+import hashlib
+import shutil
+import tempfile
+import weakref
+import numpy as np
+
+# bytes that separate numbers in the pair and arc blocks of an instance file
+SEPARATORS = bytes.maketrans(b"(),", b"   ")
+
+# bump when the layout of the cached arrays changes, so stale entries are ignored
+CACHE_VERSION = 3
+
+# instances shared between worker processes are written here (RAM-backed if possible)
+SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+# arrays written to the cache for each instance
+CACHED_ARRAYS = [
+    "ids",
+    "is_ndd",
+    "donor_blood_type",
+    "patient_blood_type",
+    "patient_vpra",
+    "donor_ids",
+    "patient_ids",
+    "weights",
+    "offsets",
+    "in_offsets",
+    "in_arcs",
+    "arc_bits",
+]
+
+
+class Instance:
+    """
+    Kidney exchange instance stored as flat typed arrays instead of lists of dicts.
+
+    Vertex arrays are in file order (one entry per pair or NDD). Arc arrays are
+    sorted by donor id (stable, so the file order is kept for arcs of the same
+    donor), which makes them a CSR adjacency structure together with `offsets`:
+    the out-arcs of vertex v are the positions offsets[v]:offsets[v + 1].
+
+    The in-arcs are indexed by a reverse CSR: in_arcs[in_offsets[v]:in_offsets[v + 1]]
+    are the positions of the arcs entering v. Arc existence is answered by
+    `arc_bits`, a packed bitset with one bit per (donor, patient) pair, i.e.
+    (max_id + 1)^2 / 8 bytes instead of (max_id + 1)^2 boxed ints.
+
+    When `offsets` is passed in, the arcs are taken to be sorted already and all
+    arrays are used as they are, without copying. This is how memory-mapped
+    instances from `open_instance` are built: every process that opens the same
+    entry shares the same physical pages.
+    """
+
+    def __init__(
+        self,
+        num_pairs,
+        num_ndd,
+        ids,
+        is_ndd,
+        donor_blood_type,
+        patient_blood_type,
+        patient_vpra,
+        donor_ids,
+        patient_ids,
+        weights,
+        offsets=None,
+        in_offsets=None,
+        in_arcs=None,
+        arc_bits=None,
+        path=None,
+    ):
+        self.path = path  # directory holding the arrays, if opened from disk
+        self.shared = None  # temporary copy written by share_instance, if any
+        self.num_pairs = int(num_pairs)
+        self.num_ndd = int(num_ndd)
+
+        # per-vertex data
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.is_ndd = np.asarray(is_ndd, dtype=np.bool_)
+        self.donor_blood_type = np.asarray(donor_blood_type, dtype=np.int8)
+        self.patient_blood_type = np.asarray(patient_blood_type, dtype=np.int8)
+        self.patient_vpra = np.asarray(patient_vpra, dtype=np.int8)
+        self.max_id = int(self.ids.max()) if len(self.ids) > 0 else 0
+
+        if offsets is not None:
+            # arcs are already sorted by donor
+            self.donor_ids = np.asarray(donor_ids, dtype=np.int32)
+            self.patient_ids = np.asarray(patient_ids, dtype=np.int32)
+            self.weights = np.asarray(weights, dtype=np.int32)
+            self.offsets = np.asarray(offsets, dtype=np.int64)
+            self.num_arcs = len(self.donor_ids)
+        else:
+            # per-arc data, sorted by donor
+            donor_ids = np.asarray(donor_ids, dtype=np.int32)
+            order = np.argsort(donor_ids, kind="stable")
+            self.donor_ids = donor_ids[order]
+            self.patient_ids = np.asarray(patient_ids, dtype=np.int32)[order]
+            self.weights = np.asarray(weights, dtype=np.int32)[order]
+            self.num_arcs = len(self.donor_ids)
+
+            # CSR offsets of the forward adjacency
+            self.offsets = np.zeros(self.max_id + 2, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.donor_ids, minlength=self.max_id + 1),
+                out=self.offsets[1:],
+            )
+
+        if in_offsets is not None:
+            self.in_offsets = np.asarray(in_offsets, dtype=np.int64)
+            self.in_arcs = np.asarray(in_arcs, dtype=np.int64)
+        else:
+            # reverse CSR: arc positions grouped by patient, donors ascending
+            self.in_arcs = np.argsort(self.patient_ids, kind="stable").astype(np.int64)
+            self.in_offsets = np.zeros(self.max_id + 2, dtype=np.int64)
+            np.cumsum(
+                np.bincount(self.patient_ids, minlength=self.max_id + 1),
+                out=self.in_offsets[1:],
+            )
+
+        if arc_bits is not None:
+            self.arc_bits = np.asarray(arc_bits, dtype=np.uint8)
+        else:
+            # bit donor * (max_id + 1) + patient is set for every arc
+            bits = np.zeros((self.max_id + 1) ** 2, dtype=np.bool_)
+            bits[self.arc_keys(self.donor_ids, self.patient_ids)] = True
+            self.arc_bits = np.packbits(bits, bitorder="little")
+
+    def successors(self, v):
+        return self.patient_ids[self.offsets[v] : self.offsets[v + 1]]
+
+    def predecessors(self, v):
+        return self.donor_ids[self.in_arcs[self.in_offsets[v] : self.in_offsets[v + 1]]]
+
+    def arc_keys(self, donors, patients):
+        return np.asarray(donors, dtype=np.int64) * (self.max_id + 1) + patients
+
+    def has_arc(self, donor_id, patient_id):
+        key = donor_id * (self.max_id + 1) + patient_id
+        return bool(self.arc_bits[key >> 3] >> (key & 7) & 1)
+
+    def has_arcs(self, donors, patients):
+        """Vectorized `has_arc` over arrays of donor and patient ids."""
+        keys = self.arc_keys(donors, patients)
+        return (self.arc_bits[keys >> 3] >> (keys & 7) & 1).astype(np.bool_)
+
+    @classmethod
+    def from_dict(cls, data):
+        """Builds an instance from its dictionary form (pairs and arcs as lists of dicts)."""
+        pairs = data["pairs"]
+        arcs = data["arcs"]
+        return cls(
+            num_pairs=data["num_pairs"],
+            num_ndd=data["num_ndd"],
+            ids=[p["id"] for p in pairs],
+            is_ndd=[p["is_ndd"] for p in pairs],
+            donor_blood_type=[p["donor_blood_type"] for p in pairs],
+            patient_blood_type=[p["patient_blood_type"] for p in pairs],
+            patient_vpra=[p["patient_vpra"] for p in pairs],
+            donor_ids=[a["donor_id"] for a in arcs],
+            patient_ids=[a["patient_id"] for a in arcs],
+            weights=[a["weight"] for a in arcs],
+        )
+
+    def to_dict(self):
+        """Converts the instance back to its dictionary form (pairs and arcs as lists of dicts)."""
+        return {
+            "num_pairs": self.num_pairs,
+            "num_ndd": self.num_ndd,
+            "num_arcs": self.num_arcs,
+            "pairs": [
+                {
+                    "id": id,
+                    "is_ndd": is_ndd,
+                    "donor_blood_type": donor_blood_type,
+                    "patient_blood_type": patient_blood_type,
+                    "patient_vpra": patient_vpra,
+                }
+                for id, is_ndd, donor_blood_type, patient_blood_type, patient_vpra in zip(
+                    self.ids.tolist(),
+                    self.is_ndd.tolist(),
+                    self.donor_blood_type.tolist(),
+                    self.patient_blood_type.tolist(),
+                    self.patient_vpra.tolist(),
+                )
+            ],
+            "arcs": [
+                {"donor_id": donor_id, "patient_id": patient_id, "weight": weight}
+                for donor_id, patient_id, weight in zip(
+                    self.donor_ids.tolist(),
+                    self.patient_ids.tolist(),
+                    self.weights.tolist(),
+                )
+            ],
+        }
+
+
+def parse_instance(filepath):
+    """
+    Parses a kidney exchange instance file into an `Instance` in bulk.
+
+    The pair block and the arc block are each converted to an integer array in a
+    single call instead of line by line, so no Python object is created per arc.
+
+    Args:
+        filepath (str): The path to the text file containing the kidney exchange data.
+
+    Returns:
+        Instance: The parsed instance.
+
+    Example:
+        instance = parse_instance('path/to/data.txt')
+        print(instance.num_arcs)  # Output: Number of arcs in the instance
+    """
+    with open(filepath, "rb") as f:
+        raw = f.read()
+    return parse_instance_bytes(raw)
+
+
+def parse_instance_bytes(raw):
+    # header: "Nr_Pairs = ..", "Nr_NDD = ..", "Nr_Arcs = .."
+    header = raw.split(b"\n", 3)
+    num_pairs = int(header[0].split()[2])
+    num_ndd = int(header[1].split()[2])
+    num_arcs = int(header[2].split()[2])
+    body = header[3] if len(header) > 3 else b""
+
+    # the arc block starts at the first "(" of the body
+    arcs_start = body.find(b"(")
+    if arcs_start < 0:
+        arcs_start = len(body)
+
+    # pair lines: id, is_ndd, donor blood type, patient blood type, patient vpra
+    pair_block = np.fromstring(
+        body[:arcs_start].translate(SEPARATORS).decode(), dtype=np.int64, sep=" "
+    ).reshape(-1, 5)[: num_pairs + num_ndd]
+
+    # arc lines: (donor id, patient id), 1, weight
+    arc_block = np.fromstring(
+        body[arcs_start:].translate(SEPARATORS).decode(), dtype=np.int64, sep=" "
+    ).reshape(-1, 4)[:num_arcs]
+
+    return Instance(
+        num_pairs=num_pairs,
+        num_ndd=num_ndd,
+        ids=pair_block[:, 0],
+        is_ndd=pair_block[:, 1],
+        donor_blood_type=pair_block[:, 2],
+        patient_blood_type=pair_block[:, 3],
+        patient_vpra=pair_block[:, 4],
+        donor_ids=arc_block[:, 0],
+        patient_ids=arc_block[:, 1],
+        weights=arc_block[:, 3],
+    )
+
+
+def load_instance(filepath, cache_dir=None, mmap_mode=None):
+    """
+    Loads an instance through the binary instance cache.
+
+    The cache key is a hash of the file content, so renamed or copied instance
+    files share an entry and edited files are parsed again. On a hit the arrays
+    are read from their `.npy` files and no text parsing happens; on a miss the
+    file is parsed with `parse_instance_bytes` and written to the cache.
+
+    Args:
+        filepath (str): The path to the text file containing the kidney exchange data.
+        cache_dir (str): Directory holding the cache entries. Defaults to the
+            KEP_CACHE_DIR environment variable, or a `.cache` directory next to
+            the instance file.
+        mmap_mode (str): Passed to `open_instance`; "r" maps the cached arrays
+            read-only instead of reading them into memory.
+
+    Returns:
+        Instance: The loaded instance.
+    """
+    with open(filepath, "rb") as f:
+        raw = f.read()
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(
+            "KEP_CACHE_DIR",
+            os.path.join(os.path.dirname(os.path.abspath(filepath)), ".cache"),
+        )
+    entry = os.path.join(cache_dir, f"{instance_hash(raw)}.v{CACHE_VERSION}")
+
+    if not os.path.isdir(entry):
+        save_instance(parse_instance_bytes(raw), entry)
+    return open_instance(entry, mmap_mode=mmap_mode)
+
+
+def instance_hash(raw):
+    return hashlib.sha256(raw).hexdigest()
+
+
+def open_instance(entry, mmap_mode=None):
+    """
+    Opens an instance stored with `save_instance`.
+
+    With mmap_mode="r" the arrays are memory-mapped read-only: nothing is copied,
+    and worker processes that open the same entry share its pages through the
+    operating system's page cache.
+    """
+    arrays = {
+        name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in CACHED_ARRAYS
+    }
+    num_pairs, num_ndd = np.load(os.path.join(entry, "header.npy")).tolist()
+    return Instance(num_pairs=num_pairs, num_ndd=num_ndd, path=entry, **arrays)
+
+
+def share_instance(instance):
+    """
+    Returns a directory from which worker processes can map `instance` with
+    `open_instance(path, mmap_mode="r")`. Instances that came from the cache are
+    shared through their cache entry; others are written once to a temporary
+    directory in SHARED_DIR, removed when the instance is garbage collected or
+    the interpreter exits, so repeated runs leave nothing behind in RAM.
+    """
+    if instance.path is not None:
+        return instance.path
+    if instance.shared is None:
+        directory = tempfile.mkdtemp(prefix="kep-", dir=SHARED_DIR)
+        weakref.finalize(instance, shutil.rmtree, directory, True)
+        instance.shared = os.path.join(directory, f"instance.v{CACHE_VERSION}")
+        save_instance(instance, instance.shared)
+    return instance.shared
+
+
+def save_instance(instance, entry):
+    # write into a temporary directory first and rename it, so concurrent runs
+    # never see a partially written entry
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=os.path.dirname(entry))
+    try:
+        np.save(
+            os.path.join(tmp, "header.npy"),
+            np.array([instance.num_pairs, instance.num_ndd], dtype=np.int64),
+        )
+        for name in CACHED_ARRAYS:
+            np.save(os.path.join(tmp, f"{name}.npy"), getattr(instance, name))
+        os.rename(tmp, entry)
+    except OSError:
+        # another process stored the same entry first
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,382 @@
+import time
+import numpy as np
+import gurobipy as gp
+from gurobipy import GRB
+from allocation_generalized import Allocation
+from cycle_chain_deactivation_generalized import TIMEOUT
+import reduction
+
+
+def run_picef(data, output_file_path, max_cycle_length=3, max_chain_length=4):
+    """
+    Solves the instance with the position-indexed formulation of `build_model`
+    instead of the cycle formulation, so no cycle or chain is enumerated. The
+    objectives of `Allocation.generate_objectives` are optimized one after the
+    other on the same model, each optimal value being fixed by a constraint
+    before the next. The selected cycles and chains are read back from the arc
+    variables and written like those of `run_cycle_chain_deactivation`.
+    """
+    start_time = time.time()
+
+    allo = Allocation(max_cycle_length, max_chain_length)
+    allo.attach(data)
+    model, objectives, cycle_arcs, chain_arcs = build_model(allo)
+    initialization_time = time.time() - start_time
+
+    start_optimization_time = time.time()
+    num_objectives = len(allo.objectives)
+    allo.objectiveValues = [None] * num_objectives
+    allo.fails = [0] * num_objectives
+    allo.objectiveTimes = [0] * num_objectives
+    allo.info.opt = True
+
+    for i, objective in enumerate(allo.objectives):
+        start_objective_time = time.time()
+        print(f"Objective {i} ({objective['name']})")
+        model.setObjective(objectives[i], objective["sense"])
+        model.setParam("TimeLimit", TIMEOUT - (time.time() - start_optimization_time))
+        model.setParam("MIPGap", 0)
+        model.optimize()
+
+        if model.SolCount < 1:
+            print(f"Failed to optimize objective {i}.")
+            allo.objectiveValues[i] = -1
+            allo.info.opt = False
+            break
+
+        # fix the value of this objective for the next ones
+        value = round(model.ObjVal)
+        allo.objectiveValues[i] = value
+        if model.Status != GRB.OPTIMAL:
+            allo.info.opt = False
+        model.addConstr(objectives[i] == value)
+        allo.objectiveTimes[i] = time.time() - start_objective_time
+
+    # update allocation information
+    allo.info.nbVar = model.NumVars
+    allo.info.nbCons = model.NumConstrs
+    allo.info.nbNZ = model.NumNZs
+    selected_ids = []
+    if model.SolCount > 0:
+        allo.info.UB = round(model.ObjBound)
+        allo.info.LB = round(model.ObjVal)
+        read_solution(allo, model, cycle_arcs, chain_arcs)
+        selected_ids = list(range(len(allo.cyclechains)))
+
+    end_time = time.time()
+    allo.info.timeCPU.append(end_time - start_time)
+    allo.info.timeCPU.append(initialization_time)
+    allo.info.timeCPU.append(end_time - start_optimization_time)
+
+    allo.printAndWriteInfo(selected_ids, output_file_path)
+
+
+def cycle_arc_positions(instance, keep, max_length):
+    """
+    Returns (copy, arc, position) arrays with one entry per variable of the
+    position-indexed edge formulation (PIEF) of the cycles of at most
+    `max_length` vertices.
+
+    Copy l of the graph holds the cycles whose smallest vertex is l, over the
+    kept arcs between pairs not smaller than l. Arc i -> j takes position p in
+    copy l when it can be the p-th arc of such a cycle: a breadth-first search
+    from l gives the fewest arcs from l to i (at most p - 1), and one towards l
+    those from j back to l (at most max_length - p). Arcs leaving l take
+    position 1 only, and arcs entering l close the cycle, at positions 2 up to
+    max_length.
+    """
+    n = instance.max_id + 1
+    donors = instance.donor_ids.astype(np.int64)
+    patients = instance.patient_ids.astype(np.int64)
+    is_pair = ~instance.is_ndd
+    pair_ids = np.sort(instance.ids[is_pair])
+    is_pair_id = np.zeros(n, dtype=np.bool_)
+    is_pair_id[pair_ids] = True
+    usable = keep & is_pair_id[donors] & is_pair_id[patients]
+
+    copies, arcs, positions = [], [], []
+    if max_length < 2:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    for l in pair_ids.tolist():
+        in_copy = np.flatnonzero(usable & (donors >= l) & (patients >= l))
+        if len(in_copy) == 0:
+            continue
+        tails = donors[in_copy]
+        heads = patients[in_copy]
+
+        # arcs from l, and arcs back to l, within the copy
+        forward = np.full(n, max_length, dtype=np.int64)
+        backward = np.full(n, max_length, dtype=np.int64)
+        forward[l] = backward[l] = 0
+        for hops in range(1, max_length):
+            reached = heads[forward[tails] == hops - 1]
+            forward[reached] = np.minimum(forward[reached], hops)
+            reached = tails[backward[heads] == hops - 1]
+            backward[reached] = np.minimum(backward[reached], hops)
+
+        first = np.maximum(forward[tails] + 1, np.where(tails == l, 1, 2))
+        last = np.where(heads == l, max_length, max_length - backward[heads])
+        last = np.where(tails == l, np.minimum(last, 1), last)
+        count = np.maximum(last - first + 1, 0)
+        arcs.append(np.repeat(in_copy, count))
+        positions.append(
+            np.repeat(first, count)
+            + np.arange(count.sum())
+            - np.repeat(np.cumsum(count) - count, count)
+        )
+        copies.append(np.full(count.sum(), l, dtype=np.int64))
+    if not arcs:
+        return (np.zeros(0, dtype=np.int64),) * 3
+    return np.concatenate(copies), np.concatenate(arcs), np.concatenate(positions)
+
+
+def chain_arc_positions(instance, keep, max_length):
+    """
+    Returns (arc, position) arrays with one entry per variable of the
+    position-indexed chain arcs (PICEF) for chains of at most `max_length`
+    vertices: arcs leaving an NDD take position 1, and an arc leaving a pair d
+    arcs away from its nearest NDD takes positions d + 1 up to max_length - 1.
+    """
+    n = instance.max_id + 1
+    donors = instance.donor_ids.astype(np.int64)
+    patients = instance.patient_ids.astype(np.int64)
+    depth = np.full(n, max(max_length, 1), dtype=np.int64)
+    depth[instance.ids[instance.is_ndd]] = 0
+    for hops in range(1, max_length - 1):
+        reached = patients[keep & (depth[donors] == hops - 1)]
+        depth[reached] = np.minimum(depth[reached], hops)
+
+    is_ndd = np.zeros(n, dtype=np.bool_)
+    is_ndd[instance.ids[instance.is_ndd]] = True
+    first = depth[donors] + 1
+    last = np.where(is_ndd[donors], min(max_length - 1, 1), max_length - 1)
+    count = np.where(keep, np.maximum(last - first + 1, 0), 0)
+    arcs = np.repeat(np.arange(len(donors)), count)
+    positions = (
+        np.repeat(first, count)
+        + np.arange(count.sum())
+        - np.repeat(np.cumsum(count) - count, count)
+    )
+    return arcs, positions
+
+
+def build_model(allo):
+    """
+    Builds the position-indexed chain-edge formulation (PICEF) of the attached
+    instance of `allo`: binary variables for the cycle arcs of each copy and
+    position (`cycle_arc_positions`) and for the chain arcs of each position
+    (`chain_arc_positions`). Its size grows with k and the number of arcs,
+    not with the number of cycles and chains.
+
+    Constraints:
+    - each pair receives at most one kidney, in a cycle or a chain,
+    - each NDD donates at most once,
+    - in every copy, a pair entered at position p is left at position p + 1,
+    - a pair only donates in a chain at position p + 1 if it received at p.
+
+    Returns the model, one linear expression per objective of
+    `allo.objectives`, and the (copy, arc) and arc of every cycle and chain
+    variable, in variable order.
+
+    Transplants, score and the number of cycles and chains of each size are
+    linear in the arc variables (a chain of L vertices has an arc at position
+    L - 1 but none at L). Back arcs need to know whether two pairs lie in the
+    same cycle or chain, and in which order; every arc u -> w between pairs
+    gets a binary variable that may be 1 only when the arc is a back arc of
+    the selected solution, as `enumeration.back_arcs_and_score` counts them:
+    - in a cycle, u and w lie in the same copy (the copy index of their
+      in-arcs agrees) and w comes at least two positions before u (the start
+      of a copy being at position 0),
+    - in a chain, u donates further, and u and w carry the same chain label
+      and w comes before u. Labels are continuous variables equal along
+      selected chain arcs and fixed to a distinct value at each NDD.
+    The back-arc variables are bounded from above only, so they count the
+    back arcs exactly when the number of back arcs is maximized, and, once
+    fixed to that maximum, in the objectives after it.
+    """
+    instance = allo.instance
+    keep = allo.keptArcs
+    if keep is None:
+        keep = reduction.reduce_arcs(
+            instance, allo.max_cycle_length, allo.max_chain_length
+        )
+    donors = instance.donor_ids.astype(np.int64)
+    patients = instance.patient_ids.astype(np.int64)
+    weights = instance.weights.astype(np.int64)
+    n = allo.maxId + 1
+    k = allo.max_cycle_length
+    h = allo.max_chain_length
+
+    copies, cycle_arcs, cycle_positions = cycle_arc_positions(instance, keep, k)
+    chain_arcs, chain_positions = chain_arc_positions(instance, keep, h)
+
+    model = gp.Model("PICEF")
+    x = list(model.addVars(len(cycle_arcs), vtype=GRB.BINARY).values())
+    y = list(model.addVars(len(chain_arcs), vtype=GRB.BINARY).values())
+
+    def grouped(keys, variables, coefficients=None):
+        # linear expression per key, summing the variables with that key
+        expressions = {}
+        for position, key in enumerate(keys):
+            expressions.setdefault(key, []).append(position)
+        return {
+            key: gp.LinExpr(
+                (
+                    [1.0] * len(positions)
+                    if coefficients is None
+                    else [float(coefficients[p]) for p in positions]
+                ),
+                [variables[p] for p in positions],
+            )
+            for key, positions in expressions.items()
+        }
+
+    cycle_tails = donors[cycle_arcs].tolist()
+    cycle_heads = patients[cycle_arcs].tolist()
+    chain_tails = donors[chain_arcs].tolist()
+    chain_heads = patients[chain_arcs].tolist()
+    copies_list = copies.tolist()
+    cycle_positions_list = cycle_positions.tolist()
+    chain_positions_list = chain_positions.tolist()
+
+    # in-arcs of each pair, over cycles and chains
+    cycle_in = grouped(cycle_heads, x)
+    chain_in = grouped(chain_heads, y)
+    chain_out = grouped(chain_tails, y)
+    for v in set(cycle_in) | set(chain_in):
+        model.addConstr(
+            cycle_in.get(v, gp.LinExpr()) + chain_in.get(v, gp.LinExpr()) <= 1
+        )
+    for v in instance.ids[instance.is_ndd].tolist():
+        if v in chain_out:
+            model.addConstr(chain_out[v] <= 1)
+
+    # flow conservation of the cycles, per copy, vertex and position
+    entering = grouped(list(zip(copies_list, cycle_heads, cycle_positions_list)), x)
+    leaving = grouped(
+        list(zip(copies_list, cycle_tails, [p - 1 for p in cycle_positions_list])),
+        x,
+    )
+    for key in set(entering) | set(leaving):
+        l, v, p = key
+        if v != l:
+            model.addConstr(
+                entering.get(key, gp.LinExpr()) == leaving.get(key, gp.LinExpr())
+            )
+
+    # chains only continue from pairs that received at the previous position
+    chain_entering = grouped(list(zip(chain_heads, chain_positions_list)), y)
+    chain_leaving = grouped(
+        list(zip(chain_tails, [p - 1 for p in chain_positions_list])), y
+    )
+    ndds = set(instance.ids[instance.is_ndd].tolist())
+    for key, expression in chain_leaving.items():
+        if key[0] not in ndds:
+            model.addConstr(expression <= chain_entering.get(key, gp.LinExpr()))
+
+    # objectives that are linear in the arc variables
+    transplants = gp.quicksum(x) + gp.quicksum(y)
+    score = gp.LinExpr(weights[cycle_arcs].tolist(), x) + gp.LinExpr(
+        weights[chain_arcs].tolist(), y
+    )
+    closing = {}
+    for variable, l, head, p in zip(x, copies_list, cycle_heads, cycle_positions_list):
+        if head == l:
+            closing.setdefault(p, gp.LinExpr()).addTerms(1.0, variable)
+    chain_level = grouped(chain_positions_list, y)
+
+    def size_count(length):
+        # cycles closing at position L, and chains with an arc at L - 1 but none at L
+        return (
+            closing.get(length, gp.LinExpr())
+            + chain_level.get(length - 1, gp.LinExpr())
+            - chain_level.get(length, gp.LinExpr())
+        )
+
+    # back arcs: position and copy (as a label) of the in-arc of each pair
+    cycle_position = grouped(
+        cycle_heads,
+        x,
+        [
+            0 if head == l else p
+            for l, head, p in zip(copies_list, cycle_heads, cycle_positions_list)
+        ],
+    )
+    cycle_label = grouped(cycle_heads, x, copies_list)
+    chain_position = grouped(chain_heads, y, chain_positions_list)
+
+    label = {}
+    for index, ndd in enumerate(sorted(ndds)):
+        label[ndd] = index + 1
+    for v in chain_in:
+        label[v] = model.addVar(lb=0, ub=len(ndds))
+    chain_used = grouped(list(zip(chain_tails, chain_heads)), y)
+    for (i, j), used in chain_used.items():
+        model.addConstr(label[j] - label[i] <= len(ndds) * (1 - used))
+        model.addConstr(label[i] - label[j] <= len(ndds) * (1 - used))
+
+    back_arcs = gp.LinExpr()
+    for u, w in zip(donors.tolist(), patients.tolist()):
+        if u in cycle_in and w in cycle_in:
+            z = model.addVar(vtype=GRB.BINARY)
+            model.addConstr(z <= cycle_in[u])
+            model.addConstr(z <= cycle_in[w])
+            model.addConstr(cycle_label[u] - cycle_label[w] <= n * (1 - z))
+            model.addConstr(cycle_label[w] - cycle_label[u] <= n * (1 - z))
+            model.addConstr(cycle_position[u] - cycle_position[w] >= (k + 2) * z - k)
+            back_arcs += z
+        if u in chain_in and w in chain_in and u in chain_out:
+            z = model.addVar(vtype=GRB.BINARY)
+            model.addConstr(z <= chain_out[u])
+            model.addConstr(z <= chain_in[w])
+            model.addConstr(label[u] - label[w] <= len(ndds) * (1 - z))
+            model.addConstr(label[w] - label[u] <= len(ndds) * (1 - z))
+            model.addConstr(chain_position[u] - chain_position[w] >= (h + 1) * z - h)
+            back_arcs += z
+
+    objectives = []
+    for objective in allo.objectives:
+        if objective["name"] == "Maximize Total Transplants":
+            objectives.append(transplants)
+        elif "size" in objective:
+            objectives.append(size_count(objective["size"]))
+        elif objective["name"] == "Maximize Number of Back Arcs":
+            objectives.append(back_arcs)
+        elif objective["name"] == "Maximize Total Score/Weight":
+            objectives.append(score)
+
+    return (
+        model,
+        objectives,
+        list(zip(copies_list, cycle_arcs.tolist())),
+        chain_arcs.tolist(),
+    )
+
+
+def read_solution(allo, model, cycle_arcs, chain_arcs):
+    # rebuild the selected cycles and chains from the arc variables into the
+    # store of allo, cycles from their smallest vertex
+    instance = allo.instance
+    values = model.getAttr("X", model.getVars())
+    successor = {}
+    for (l, arc), value in zip(cycle_arcs, values):
+        if value > 0.5:
+            successor[(l, int(instance.donor_ids[arc]))] = int(
+                instance.patient_ids[arc]
+            )
+    for l in sorted({l for l, _ in successor}):
+        nodes = [l]
+        while successor[(l, nodes[-1])] != l:
+            nodes.append(successor[(l, nodes[-1])])
+        allo.add_cycle_chain(nodes, is_chain=False)
+
+    successor = {}
+    for arc, value in zip(chain_arcs, values[len(cycle_arcs) :]):
+        if value > 0.5:
+            successor[int(instance.donor_ids[arc])] = int(instance.patient_ids[arc])
+    for ndd in sorted(instance.ids[instance.is_ndd].tolist()):
+        if ndd in successor:
+            nodes = [ndd]
+            while nodes[-1] in successor:
+                nodes.append(successor[nodes[-1]])
+            allo.add_cycle_chain(nodes, is_chain=True)
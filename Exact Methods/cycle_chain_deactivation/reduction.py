@@ -0,0 +1,93 @@
+import numpy as np
+import scipy.sparse as sp
+
+# entries of the reach matrix computed at a time (one block of rows, float32)
+REACH_BLOCK_ENTRIES = 1 << 22
+
+
+def reduce_arcs(instance, max_cycle_length, max_chain_length):
+    """
+    Returns a boolean mask over the arcs of `instance` (in CSR order) that is
+    False for the arcs that can lie on no cycle of at most `max_cycle_length`
+    vertices and on no chain of at most `max_chain_length` vertices.
+
+    An arc u -> v can close a cycle only if v reaches u again within
+    max_cycle_length - 1 arcs. This is read from a reach matrix, built as
+    reach_1 = A and reach_t = A | reach_(t-1) A with A the sparse adjacency
+    matrix of the CSR arrays, one block of REACH_BLOCK_ENTRIES entries (rows
+    of start vertices) at a time, so it never holds (max_id + 1)^2 entries.
+    An arc u -> v can extend a chain only if u is an NDD, or a pair at most
+    max_chain_length - 2 arcs away from an NDD (a breadth-first search from all
+    NDDs at once). Pairs
+    without in-arcs, or that no NDD reaches in time, thus lose all their arcs.
+
+    Both tests only drop arcs that no cycle or chain can use, so searching the
+    kept arcs finds the same cycles and chains. Repeating them on the kept arcs
+    drops nothing more: the arcs of the shortest paths that keep an arc lie on
+    a cycle or chain as short, and pass the tests themselves.
+    """
+    n = instance.max_id + 1
+    donors = instance.donor_ids
+    patients = instance.patient_ids
+    keep = np.zeros(instance.num_arcs, dtype=np.bool_)
+
+    # cycles: u -> v is kept when a path v -> ... -> u closes it in time
+    if max_cycle_length >= 2:
+        adjacency = sp.csr_matrix(
+            (np.ones(instance.num_arcs, dtype=np.float32), patients, instance.offsets),
+            shape=(n, n),
+        )
+        block = max(1, REACH_BLOCK_ENTRIES // n)
+        for start in range(0, n, block):
+            stop = min(start + block, n)
+            first = adjacency[start:stop].toarray()
+            reach = first
+            for _ in range(max_cycle_length - 2):
+                reach = np.minimum(first + reach @ adjacency, 1)
+            # arcs u -> v with v in the block, by the reverse CSR
+            arcs = instance.in_arcs[instance.in_offsets[start] : instance.in_offsets[stop]]
+            keep[arcs] |= reach[patients[arcs] - start, donors[arcs]] > 0
+
+    # chains: u -> v is kept when u is close enough to an NDD
+    depth = np.full(n, max(max_chain_length, 0), dtype=np.int64)
+    depth[instance.ids[instance.is_ndd]] = 0
+    for hops in range(1, max_chain_length - 1):
+        reached = patients[depth[donors] == hops - 1]
+        depth[reached] = np.minimum(depth[reached], hops)
+    keep |= depth[donors] <= max_chain_length - 2
+    return keep
+
+
+def removed_vertices(instance, keep):
+    # vertices that had arcs but have none left among the kept ones
+    n = instance.max_id + 1
+    before = np.bincount(instance.donor_ids, minlength=n) + np.bincount(
+        instance.patient_ids, minlength=n
+    )
+    after = np.bincount(instance.donor_ids[keep], minlength=n) + np.bincount(
+        instance.patient_ids[keep], minlength=n
+    )
+    return int(((before > 0) & (after == 0)).sum())
+
+
+def component_labels(instance, keep):
+    """
+    Returns label, where label[v] is the smallest vertex id of the weakly
+    connected component of vertex v in the graph of the kept arcs.
+
+    Labels are found by propagating the smallest label along the kept arcs in
+    both directions, with pointer jumping (label = label[label]) so that each
+    round also follows the labels already found; a few rounds suffice.
+    """
+    label = np.arange(instance.max_id + 1)
+    donors = instance.donor_ids[keep]
+    patients = instance.patient_ids[keep]
+    while True:
+        low = np.minimum(label[donors], label[patients])
+        new = label.copy()
+        np.minimum.at(new, donors, low)
+        np.minimum.at(new, patients, low)
+        new = new[new]
+        if np.array_equal(new, label):
+            return label
+        label = new
@@ -1,116 +1,66 @@
 import sys
 import os
+import time
 from allocation import Allocation as NormalAllocation
 from allocation_generalized import Allocation as GeneralizedAllocation
-from cycle_chain_deactivation import run_cycle_chain_deactivation as normal_run
+from instance import load_instance
 from cycle_chain_deactivation_generalized import (
     run_cycle_chain_deactivation as generalized_run,
 )
+from solvers import SOLVERS
 
 
-def import_kidney_data(filepath):
+def count_report(data, output_file_path, max_cycle_length, max_chain_length):
     """
-    Imports kidney exchange data from a text file and structures it into a dictionary.
-
-    Args:
-        filepath (str): The path to the text file containing the kidney exchange data.
-
-    Returns:
-        dict: A dictionary containing the following keys:
-            - num_pairs (int): The number of pairs (donor-patient pairs) in the instance.
-            - num_ndd (int): The number of non-directed donors (NDDs) in the instance.
-            - num_arcs (int): The total number of arcs in the instance.
-            - pairs (list): A list of dictionaries, each representing a pair or NDD with the following keys:
-                - id (int): The unique ID of the pair.
-                - is_ndd (bool): True if the pair is an NDD, False otherwise.
-                - donor_blood_type (int): Donor's blood type (0 = A, 1 = B, 2 = AB, 3 = O).
-                - patient_blood_type (int): Patient's blood type (0 = A, 1 = B, 2 = AB, 3 = O).
-                - patient_vpra (int): Patient's vPRA score (0 = below 0.5, 1 = between 0.5 and 0.85, 2 = above 0.85).
-            - arcs (list): A list of dictionaries representing the arcs between pairs with the following keys:
-                - donor_id (int): ID of the donor pair.
-                - patient_id (int): ID of the patient pair.
-                - weight (int): The weight of the arc (always 1 in this case).
-
-    Example:
-        data = import_kidney_data('path/to/data.txt')
-        print(data['num_pairs'])  # Output: Number of pairs in the instance
-    """
-
-    data = {}
-
-    # Open the file and read all lines into memory
-    with open(filepath, "r") as f:
-        lines = f.readlines()
-
-        # Parse metadata: number of pairs, NDDs, and arcs
-        num_pairs = int(lines[0].split(" ")[2])
-        num_ndd = int(lines[1].split(" ")[2])
-        num_arcs = int(lines[2].split(" ")[2])
-
-        # Store the parsed values in the data dictionary
-        data["num_pairs"] = num_pairs
-        data["num_ndd"] = num_ndd
-        data["num_arcs"] = num_arcs
-
-        # Total number of entities (pairs + NDDs)
-        num_things = num_pairs + num_ndd
-
-        # List to store information about pairs and NDDs
-        pairs = []
-
-        # Parse each line corresponding to pairs and NDDs
-        for line in lines[3 : num_things + 3]:
-            id, is_ndd, donor_blood_type, patient_blood_type, patient_vpra = map(
-                int, line.strip().split(",")
-            )
-
-            # Add pair/NDD info to the list
-            pairs.append(
-                {
-                    "id": id,
-                    "is_ndd": bool(is_ndd),
-                    "donor_blood_type": donor_blood_type,
-                    "patient_blood_type": patient_blood_type,
-                    "patient_vpra": patient_vpra,
-                }
-            )
+    Writes and prints the number of cycles and chains of each size, and the size
+    of the cycle formulation they make, without enumerating them. The vertices
+    and arcs removed by the graph reduction are reported as well.
 
-        # Store the pairs data in the dictionary
-        data["pairs"] = pairs
-
-        # List to store information about arcs
-        arcs = []
-
-        # Parse each line corresponding to arcs (donor-patient relationships)
-        for line in lines[num_things + 3 :]:
-            arc, weight = line.strip().split(",1,")
-
-            # Extract donor and patient IDs from the arc
-            donor_id, patient_id = arc.split(",")
-            weight = int(weight.strip())  # Weight is always 1 in this context
-            donor_id = int(donor_id[1:])  # Remove prefix and convert to int
-            patient_id = int(patient_id[:-1])  # Remove suffix and convert to int
-
-            # Add arc info to the list
-            arcs.append(
-                {
-                    "donor_id": donor_id,
-                    "patient_id": patient_id,
-                    "weight": weight,
-                }
-            )
-
-        # Store the arcs data in the dictionary
-        data["arcs"] = arcs
-
-    # Return the final structured dictionary
-    return data
+    Columns take 26 bytes each in a `CycleChainStore`, plus 4 per vertex for a
+    cycle and 4 for a chain (its last vertex in the prefix tree).
+    """
+    start = time.time()
+    allocation = GeneralizedAllocation(max_cycle_length, max_chain_length)
+    allocation.attach(data)
+    cycle_counts, chain_counts = allocation.count()
+
+    num_cycles = sum(cycle_counts)
+    num_chains = sum(chain_counts)
+    nonzeros = sum(size * count for size, count in enumerate(cycle_counts)) + sum(
+        size * count for size, count in enumerate(chain_counts)
+    )
+    store_bytes = (
+        sum((26 + 4 * size) * count for size, count in enumerate(cycle_counts))
+        + 30 * num_chains
+    )
+
+    info = {
+        "Max Cycle Length": max_cycle_length,
+        "Max Chain Length": max_chain_length,
+    }
+    for size in range(2, len(cycle_counts)):
+        info[f"Cycles of Size {size}"] = cycle_counts[size]
+    for size in range(1, len(chain_counts)):
+        info[f"Chains of Size {size}"] = chain_counts[size]
+    info["Total Cycles"] = num_cycles
+    info["Total Chains"] = num_chains
+    info["Total Cycles and Chains"] = num_cycles + num_chains
+    info["Number of Non-Zeros"] = nonzeros
+    info["Estimated Storage (MB)"] = round(store_bytes / 2**20, 1)
+    info["Removed Vertices"] = allocation.info.removedVertices
+    info["Removed Arcs"] = allocation.info.removedArcs
+    info["Counting Time (s)"] = time.time() - start
+
+    with open(output_file_path, "w") as f:
+        for label, value in info.items():
+            f.write(f"{label}: {value}\n")
+            print(f"{label}: {value}")
 
 
 if __name__ == "__main__":
     if len(sys.argv) < 3:
         print(
-            "Usage: python3 run.py <input_file> <output_file> [-g] [-c <max_cycle_length>] [-h <max_chain_length>]"
+            "Usage: python3 run.py <input_file> <output_file> [-g] [-n] [-m <method>] [-t <search>] [-p <levels>] [-b <backend>] [-i] [-c <max_cycle_length>] [-h <max_chain_length>] [-w <workers>]"
         )
         sys.exit(1)
 
@@ -121,18 +71,101 @@ if __name__ == "__main__":
     generalized = False
     max_cycle_length = 3
     max_chain_length = 4
-
-    # Parse additional arguments for generalized version
+    workers = 1
+    method = "deactivation"
+    search = "linear"
+    speculative = 1
+    backend = "gurobi"
+    warm_start = False
+
+    # Parse additional arguments for generalized version and count-only mode
     if "-g" in sys.argv:
         generalized = True
+    if "-m" in sys.argv:
+        # exact engine of the generalized version: deactivation, hierarchical,
+        # picef or colgen
+        method = sys.argv[sys.argv.index("-m") + 1]
+        if method not in ("deactivation", "hierarchical", "picef", "colgen"):
+            print(
+                f"Unknown method {method}, expected deactivation, hierarchical, picef or colgen"
+            )
+            sys.exit(1)
+        generalized = True
+    if "-t" in sys.argv:
+        # target search of the deactivation loop: linear or bisection
+        search = sys.argv[sys.argv.index("-t") + 1]
+        if search not in ("linear", "bisection"):
+            print(f"Unknown target search {search}, expected linear or bisection")
+            sys.exit(1)
+        generalized = True
+    if "-p" in sys.argv:
+        # deactivation targets solved at once on a process pool
+        speculative = int(sys.argv[sys.argv.index("-p") + 1])
+        if speculative > 1 and search == "bisection":
+            print("The -p and -t bisection flags are different target searches, use one")
+            sys.exit(1)
+        generalized = True
+    if "-b" in sys.argv:
+        # solver of the LPs and ILPs of the deactivation loop: gurobi or highs
+        backend = sys.argv[sys.argv.index("-b") + 1]
+        if backend not in SOLVERS:
+            print(f"Unknown backend {backend}, expected {' or '.join(SOLVERS)}")
+            sys.exit(1)
+        if backend != "gurobi" and method != "deactivation":
+            print(f"The {method} method requires the gurobi backend")
+            sys.exit(1)
+        generalized = True
+    if "-i" in sys.argv:
+        # heuristic solution as MIP start of the deactivation loop
+        if method in ("picef", "colgen"):
+            print(f"The {method} method does not take a MIP start")
+            sys.exit(1)
+        warm_start = True
+        generalized = True
+    if generalized or "-n" in sys.argv:
         if "-c" in sys.argv:
             max_cycle_length = int(sys.argv[sys.argv.index("-c") + 1])
         if "-h" in sys.argv:
             max_chain_length = int(sys.argv[sys.argv.index("-h") + 1])
+        if "-w" in sys.argv:
+            workers = int(sys.argv[sys.argv.index("-w") + 1])
+
+    data = load_instance(file_path, mmap_mode="r")
+
+    if "-n" in sys.argv:
+        print(
+            f"Counting cycles and chains with max cycle length {max_cycle_length} and max chain length {max_chain_length}..."
+        )
+        count_report(data, output_file_path, max_cycle_length, max_chain_length)
+        sys.exit(0)
 
-    data = import_kidney_data(file_path)
+    # the normal version, PICEF and column generation need gurobipy, so they
+    # are imported only when selected: with -b highs, run.py runs without it
+    if generalized and method == "picef":
+        from picef import run_picef
 
-    if generalized:
+        print(
+            f"Running position-indexed model with max cycle length {max_cycle_length} and max chain length {max_chain_length}..."
+        )
+        run_picef(
+            data,
+            output_file_path,
+            max_cycle_length=max_cycle_length,
+            max_chain_length=max_chain_length,
+        )
+    elif generalized and method == "colgen":
+        from colgen import run_column_generation
+
+        print(
+            f"Running column generation with max cycle length {max_cycle_length} and max chain length {max_chain_length}..."
+        )
+        run_column_generation(
+            data,
+            output_file_path,
+            max_cycle_length=max_cycle_length,
+            max_chain_length=max_chain_length,
+        )
+    elif generalized:
         print(
             f"Running generalized version with max cycle length {max_cycle_length} and max chain length {max_chain_length}..."
         )
@@ -141,8 +174,16 @@ if __name__ == "__main__":
             output_file_path,
             max_cycle_length=max_cycle_length,
             max_chain_length=max_chain_length,
+            workers=workers,
+            hierarchical=method == "hierarchical",
+            search=search,
+            speculative=speculative,
+            backend=backend,
+            warm_start=warm_start,
         )
     else:
+        from cycle_chain_deactivation import run_cycle_chain_deactivation as normal_run
+
         print(
             "Running normal version with fixed max cycle length 3 and max chain length 4..."
         )
@@ -12,8 +12,16 @@ skip_patterns=("A.*")
 generalized_flag=false
 max_cycle_length=""
 max_chain_length=""
+workers=""
+count_flag=false
+limit=""
+method=""
+search=""
+speculative=""
+backend=""
+warm_start=false
 
-while getopts ":f:as:c:h:g" opt; do
+while getopts ":f:as:c:h:gw:nl:m:t:p:b:i" opt; do
   case ${opt} in
     f )
       file=$OPTARG
@@ -33,9 +41,33 @@ while getopts ":f:as:c:h:g" opt; do
     h )
       max_chain_length=$OPTARG
       ;;
+    w )
+      workers=$OPTARG
+      ;;
+    n )
+      count_flag=true
+      ;;
+    l )
+      limit=$OPTARG
+      ;;
+    m )
+      method=$OPTARG
+      ;;
+    t )
+      search=$OPTARG
+      ;;
+    p )
+      speculative=$OPTARG
+      ;;
+    b )
+      backend=$OPTARG
+      ;;
+    i )
+      warm_start=true
+      ;;
     \? )
       echo "Invalid option: -$OPTARG" 1>&2
-      echo "Usage: $0 -f <filename>, -a, -g, -c <max_cycle_length>, -h <max_chain_length>, or -s <skip_pattern>"
+      echo "Usage: $0 -f <filename>, -a, -g, -c <max_cycle_length>, -h <max_chain_length>, -w <workers>, -n, -l <limit>, -m <method>, -t <search>, -p <levels>, -b <backend>, -i, or -s <skip_pattern>"
       exit 1
       ;;
     : )
@@ -55,6 +87,13 @@ should_skip_file() {
     return 1
 }
 
+# cycle and chain lengths of the run, for counting (defaults of run.py if not set)
+length_args() {
+    if [ "$generalized_flag" = true ]; then
+        echo -c "$max_cycle_length" -h "$max_chain_length"
+    fi
+}
+
 run_instance() {
     local input_file="$1"
     local output_file="$2"
@@ -64,8 +103,56 @@ run_instance() {
             echo "Error: When using the -g flag, you must specify both -c <max_cycle_length> and -h <max_chain_length>."
             exit 1
         fi
+    elif [ -n "$method" ] || [ -n "$search" ] || [ -n "$speculative" ] || [ -n "$backend" ] || [ "$warm_start" = true ]; then
+        echo "Error: The -m, -t, -p, -b and -i flags select the engine, target search, solver and MIP start of the generalized version and require -g."
+        exit 1
+    fi
+
+    if [ "$count_flag" = true ]; then
+        echo "Counting cycles and chains for $input_file"
+        python3 "$script_dir/run.py" "$input_file" "${output_file%_SOLUTION.txt}_COUNTS.txt" -n $(length_args)
+        return
+    fi
+
+    # skip instances whose model would have more cycles and chains than the limit;
+    # the position-indexed model and column generation enumerate none, so they
+    # are never skipped
+    if [ -n "$limit" ] && [ "$method" != "picef" ] && [ "$method" != "colgen" ]; then
+        local total
+        total=$(python3 "$script_dir/run.py" "$input_file" /dev/null -n $(length_args) | sed -n 's/^Total Cycles and Chains: //p')
+        # no count if run.py -n failed, e.g. on a file that does not parse
+        if ! [[ "$total" =~ ^[0-9]+$ ]]; then
+            echo "Skipping $input_file: could not count its cycles and chains"
+            return
+        fi
+        if [ "$total" -gt "$limit" ]; then
+            echo "Skipping $input_file: $total cycles and chains exceed the limit of $limit"
+            return
+        fi
+    fi
+
+    if [ "$generalized_flag" = true ]; then
         echo "Running generalized version with max cycle length $max_cycle_length and max chain length $max_chain_length for $input_file"
-        python3 "$script_dir/run.py" "$input_file" "$output_file" -g -c "$max_cycle_length" -h "$max_chain_length"
+        local extra_args=()
+        if [ -n "$workers" ]; then
+            extra_args+=(-w "$workers")
+        fi
+        if [ -n "$method" ]; then
+            extra_args+=(-m "$method")
+        fi
+        if [ -n "$search" ]; then
+            extra_args+=(-t "$search")
+        fi
+        if [ -n "$speculative" ]; then
+            extra_args+=(-p "$speculative")
+        fi
+        if [ -n "$backend" ]; then
+            extra_args+=(-b "$backend")
+        fi
+        if [ "$warm_start" = true ]; then
+            extra_args+=(-i)
+        fi
+        python3 "$script_dir/run.py" "$input_file" "$output_file" -g -c "$max_cycle_length" -h "$max_chain_length" "${extra_args[@]}"
     else
         echo "Running normal version for $input_file"
         python3 "$script_dir/run.py" "$input_file" "$output_file"
@@ -92,6 +179,6 @@ elif [ "$all_flag" = true ]; then
     done
 else
     echo "Error: No arguments provided."
-    echo "Usage: $0 -f <filename>, -a, -g, -c <max_cycle_length>, -h <max_chain_length>, or -s <skip_pattern>"
+    echo "Usage: $0 -f <filename>, -a, -g, -c <max_cycle_length>, -h <max_chain_length>, -w <workers>, -n, -l <limit>, -m <method>, -t <search>, -p <levels>, -b <backend>, -i, or -s <skip_pattern>"
     exit 1
 fi
@@ -0,0 +1,274 @@
+import time
+import numpy as np
+
+# the backends are optional: only the one selected for a run must be installed
+try:
+    import gurobipy as gp
+    from gurobipy import GRB
+except ImportError:
+    gp = GRB = None
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# objective senses, with the values of Gurobi's GRB.MAXIMIZE and GRB.MINIMIZE
+MAXIMIZE = -1
+MINIMIZE = 1
+
+# statuses of a solve
+OPTIMAL = "optimal"
+INFEASIBLE = "infeasible"
+TIME_LIMIT = "time limit"
+INTERRUPTED = "interrupted"
+FAILED = "failed"
+
+
+class GurobiSolver:
+    """
+    Gurobi backend. The variables are one MVar and the rows are loaded in bulk
+    through the matrix API.
+    """
+
+    name = "gurobi"
+
+    def __init__(self, matrix, rhs):
+        if gp is None:
+            raise ImportError("The gurobi backend requires gurobipy")
+        self.model = gp.Model("cycleModel")
+        self.variables = self.model.addMVar(matrix.shape[1], lb=0, ub=1)
+        self.model.addMConstr(matrix, self.variables, GRB.LESS_EQUAL, rhs)
+        self.first_solution = None
+
+    def set_upper_bounds(self, upper):
+        self.variables.UB = upper
+
+    def set_integral(self, integral):
+        self.variables.VType = GRB.BINARY if integral else GRB.CONTINUOUS
+
+    def set_objective(self, coefficients, sense):
+        self.variables.Obj = coefficients
+        self.model.ModelSense = sense
+
+    def add_equality(self, coefficients, value):
+        self.model.addConstr(coefficients @ self.variables == value)
+
+    def set_time_limit(self, seconds):
+        self.model.setParam("TimeLimit", seconds)
+
+    def set_mip_gap(self, gap):
+        self.model.setParam("MIPGap", gap)
+
+    def set_threads(self, threads):
+        self.model.setParam("Threads", threads)
+
+    def set_start(self, values):
+        # Gurobi drops the start if it is infeasible
+        self.variables.Start = values
+
+    def basis(self):
+        return (
+            self.variables.VBasis,
+            self.model.getAttr("CBasis", self.model.getConstrs()),
+        )
+
+    def set_basis(self, basis):
+        # rows added since the basis was saved are basic
+        vbasis, cbasis = basis
+        constraints = self.model.getConstrs()
+        self.variables.VBasis = vbasis
+        self.model.setAttr(
+            "CBasis", constraints, cbasis + [0] * (len(constraints) - len(cbasis))
+        )
+
+    def solve(self, interrupt=None):
+        # interrupt: function polled during the solve, stopping it when true
+        self.first_solution = None
+
+        def callback(model, where):
+            if where == GRB.Callback.MIPSOL and self.first_solution is None:
+                self.first_solution = time.time()
+            if interrupt is not None and interrupt():
+                model.terminate()
+
+        self.model.optimize(callback)
+        return {
+            GRB.OPTIMAL: OPTIMAL,
+            GRB.INFEASIBLE: INFEASIBLE,
+            GRB.TIME_LIMIT: TIME_LIMIT,
+            GRB.INTERRUPTED: INTERRUPTED,
+        }.get(self.model.Status, FAILED)
+
+    def objective_value(self):
+        return self.model.ObjVal
+
+    def objective_bound(self):
+        return self.model.ObjBound
+
+    def has_solution(self):
+        return self.model.SolCount > 0
+
+    def incumbent_time(self):
+        # wall-clock time of the first ILP solution of the last solve, a MIP
+        # start included, or None
+        return self.first_solution
+
+    def values(self):
+        return self.variables.X
+
+    def reduced_costs(self):
+        return self.variables.RC
+
+    def size(self):
+        # numbers of variables, constraints and nonzeros
+        return self.model.NumVars, self.model.NumConstrs, self.model.NumNZs
+
+
+class HighsSolver:
+    """
+    HiGHS backend, open source and license-free. Columns and rows are passed in
+    bulk as arrays; binary variables are integer variables within [0, 1].
+    """
+
+    name = "highs"
+
+    def __init__(self, matrix, rhs):
+        if highspy is None:
+            raise ImportError("The highs backend requires highspy")
+        self.model = highspy.Highs()
+        self.num_vars = matrix.shape[1]
+        self.indices = np.arange(self.num_vars, dtype=np.int32)
+        self.model.addVars(
+            self.num_vars, np.zeros(self.num_vars), np.ones(self.num_vars)
+        )
+        matrix = matrix.tocsr()
+        self.model.addRows(
+            matrix.shape[0],
+            np.full(matrix.shape[0], -highspy.kHighsInf),
+            np.asarray(rhs, dtype=np.float64),
+            matrix.nnz,
+            matrix.indptr[:-1].astype(np.int32),
+            matrix.indices.astype(np.int32),
+            matrix.data.astype(np.float64),
+        )
+        self.integral = False
+        self.first_solution = None
+
+    def set_upper_bounds(self, upper):
+        self.model.changeColsBounds(
+            self.num_vars, self.indices, np.zeros(self.num_vars), upper
+        )
+
+    def set_integral(self, integral):
+        self.integral = integral
+        vtype = (
+            highspy.HighsVarType.kInteger
+            if integral
+            else highspy.HighsVarType.kContinuous
+        )
+        self.model.changeColsIntegrality(
+            self.num_vars, self.indices, np.full(self.num_vars, vtype)
+        )
+
+    def set_objective(self, coefficients, sense):
+        self.model.changeColsCost(self.num_vars, self.indices, coefficients)
+        self.model.changeObjectiveSense(
+            highspy.ObjSense.kMaximize
+            if sense == MAXIMIZE
+            else highspy.ObjSense.kMinimize
+        )
+
+    def add_equality(self, coefficients, value):
+        columns = np.flatnonzero(coefficients).astype(np.int32)
+        self.model.addRow(
+            value, value, len(columns), columns, coefficients[columns]
+        )
+
+    def set_time_limit(self, seconds):
+        self.model.setOptionValue("time_limit", float(seconds))
+
+    def set_mip_gap(self, gap):
+        self.model.setOptionValue("mip_rel_gap", gap)
+
+    def set_threads(self, threads):
+        self.model.setOptionValue("threads", threads)
+
+    def set_start(self, values):
+        solution = highspy.HighsSolution()
+        solution.col_value = list(values)
+        solution.value_valid = True
+        self.model.setSolution(solution)
+
+    def basis(self):
+        return self.model.getBasis()
+
+    def set_basis(self, basis):
+        # rows added since the basis was saved are basic
+        added = self.model.getNumRow() - len(basis.row_status)
+        basis.row_status = list(basis.row_status) + [
+            highspy.HighsBasisStatus.kBasic
+        ] * added
+        self.model.setBasis(basis)
+
+    def solve(self, interrupt=None):
+        # interrupt: function polled during the solve, stopping it when true;
+        # the flag is set on every call, as HiGHS keeps it from the last run
+        def callback(event):
+            event.interrupt(bool(interrupt()))
+
+        def improved(event):
+            if self.first_solution is None:
+                self.first_solution = time.time()
+
+        self.first_solution = None
+        self.model.cbMipImprovingSolution.subscribe(improved)
+        if interrupt is not None:
+            self.model.cbMipInterrupt.subscribe(callback)
+            self.model.cbSimplexInterrupt.subscribe(callback)
+        try:
+            self.model.run()
+        finally:
+            self.model.cbMipImprovingSolution.unsubscribe(improved)
+            if interrupt is not None:
+                self.model.cbMipInterrupt.unsubscribe(callback)
+                self.model.cbSimplexInterrupt.unsubscribe(callback)
+        status = self.model.getModelStatus()
+        return {
+            highspy.HighsModelStatus.kOptimal: OPTIMAL,
+            highspy.HighsModelStatus.kInfeasible: INFEASIBLE,
+            highspy.HighsModelStatus.kTimeLimit: TIME_LIMIT,
+            highspy.HighsModelStatus.kInterrupt: INTERRUPTED,
+            highspy.HighsModelStatus.kHighsInterrupt: INTERRUPTED,
+        }.get(status, FAILED)
+
+    def objective_value(self):
+        return self.model.getInfo().objective_function_value
+
+    def objective_bound(self):
+        if self.integral:
+            return self.model.getInfo().mip_dual_bound
+        return self.objective_value()
+
+    def has_solution(self):
+        # primal solution status 2 is a feasible solution
+        return self.model.getInfo().primal_solution_status == 2
+
+    def incumbent_time(self):
+        # wall-clock time of the first ILP solution of the last solve, a MIP
+        # start included, or None
+        return self.first_solution
+
+    def values(self):
+        return np.asarray(self.model.getSolution().col_value)
+
+    def reduced_costs(self):
+        # c - A'y for both senses, as Gurobi's RC
+        return np.asarray(self.model.getSolution().col_dual)
+
+    def size(self):
+        # numbers of variables, constraints and nonzeros
+        return self.num_vars, self.model.getNumRow(), self.model.getNumNz()
+
+
+# solver backends by name
+SOLVERS = {"gurobi": GurobiSolver, "highs": HighsSolver}
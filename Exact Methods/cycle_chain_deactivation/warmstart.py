@@ -0,0 +1,68 @@
+import os
+import io
+import sys
+import contextlib
+import numpy as np
+
+# the heuristics are shared with the heuristic methods; their folder is appended,
+# so modules of this folder with the same name (allocation, run) still win
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "..",
+        "Heuristic Methods",
+    )
+)
+import portfolio
+
+
+def column_key(nodes):
+    # a closed vertex list (first vertex repeated at the end) is a cycle, listed
+    # from its smallest vertex as in the store; any other list is a chain
+    if len(nodes) > 1 and nodes[0] == nodes[-1]:
+        cycle = list(nodes[:-1])
+        first = cycle.index(min(cycle))
+        return ("cycle", tuple(cycle[first:] + cycle[:first]))
+    return ("chain", tuple(nodes))
+
+
+def heuristic_solution(allo):
+    """
+    Runs the heuristic portfolio of `Heuristic Methods/portfolio.py` (desperate
+    donor, largest weight, improvement heuristic and large neighbourhood
+    search) on the cycles and chains of `allo`, and returns the vertex lists of
+    the selected ones: cycles closed by their first vertex, chains from their
+    NDD.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        cycles = portfolio.process_allocation(allo, allo.scoresDict)
+        selected = portfolio.heuristic_portfolio(allo, cycles, allo.scoresDict)
+    return [list(cycle["cycle"]) for cycle in selected]
+
+
+def start_vector(columns, solution):
+    """
+    Maps a solution (vertex lists, as returned by `heuristic_solution`) to a
+    0/1 MIP start over `columns`, vertex lists in the same format. Cycles and
+    chains of the solution that are not columns, such as those the large
+    neighbourhood search built beyond the maximum lengths, are left out; the
+    rest is still a packing, so the start stays feasible.
+    """
+    index = {column_key(nodes): j for j, nodes in enumerate(columns)}
+    start = np.zeros(len(columns))
+    for nodes in solution:
+        j = index.get(column_key(nodes))
+        if j is not None:
+            start[j] = 1
+    return start
+
+
+def heuristic_start(allo):
+    # MIP start over the cycles and chains of allo.cyclechains
+    store = allo.cyclechains
+    columns = []
+    for i in range(len(store)):
+        nodes = store.idX(i)
+        columns.append(nodes if store.isChain[i] else nodes + [nodes[0]])
+    return start_vector(columns, heuristic_solution(allo))
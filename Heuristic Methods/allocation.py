@@ -1,3 +1,24 @@
+import os
+import sys
+
+# the instance format is shared with the exact methods
+sys.path.append(
+    os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        "..",
+        "Exact Methods",
+        "cycle_chain_deactivation",
+    )
+)
+from instance import Instance
+from itertools import chain
+import numpy as np
+from cyclechains import CycleChainStore
+import enumeration
+import enumeration_cache
+import reduction
+
+
 class NDD:
     def __init__(self, id, blood, nbEdges, targets, scores):
         self.id = id
@@ -46,40 +67,31 @@ class Info:
         self.nbCons = 0  # number of constraints
         self.nbVar = 0  # number of variables
         self.nbNZ = 0  # number of non-zeros
-
-
-class CycleChain:
-    def __init__(self, id, size, idX, nbBA, score, isChain=0):
-        self.id = id
-        self.size = size
-        self.idX = idX
-        self.nbBA = nbBA
-        self.score = score
-        self.isChain = isChain
-
-    def print(self):
-        label = "Chain" if self.isChain == 1 else "Cycle"
-        print(f"{label} {self.id:5}\t size {self.size} ", end="")
-        for i in range(self.size - 1):
-            print(f"{self.idX[i]:5} ", end="")
-        print(f"{self.idX[-1]:5}\t nbBackArcs {self.nbBA}\t score {self.score}")
+        self.removedVertices = 0  # vertices left without arcs by graph reduction
+        self.removedArcs = 0  # arcs dropped by graph reduction
 
 
 class Allocation:
-    def __init__(self, max_cycle_length, max_chain_length):
+    def __init__(
+        self, max_cycle_length, max_chain_length, workers=1, reduce_graph=True
+    ):
         self.max_cycle_length = max_cycle_length
         self.max_chain_length = max_chain_length
+        self.workers = workers  # processes used to enumerate cycles and chains
+        self.reduce_graph = reduce_graph  # search only arcs on a cycle or chain
         self.NDDs = []
         self.pairs = []
-        self.cyclechains = []
+        self.cyclechains = CycleChainStore()
         self.maxId = 0
         self.nbPairs = 0
         self.nbNDDs = 0
         self.idToIdxA = {}
         self.idToIdxP = {}
-        self.compatibilityMatrix = []
-        self.scoresMatrix = []
+        self.instance = None
         self.adjacencyDict = {}
+        self.adjacencyList = []
+        self.predecessorsList = []
+        self.keptArcs = None  # arc mask of the graph reduction, None if not reduced
         self.scoresDict = {}
         self.info = Info()
         self.isActivated = []
@@ -91,18 +103,156 @@ class Allocation:
         
 
     def load(self, data):
-        self.maxId = 0
-        self.nbPairs = data["num_pairs"]
-        self.nbNDDs = data["num_ndd"]
+        # attach to the instance and collect its cycles, then its chains, through
+        # the enumeration cache when the instance has a cache entry
+        self.attach(data)
+        path = self.instance.path
+        for is_chain, max_length in (
+            (False, self.max_cycle_length),
+            (True, self.max_chain_length),
+        ):
+            self.cyclechains.extend(
+                enumeration_cache.cached_store(
+                    path, is_chain, max_length, lambda: self.collect(is_chain)
+                )
+            )
 
-        # process NDDs and pairs
-        for entry in data["pairs"]:
-            id = entry["id"]
-            is_ndd = entry["is_ndd"]
-            blood_donor = entry["donor_blood_type"]
-            blood_patient = entry["patient_blood_type"]
-            vpra = entry["patient_vpra"]
+    def collect(self, is_chain):
+        # enumerate only the cycles, or only the chains, into one store
+        store = CycleChainStore()
+        for batch in self.batches(cycles=not is_chain, chains=is_chain):
+            store.extend(batch)
+        return store
+
+    def batches(self, batch_size=enumeration.BATCH_SIZE, cycles=True, chains=True):
+        """
+        Yields the cycles, then the chains, of the attached instance as
+        `CycleChainStore` batches of `batch_size` entries (the last one may be
+        smaller), without keeping them: on one core memory stays bounded by one
+        batch, and with `workers` > 1 by the slices of at most 2 * workers
+        pending tasks besides (see `enumeration.parallel_batches`). A consumer
+        can add the batches to a model, write them out or filter them on their
+        columns. The concatenated batches equal what `load` collects; the `id`
+        of an entry is its position in its batch. `cycles` or `chains` set to
+        False leaves those out.
+
+        Cycles of at most 3 vertices are computed all at once by
+        `enumeration.short_cycles` and cut into batches with the chains.
+        """
+        starts = list(self.idToIdxP) if cycles else []
+        ndds = [ndd.id for ndd in self.NDDs] if chains else []
+        if cycles and self.max_cycle_length <= 3:
+            return enumeration.rebatch(
+                chain(
+                    [
+                        enumeration.short_cycles(
+                            self.instance,
+                            starts,
+                            self.max_cycle_length,
+                            keep=self.keptArcs,
+                        )
+                    ],
+                    self.batches(batch_size, cycles=False, chains=chains),
+                ),
+                batch_size,
+            )
+        if self.workers > 1:
+            return enumeration.parallel_batches(
+                self.instance,
+                starts,
+                ndds,
+                self.max_cycle_length,
+                self.max_chain_length,
+                self.workers,
+                batch_size,
+                self.keptArcs,
+            )
+        return enumeration.cycle_chain_batches(
+            self.adjacencyList,
+            self.predecessorsList,
+            self.scoresDict,
+            starts,
+            ndds,
+            self.max_cycle_length,
+            self.max_chain_length,
+            batch_size,
+        )
+
+    def count(self):
+        """
+        Returns (cycle_counts, chain_counts) of the attached instance, where
+        cycle_counts[L] and chain_counts[L] are the numbers of cycles and chains
+        of L vertices that `load` would collect. Nothing is enumerated or
+        stored, so this predicts the model size before building it.
+        """
+        return (
+            enumeration.count_cycles(
+                self.adjacencyList,
+                self.predecessorsList,
+                self.scoresDict,
+                list(self.idToIdxP),
+                self.max_cycle_length,
+            ),
+            enumeration.count_chains(
+                self.adjacencyList,
+                self.scoresDict,
+                [ndd.id for ndd in self.NDDs],
+                self.max_chain_length,
+            ),
+        )
+
+    def components(self):
+        """
+        Splits the collected cycles and chains into groups that share no vertex,
+        so each group can be optimized on its own. Returns one array of indices
+        into `cyclechains` per group, in store order, groups ordered by their
+        smallest vertex.
+
+        A cycle lies inside one strongly connected component, and after the
+        graph reduction only arcs of cycles and chains within the length limits
+        are left. Groups are the weakly connected components of these kept
+        arcs: the strongly connected components split further where no short
+        cycle joins their parts, merged along the chain arcs of the parts that
+        NDDs reach, while parts no NDD reaches stay apart. Groups holding only
+        chains of a lone NDD are left out, as such a chain counts for nothing.
+        """
+        keep = self.keptArcs
+        if keep is None:
+            keep = reduction.reduce_arcs(
+                self.instance, self.max_cycle_length, self.max_chain_length
+            )
+        label = reduction.component_labels(self.instance, keep)
+
+        # every vertex stored for an entry lies in its group
+        nodes, offsets, size, _, _, _, _ = self.cyclechains.columns()
+        entry_label = label[nodes[offsets[:-1]]]
+        order = np.argsort(entry_label, kind="stable")
+        bounds = np.flatnonzero(np.diff(entry_label[order])) + 1
+        return [
+            group
+            for group in np.split(order, bounds)
+            if len(group) > 0 and size[group].max() > 1
+        ]
 
+    def attach(self, data):
+        """Binds the allocation to an instance without enumerating cycles and chains."""
+        # accept both the parsed instance and its dictionary form (Instance.to_dict)
+        if isinstance(data, dict):
+            data = Instance.from_dict(data)
+
+        self.instance = data
+        self.maxId = data.max_id
+        self.nbPairs = data.num_pairs
+        self.nbNDDs = data.num_ndd
+
+        # process NDDs and pairs
+        for id, is_ndd, blood_donor, blood_patient, vpra in zip(
+            data.ids.tolist(),
+            data.is_ndd.tolist(),
+            data.donor_blood_type.tolist(),
+            data.patient_blood_type.tolist(),
+            data.patient_vpra.tolist(),
+        ):
             if is_ndd:
                 ndd = NDD(id, blood=blood_donor, nbEdges=0, targets=[], scores=[])
                 self.NDDs.append(ndd)
@@ -127,27 +277,25 @@ class Allocation:
                         len(self.pairs) - 1
                     ]  # store index of new pair in self.pairs
 
-            self.maxId = max(self.maxId, id)
-
-        # initialize compatibility and score matrices
-        self.compatibilityMatrix = [
-            [-1 for _ in range(self.maxId + 1)] for _ in range(self.maxId + 1)
-        ]
-        self.scoresMatrix = [
-            [0 for _ in range(self.maxId + 1)] for _ in range(self.maxId + 1)
-        ]
-
-        # fill compatibility and score matrices based on arcs
-        for arc in data["arcs"]:
-            donor_id = arc["donor_id"]
-            patient_id = arc["patient_id"]
-            weight = arc["weight"]
-
-            self.compatibilityMatrix[donor_id][patient_id] = 1
-            self.scoresMatrix[donor_id][patient_id] = weight
+        # graph reduction: drop the arcs that no cycle or chain within the length
+        # limits can use, so the searches never look at them
+        if self.reduce_graph:
+            self.keptArcs = reduction.reduce_arcs(
+                data, self.max_cycle_length, self.max_chain_length
+            )
+            self.info.removedArcs = int(data.num_arcs - self.keptArcs.sum())
+            self.info.removedVertices = reduction.removed_vertices(data, self.keptArcs)
 
-            self.adjacencyDict.setdefault(donor_id, []).append(patient_id)
-            self.scoresDict[(donor_id, patient_id)] = weight
+        # adjacency lists of the kept arcs and scores of all arcs from the CSR
+        # arrays of the instance
+        self.adjacencyList, self.predecessorsList, self.scoresDict = (
+            enumeration.adjacency_lists(data, self.keptArcs)
+        )
+        self.adjacencyDict = {
+            donor_id: targets
+            for donor_id, targets in enumerate(self.adjacencyList)
+            if targets
+        }
 
         # link targets and scores to pairs and NDDs
         for pair in self.pairs:
@@ -160,102 +308,47 @@ class Allocation:
             ndd.targets = self.adjacencyDict.get(ndd.id, [])
             ndd.scores = [self.scoresDict[(ndd.id, t)] for t in ndd.targets]
 
-        self.find_cycles()
-        self.find_chains()
-
     def find_cycles(self):
-        max_length = self.max_cycle_length
-        self.found_cycles = set()
-        for start_node in self.idToIdxP.keys():
-            stack = [(start_node, [start_node], set([start_node]))]
-            while stack:
-                current_node, path, visited = stack.pop()
-                if len(path) > max_length:
-                    continue
-                for neighbor in self.adjacencyDict.get(current_node, []):
-                    if neighbor == path[0] and len(path) >= 2:
-                        if all(node >= path[0] for node in path):
-                            cycle_key = tuple(path)
-                            if cycle_key not in self.found_cycles:
-                                self.found_cycles.add(cycle_key)
-                                self.add_cycle_chain(path, is_chain=False)
-                    elif neighbor not in visited:
-                        visited.add(neighbor)
-                        stack.append((neighbor, path + [neighbor], visited.copy()))
-                        visited.remove(neighbor)
+        # only pairs start cycles, and each cycle is reported from its smallest vertex
+        if self.max_cycle_length <= 3:
+            self.cyclechains.extend(
+                enumeration.short_cycles(
+                    self.instance,
+                    list(self.idToIdxP),
+                    self.max_cycle_length,
+                    keep=self.keptArcs,
+                )
+            )
+            return
+        for nodes, nbBA, score in enumeration.find_cycles(
+            self.adjacencyList,
+            self.predecessorsList,
+            self.scoresDict,
+            list(self.idToIdxP),
+            self.max_cycle_length,
+        ):
+            self.cyclechains.add(nodes, nbBA, score, is_chain=False)
 
     def find_chains(self):
-        max_length = self.max_chain_length
-        self.found_chains = set()
-        for ndd in self.NDDs:
-            if max_length >= 1:
-                self.add_cycle_chain([ndd.id], is_chain=True)
-
-            for neighbor in self.adjacencyDict.get(ndd.id, []):
-                stack = [(neighbor, [ndd.id, neighbor], set([neighbor]))]
-                while stack:
-                    current_node, path, visited = stack.pop()
-                    chain_length = len(path)
-                    if chain_length > max_length:
-                        continue
-                    self.add_cycle_chain(path, is_chain=True)
-                    if chain_length < max_length:
-                        for next_neighbor in self.adjacencyDict.get(current_node, []):
-                            if next_neighbor not in visited:
-                                visited.add(next_neighbor)
-                                stack.append(
-                                    (
-                                        next_neighbor,
-                                        path + [next_neighbor],
-                                        visited.copy(),
-                                    )
-                                )
-                                visited.remove(next_neighbor)
+        # only NDDs start chains
+        for nodes, nbBA, score in enumeration.find_chains(
+            self.adjacencyList,
+            self.scoresDict,
+            [ndd.id for ndd in self.NDDs],
+            self.max_chain_length,
+        ):
+            self.cyclechains.add_chain(nodes, nbBA, score)
 
     def add_cycle_chain(self, nodes, is_chain):
-        total_score = 0
-        nbBA = 0
-        num_nodes = len(nodes)
-        if is_chain:
-            num_arcs = num_nodes - 1
-        else:
-            num_arcs = num_nodes
-
-        for i in range(num_arcs):
-            from_node = nodes[i]
-            to_node = nodes[(i + 1) % num_nodes]
-            total_score += self.scoresDict.get((from_node, to_node), 0)
-
-            if is_chain:
-                for previous_node in nodes[:i]:
-                    if self.compatibilityMatrix[from_node][previous_node] == 1:
-                        nbBA += 1
-            else:
-                for previous_node in nodes[:i]:
-                    if (
-                        previous_node != nodes[i - 1]
-                        and self.compatibilityMatrix[from_node][previous_node] == 1
-                    ):
-                        nbBA += 1
-        cycle_chain = CycleChain(
-            id=len(self.cyclechains),
-            size=num_nodes,
-            idX=nodes.copy(),
-            nbBA=nbBA,
-            score=total_score,
-            isChain=1 if is_chain else 0,
+        nbBA, total_score = enumeration.back_arcs_and_score(
+            nodes, is_chain, self.scoresDict
         )
-        self.cyclechains.append(cycle_chain)
+        self.cyclechains.add(nodes, nbBA, total_score, is_chain)
 
 
     def printCyclesChains(self):
-        num_cycles = 0
-        num_chains = 0
-        for cyclechain in self.cyclechains:
-            if cyclechain.isChain == 1:
-                num_chains += 1
-            else:
-                num_cycles += 1
+        num_chains = sum(self.cyclechains.isChain)
+        num_cycles = len(self.cyclechains) - num_chains
         print(f"Number of Cycles: {num_cycles}")
         print(f"Number of Chains: {num_chains}\n")
 
@@ -299,6 +392,8 @@ class Allocation:
         info["Number of Variables"] = self.info.nbVar
         info["Number of Constraints"] = self.info.nbCons
         info["Number of Non-Zeros"] = self.info.nbNZ
+        info["Removed Vertices"] = self.info.removedVertices
+        info["Removed Arcs"] = self.info.removedArcs
 
         with open(output_file_path, "w") as f:
             f.write("Solution:\n")
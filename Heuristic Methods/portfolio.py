@@ -0,0 +1,323 @@
+# Heuristics on the cycles and chains of an allocation, shared by run.py and
+# the MIP start of the exact methods (Exact Methods/cycle_chain_deactivation/warmstart.py)
+import numpy as np
+
+
+def process_allocation(allocation, mat):
+    
+    '''
+    I think I will want this to return a list of dicts, like I had in my version
+    We'll see what makes most sense
+    
+    {cycle: [6,24,34,6], weight: allocation.score}  for example
+    
+    Make sure to figure out a way to distinguish cycles from paths, so we dont get an ndd at the end of the path
+    
+    Hopefully this doesn't come down to figuring out which nodes are ndds in each data
+    '''
+    cyclelist = []
+    #For each pair in the chain, donors stores how many other pairs could donate to that pair, recips indicates how many pairs could recieve from that pair
+    #Only arcs with a nonzero weight are counted, as get_weight treats weight 0 as no arc
+    instance = allocation.instance
+    nonzero = instance.weights != 0
+    rows = np.bincount(instance.donor_ids[nonzero], minlength = allocation.maxId + 1)
+    cols = np.bincount(instance.patient_ids[nonzero], minlength = allocation.maxId + 1)
+    #Read the cycles and chains straight from the columns of the store
+    store = allocation.cyclechains
+    for i in range(len(store)):
+        if store.size[i] > 1:
+            idX = store.idX(i)
+            entry = {'id': i, 'type': store.isChain[i], 'cycle': idX, 'weight_sum': store.score[i], 'donors': [], 'recips': []}
+            if not store.isChain[i]:
+                entry['type'] = True
+                entry['cycle'] = entry['cycle'] + ([idX[0]])
+            else:
+                entry['type'] = False
+            
+            
+            for pair in idX:
+                #print(pair)
+                entry['donors'].append(rows[pair])
+                entry['recips'].append(cols[pair])
+            if entry['type'] == False:
+                entry['recips'] = entry['recips'][1:]
+            cyclelist.append(entry)
+    return cyclelist
+        
+
+
+
+#cycles = process_allocation(allocation)
+
+
+
+def largest_weight_heuristic(cycles):
+    """
+    Implements the largest weight heuristic for selecting cycles in the kidney exchange problem.
+
+    Args:
+        cycles: A list of cycles, where each cycle is represented as a dictionary with keys 'id', 'cyc', and 'weight'.
+
+    Returns:
+        A list of selected cycles.
+    """
+
+    selected_cycles = []
+    while cycles:
+        # Find the cycle with the largest weight
+        max_weight_cycle = max(cycles, key=lambda c3: c3['weight_sum']/len(c3['cycle']))
+
+        # Remove cycles that are not disjoint from the selected cycles
+        disjoint_cycles = [c2 for c2 in cycles if not set(max_weight_cycle['cycle']).intersection(set(c2['cycle']))]
+
+        # Add the selected cycle to the list of selected cycles
+        selected_cycles.append(max_weight_cycle)
+        cycles = disjoint_cycles   
+    return selected_cycles
+
+
+
+def is_valid_cycle(cycle, mat):
+    """
+    Checks if a given cycle is valid in a kidney exchange problem.
+
+    Args:
+        cycle: A list of pairs (donor_id, recipient_id) representing the cycle.
+        compatibility_graph: A graph representing compatibility between donors and recipients.
+        used_donors: A set of used donors.
+        used_recipients: A set of used recipients.
+
+    Returns:
+        True if the cycle is valid, False otherwise.
+    """
+    for i in range(len(cycle)-1):
+        #print(type(cycle[i]))
+        if get_weight(mat, cycle[i], cycle[i+1]) > 0:
+            continue
+        else:
+            return False
+
+    return True
+
+
+
+
+def heuristic_with_lns(selected_cycles, unassigned_vertecies, mat):
+    """
+    Implements the largest weight heuristic for selecting cycles in the kidney exchange problem.
+
+    Args:
+        cycles: A list of cycles, where each cycle is represented as a dictionary with keys 'id', 'cyc', and 'weight'.
+
+    Returns:
+        A list of selected cycles.
+    """
+
+    
+    # Remove used vertices from unassigned_vertices
+    for cycle in selected_cycles:
+        for vertex in cycle['cycle']:
+            if vertex in unassigned_vertecies:
+                unassigned_vertecies.remove(vertex)
+
+    # Step 4: Try to convert 2-way cycles to 3-way cycles
+
+    for cycle in selected_cycles:
+        if len(cycle['cycle']) == 3:
+            if cycle['cycle'][0] == cycle['cycle'][2]:
+                for unassigned_vertex_d in unassigned_vertecies:
+                    unassigned_vertex = unassigned_vertex_d
+    
+                    new_cyc1 = [cycle['cycle'][0], cycle['cycle'][1], unassigned_vertex, cycle['cycle'][2]]
+                    new_cyc2 = [cycle['cycle'][1], unassigned_vertex, cycle['cycle'][1], cycle['cycle'][2]]
+                    #print(new_cyc1)
+                    if is_valid_cycle(new_cyc1, mat):
+                        # Find the edge weights based on donor_id and patient_id
+                        weight1 = get_weight(mat, cycle['cycle'][0], cycle['cycle'][1])
+                        weight2 = get_weight(mat, unassigned_vertex, cycle['cycle'][2])
+                        weight3 = get_weight(mat, cycle['cycle'][1], unassigned_vertex)
+                        new_cycle = {'id': cycle['id'], 'cycle': new_cyc1, 'weight_sum': weight3 + weight1 + weight2}                    
+                        selected_cycles.remove(cycle)
+                        selected_cycles.append(new_cycle)
+                        unassigned_vertecies.remove(unassigned_vertex_d)
+                        #print('cycle added1')
+                        break
+                    if is_valid_cycle(new_cyc2, mat):
+                        # Find the edge weights based on donor_id and patient_id
+                        weight1 = get_weight(mat, cycle['cycle'][0], unassigned_vertex)
+                        weight2 = get_weight(mat, unassigned_vertex, cycle['cycle'][1])
+                        weight3 = get_weight(mat, cycle['cycle'][1], cycle['cycle'][2])
+                        new_cycle = {'id': 222222, 'cycle': new_cyc1, 'weight_sum': weight3 + weight1 + weight2}                    
+                        selected_cycles.remove(cycle)
+                        selected_cycles.append(new_cycle)
+                        unassigned_vertecies.remove(unassigned_vertex_d)
+                        #print('cycle added 2')
+                        break
+
+    # Step 5: Try to convert 3-way cycles to two disjoint 2-way cycles
+    for cycle in selected_cycles:
+        if len(cycle['cycle']) == 4:
+            if cycle['cycle'][0] == cycle['cycle'][3]:
+                for unassigned_vertex_d in unassigned_vertecies:
+                    unassigned_vertex = unassigned_vertex_d
+                    c_1 = [cycle['cycle'][0], unassigned_vertex, cycle['cycle'][0]]
+                    c_2 = [cycle['cycle'][2], cycle['cycle'][1], cycle['cycle'][2]]
+                    
+                    if is_valid_cycle(c_1, mat) and is_valid_cycle(c_2, mat):
+                        selected_cycles.remove(cycle)
+                        w_1 = get_weight(mat, c_1[0], c_1[1]) + get_weight(mat, c_1[1], c_1[2])
+                        w_2 = get_weight(mat, c_2[0], c_2[1]) + get_weight(mat, c_2[1], c_2[2])
+                        cycle1 = {'id':  33331, 'cycle': c_1, 'weight_sum': w_1}
+                        cycle2 = {'id': 33332, 'cycle': c_2, 'weight_sum': w_2}
+                        selected_cycles.append(cycle1)
+                        selected_cycles.append(cycle2)
+                        unassigned_vertecies.remove(unassigned_vertex_d)
+                        #print(unassigned_vertex)
+                        #print('cycle added3')
+                        break
+                    c_1 = [cycle['cycle'][1], unassigned_vertex, cycle['cycle'][1]]
+                    c_2 = [cycle['cycle'][2], cycle['cycle'][0], cycle['cycle'][2]]
+                    if is_valid_cycle(c_1, mat) and is_valid_cycle(c_2, mat):
+                        selected_cycles.remove(cycle)
+                        w_1 = get_weight(mat, c_1[0], c_1[1]) + get_weight(mat, c_1[1], c_1[2])
+                        w_2 = get_weight(mat, c_2[0], c_2[1]) + get_weight(mat, c_2[1], c_2[2])
+                        cycle1 = {'id':  33331, 'cycle': c_1, 'weight_sum': w_1}
+                        cycle2 = {'id': 33332, 'cycle': c_2, 'weight_sum': w_2}
+                        selected_cycles.append(cycle1)
+                        selected_cycles.append(cycle2)
+                        unassigned_vertecies.remove(unassigned_vertex_d)
+                        #print(unassigned_vertex)
+                        #print('cycle added4')
+                        break
+                    c_1 = [cycle['cycle'][2], unassigned_vertex, cycle['cycle'][2]]
+                    c_2 = [cycle['cycle'][1], cycle['cycle'][0], cycle['cycle'][1]]
+                    if is_valid_cycle(c_1, mat) and is_valid_cycle(c_2, mat):
+                        selected_cycles.remove(cycle)
+                        w_1 = get_weight(mat, c_1[0], c_1[1]) + get_weight(mat, c_1[1], c_1[2])
+                        w_2 = get_weight(mat, c_2[0], c_2[1]) + get_weight(mat, c_2[1], c_2[2])
+                        cycle1 = {'id':  33331, 'cycle': c_1, 'weight_sum': w_1}
+                        cycle2 = {'id': 33332, 'cycle': c_2, 'weight_sum': w_2}
+                        selected_cycles.append(cycle1)
+                        selected_cycles.append(cycle2)
+                        unassigned_vertecies.remove(unassigned_vertex_d)
+                       # print(unassigned_vertex)
+                        #print('cycle added 5')
+                        break
+
+    return selected_cycles
+
+
+def remove_non_disjoint_cycles(all_cycles, after_removing):
+    # Collect all nodes in the `after_removing` cycles
+    used_nodes = set()
+    for cycle in after_removing:
+        used_nodes.update(cycle['donors'])
+        used_nodes.update(cycle['recips'])
+    
+    # Filter `all_cycles` to keep only those that are disjoint with `after_removing`
+    remaining_cycles = []
+    for cycle in all_cycles:
+        cycle_nodes = set(cycle['donors']) | set(cycle['recips'])
+        if not cycle_nodes.intersection(used_nodes):
+            remaining_cycles.append(cycle)
+    
+    return remaining_cycles
+
+def dd_heuristic(cycles):
+    selected_cycles = []
+    while cycles:
+        # Find the cycle where recipient with fewest option, plus donor with the most potential is minimized
+        desperate_donor_cycle = min(cycles, key=lambda x: (5*min(x['donors'])+min(x['recips']))/(len(x['cycle'])-1))
+
+        # Remove cycles that are not disjoint from the selected cycles
+        disjoint_cycles = [c for c in cycles if not set(desperate_donor_cycle['cycle']).intersection(set(c['cycle']))]
+
+        # Add the selected cycle to the list of selected cycles
+        selected_cycles.append(desperate_donor_cycle)
+        cycles = disjoint_cycles
+    return selected_cycles
+
+def improvement_heuristic(selected_cycles, all_cycles, factor):
+    '''
+    The main idea here is that pairs that can donate and recieve from many pairs show potential for better cycle placement
+    i.e. if the current solution has a cycle where many pairs have lots of other options, we will remove those cycles and try to build better cycles using the pairs we removed and all the pairs that werent chosen in the first solution
+    
+    
+    '''
+    
+    sorted_cycles = sorted(selected_cycles, key=lambda x: min(x['donors'])**0.5+min(x['recips'])**0.5, reverse=True)
+    print(sorted_cycles)
+    
+    to_remove = len(sorted_cycles)//factor
+    
+    after_removing = sorted_cycles[to_remove:]
+        
+
+    ## Take all_cycles and remove cycles that are not disjoint from any of the cycles in after_removing
+    #  Or do this in a more efficient way, I assume this is better than generating cycles from scratch
+    remaining_cycles = remove_non_disjoint_cycles(all_cycles, after_removing)
+    
+    ## Find the optimal combination of cycles to add to maximize weight
+    #new_cycles = largest_weight_heuristic(remaining_cycles)
+    new_cycles = dd_heuristic(remaining_cycles)
+    new_selected_cycles = new_cycles + after_removing
+    return new_selected_cycles
+
+
+#Faster way to find weight of an arc using the sparse (donor, patient) -> weight lookup
+def get_weight(mat, donor_id, patient_id):
+    return int(mat.get((donor_id, patient_id), 0))
+
+
+
+def get_stats(cycles, mat):
+    transplants_made = 0 
+    total_weight = 0
+    for c1 in cycles:
+        transplants_made += len(c1['cycle'])-1
+        for i in range(0, len(c1['cycle'])-1):
+            total_weight += get_weight(mat, c1['cycle'][i], c1['cycle'][i+1])
+    return transplants_made, total_weight
+
+def choose_best(solutions, mat):
+    scores = []
+    maxn = 0
+    maxw=0
+    for l in solutions:
+        n, w = get_stats(l, mat)
+        if n > maxn:
+            maxn = n
+        if w > maxw:
+            maxw = w
+        # Normalize n and w to the maximum values
+        normalized_n = n / maxn
+        normalized_w = w / maxw
+        scores.append(normalized_n + normalized_w)
+
+    winner_index = np.argmax(scores)
+    return solutions[winner_index]
+
+
+def heuristic_portfolio(allocation, cycles, weight_matrix):
+    """
+    Runs the portfolio of heuristics: the desperate donor and largest weight
+    heuristics, two rounds of the improvement heuristic, and the large
+    neighbourhood search on the best of their solutions.
+
+    Args:
+        allocation: The allocation the cycles were read from.
+        cycles: The cycles and chains of the allocation, as returned by process_allocation.
+        weight_matrix: The (donor, patient) -> weight lookup of the allocation.
+
+    Returns:
+        A list of selected cycles.
+    """
+    selected_cycles1 = dd_heuristic(cycles)
+    selected_cycles2 = largest_weight_heuristic(cycles)
+    selected_cycles = choose_best([selected_cycles1, selected_cycles2], weight_matrix)
+    selected_cycles3 = improvement_heuristic(selected_cycles1, cycles, 10)
+    selected_cycles4 = improvement_heuristic(selected_cycles1, cycles, 4)
+    selected_cycles = choose_best([selected_cycles3, selected_cycles4, selected_cycles], weight_matrix)
+
+    unassigned_vertecies = list(range(0, len(allocation.pairs) + len(allocation.NDDs)))
+    return heuristic_with_lns(selected_cycles, unassigned_vertecies, weight_matrix)